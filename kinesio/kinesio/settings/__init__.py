@@ -11,6 +11,14 @@ try:
 except ModuleNotFoundError:
     logging.warning('Secrets file not found!')
 
+# Keys replaced during a key rotation are optional.
+try:
+    from .settings_production import IMAGE_ENCRYPTION_OLD_KEYS
+except ImportError:
+    pass
+
 # Override some settings if running tests
 if sys.argv[1] == 'test':  # We are running tests
-    from .settings_testing import (TESTING, FFMPEG_GLOBAL_OPTIONS)
+    from .settings_testing import (TESTING, FFMPEG_GLOBAL_OPTIONS, IMAGE_STORAGE_ROOT, IMAGE_RENDITIONS_ROOT,
+                                   TIMELAPSE_ROOT, VIDEO_HLS_ROOT, VIDEO_HLS_RENDITIONS, VIDEO_PREVIEWS_ROOT,
+                                   VIDEO_UPLOADS_ROOT, IMAGE_PROCESSING_SYNCHRONOUS, IMAGE_INGEST_ENABLED)
@@ -141,6 +141,13 @@ STATIC_URL = '/static/'
 # Media files
 MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), "deployment", "media")
 MEDIA_URL = '/media/'
+# Media files are sent by the media gateway, once it checked the user can see them. Sending them from Django ('python')
+# pins a worker for the whole transfer, so only use it for development: in production, let the front proxy send them.
+# 'x-accel-redirect' (nginx) sends them from MEDIA_GATEWAY_INTERNAL_URL, an internal location aliased to MEDIA_ROOT.
+# 'x-sendfile' (Apache mod_xsendfile, lighttpd) sends them from their path on disk.
+MEDIA_GATEWAY_BACKEND = 'python'
+MEDIA_GATEWAY_INTERNAL_URL = '/protected-media/'
+
 FFMPEG_GLOBAL_OPTIONS = None  # Global options to generate video thumbnails. Should be empty by default
 
 FIELD_ENCRYPTION_KEY = '6-QgONW6TUl5rt4Xq8u-wBwPcb15sIYS2CN6d69zueM='
@@ -178,5 +185,108 @@ MAX_PASSWORD_TRIES = 10
 # Reset exercise status
 CRON_CLASSES = [
     "kinesioapp.cron.ResetExerciseStatus",
+    "kinesioapp.cron.ProcessPendingImages",
+    "kinesioapp.cron.ProcessPendingVideos",
+    "kinesioapp.cron.DeleteAbandonedVideoUploads",
 ]
 RESET_EXERCISES_AT_TIMES = ['05:00']
+
+
+# Image storage. Encrypted images are saved on disk, addressed by the sha256 of their content.
+IMAGE_STORAGE_ROOT = os.path.join(MEDIA_ROOT, 'images')
+
+# Size of each chunk when streaming binary responses, in bytes
+STREAMING_CHUNK_SIZE = 64 * 1024
+# Image contents never change, so clients may keep them this long, in seconds, and revalidate them with their ETag
+IMMUTABLE_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Uploads bigger than this are spooled to a temporary file instead of being kept in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+# Maximum size of an uploaded image file, in bytes
+IMAGE_UPLOAD_MAX_SIZE = 16 * 1024 * 1024
+
+# Ingest normalization. New images get their EXIF orientation applied and their metadata stripped, their longest side
+# capped to IMAGE_INGEST_MAX_SIZE pixels and are re-encoded with IMAGE_INGEST_FORMAT (JPEG, progressive, or WEBP)
+# when they are processed, in the background. Disable it to store the uploaded files as they are.
+IMAGE_INGEST_ENABLED = True
+IMAGE_INGEST_MAX_SIZE = 2560
+IMAGE_INGEST_FORMAT = 'JPEG'
+IMAGE_INGEST_QUALITY = 85
+# Retention of the uploaded files once normalized. False discards them: only the normalized image is stored.
+# True also stores them, encrypted, to keep the originals as part of the clinical record at the cost of their space.
+IMAGE_INGEST_KEEP_ORIGINALS = False
+
+# Thumbnails. The size is the maximum width and height, in pixels.
+THUMBNAIL_SIZE = 320
+THUMBNAIL_QUALITY = 75
+# Decrypted thumbnails are kept in memory, on each process, up to this amount of bytes
+THUMBNAIL_CACHE_SIZE = 64 * 1024 * 1024
+
+# Image renditions: resized copies generated on demand and evicted, least recently used first, above the disk budget
+IMAGE_RENDITIONS_ROOT = os.path.join(MEDIA_ROOT, 'renditions')
+IMAGE_RENDITIONS_DISK_BUDGET = 2 * 1024 * 1024 * 1024
+IMAGE_RENDITION_QUALITY = 80
+
+# Background image processing
+IMAGE_PROCESSING_WORKERS = 2
+IMAGE_PROCESSING_SYNCHRONOUS = False
+# List of (size, format) renditions to generate right after an image is uploaded, instead of on its first request
+IMAGE_RENDITIONS_GENERATED_ON_UPLOAD = []
+PROCESS_PENDING_IMAGES_EVERY_MINUTES = 10
+# Images are claimed by the process processing them, so the cron job does not process them again meanwhile.
+# Claims expire after IMAGE_PROCESSING_CLAIM_MINUTES, so images of crashed workers are retried.
+IMAGE_PROCESSING_CLAIM_MINUTES = 30
+# Maximum amount of images of a clinical session created together with them
+IMAGE_BATCH_MAX_IMAGES = 20
+# Images listed per page by default, and at most, by the image listing endpoints
+IMAGE_PAGE_SIZE = 20
+IMAGE_MAX_PAGE_SIZE = 100
+
+# Timelapses: videos of the images of a patient with the same tag, rendered in the background.
+# Frames are squares of TIMELAPSE_SIZE pixels, and each image is shown for TIMELAPSE_SECONDS_PER_IMAGE seconds.
+TIMELAPSE_ROOT = os.path.join(MEDIA_ROOT, 'timelapses')
+TIMELAPSE_SIZE = 1080
+TIMELAPSE_SECONDS_PER_IMAGE = 1
+# ffmpeg is killed after TIMELAPSE_RENDER_TIMEOUT seconds. Failed timelapses are rendered again when requested
+# TIMELAPSE_RETRY_MINUTES after failing.
+TIMELAPSE_RENDER_TIMEOUT = 300
+TIMELAPSE_RETRY_MINUTES = 10
+
+# Videos: their thumbnail and derived assets are generated in the background, after the upload request.
+# Each ffmpeg run is killed after VIDEO_PROCESSING_TIMEOUT seconds. Videos failing VIDEO_PROCESSING_MAX_ATTEMPTS times are marked as failed.
+VIDEO_PROCESSING_TIMEOUT = 300
+# Videos are processed on their own VIDEO_PROCESSING_WORKERS processes, apart from the IMAGE_PROCESSING_WORKERS ones.
+VIDEO_PROCESSING_WORKERS = 1
+VIDEO_PROCESSING_MAX_ATTEMPTS = 3
+# Videos are claimed by the process processing them, so the cron job does not process them again meanwhile.
+# Claims expire after VIDEO_PROCESSING_CLAIM_MINUTES, longer than an attempt can take, so videos of crashed workers are retried.
+VIDEO_PROCESSING_CLAIM_MINUTES = 60
+PROCESS_PENDING_VIDEOS_EVERY_MINUTES = 10
+# HLS: videos are transcoded to each (height, video kbps) rendition, split in segments of VIDEO_HLS_SEGMENT_SECONDS,
+# and listed on a master playlist, so players start right away and pick the bitrate their connection can keep up with.
+# Renditions are never taller than the uploaded video. They are served as media files, from VIDEO_HLS_URL.
+VIDEO_HLS_ROOT = os.path.join(MEDIA_ROOT, 'hls')
+VIDEO_HLS_URL = f'{MEDIA_URL}hls/'
+VIDEO_HLS_RENDITIONS = [(360, 800), (720, 2400), (1080, 4800)]
+VIDEO_HLS_AUDIO_KBPS = 128
+VIDEO_HLS_SEGMENT_SECONDS = 6
+# Previews for scrubbing: VIDEO_PREVIEW_FRAMES evenly spaced frames, VIDEO_PREVIEW_HEIGHT pixels tall, composed into a sprite
+# sheet of VIDEO_PREVIEW_COLUMNS columns, plus a WebVTT track pointing each interval of the video to its frame.
+# They need the duration of the video: videos ffprobe cannot read have no previews.
+VIDEO_PREVIEWS_ROOT = os.path.join(MEDIA_ROOT, 'previews')
+VIDEO_PREVIEWS_URL = f'{MEDIA_URL}previews/'
+VIDEO_PREVIEW_FRAMES = 20
+VIDEO_PREVIEW_COLUMNS = 5
+VIDEO_PREVIEW_HEIGHT = 90
+VIDEO_PREVIEW_QUALITY = 5  # ffmpeg JPEG quality scale: 2 is the best, 31 the worst
+# Resumable uploads: videos may be sent in chunks of up to VIDEO_UPLOAD_CHUNK_MAX_SIZE bytes, appended to a file in
+# VIDEO_UPLOADS_ROOT. Keep it on the same disk as MEDIA_ROOT, so finalized uploads are moved there instead of copied.
+# Uploads not updated for VIDEO_UPLOAD_EXPIRATION_HOURS are deleted, with what they received.
+VIDEO_UPLOADS_ROOT = os.path.join(MEDIA_ROOT, 'uploads')
+VIDEO_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+VIDEO_UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+VIDEO_UPLOAD_EXPIRATION_HOURS = 24
+DELETE_ABANDONED_VIDEO_UPLOADS_EVERY_MINUTES = 60
+
+# Previous image encryption keys. They are only used to decrypt images that were not re-encrypted yet.
+IMAGE_ENCRYPTION_OLD_KEYS = []
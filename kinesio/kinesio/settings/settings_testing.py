@@ -1,5 +1,25 @@
+import os
+import tempfile
+
 # Flag to detect testing mode
 TESTING = True
 
 # Supress ffmpeg logs when generating thumbnails in testing mode
 FFMPEG_GLOBAL_OPTIONS = '-loglevel quiet'
+
+# Keep images stored by tests out of the media folder
+IMAGE_STORAGE_ROOT = os.path.join(tempfile.gettempdir(), 'kinesio_test_images')
+IMAGE_RENDITIONS_ROOT = os.path.join(tempfile.gettempdir(), 'kinesio_test_renditions')
+TIMELAPSE_ROOT = os.path.join(tempfile.gettempdir(), 'kinesio_test_timelapses')
+VIDEO_HLS_ROOT = os.path.join(tempfile.gettempdir(), 'kinesio_test_hls')
+VIDEO_PREVIEWS_ROOT = os.path.join(tempfile.gettempdir(), 'kinesio_test_previews')
+VIDEO_UPLOADS_ROOT = os.path.join(tempfile.gettempdir(), 'kinesio_test_video_uploads')
+
+# Small renditions, since every video uploaded by tests is transcoded to each of them
+VIDEO_HLS_RENDITIONS = [(144, 150), (240, 300)]
+
+# Process images during the request, so tests can check the results right away
+IMAGE_PROCESSING_SYNCHRONOUS = True
+
+# Store images exactly as uploaded, so tests can compare them with their files. Ingest tests enable it explicitly.
+IMAGE_INGEST_ENABLED = False
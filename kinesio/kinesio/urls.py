@@ -20,9 +20,8 @@ from django.conf.urls import url
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-# For media serving with DEBUG=TRUE
 from django.conf import settings
-from django.conf.urls.static import static
+from kinesioapp.api import MediaAPIView
 
 
 schema_view = get_schema_view(
@@ -42,4 +41,6 @@ urlpatterns = [
     path('', include('kinesioapp.urls')),
     path('', include('users.urls')),
     url(r'^docs/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Media files are only sent to the users allowed to see them. See MEDIA_GATEWAY_BACKEND.
+    url(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', MediaAPIView.as_view(), name='media'),
+]
@@ -1,4 +1,6 @@
-from .clinical_sessions import ClinicalSessionAPIView, ClinicalSessionsForPatientView, ClinicalSessionUpdateAndDeleteAPIView
+from .clinical_sessions import ClinicalSessionAPIView, ClinicalSessionWithImagesAPIView, ClinicalSessionsForPatientView, ClinicalSessionUpdateAndDeleteAPIView
 from .exercises import ExercisesForPatientView, ExerciseCreateAPIView, ExerciseUpdateAndDeleteAPIView
-from .images import ImageDetailsAndDeleteAPIView, ImagesWithTagAPIView, ImagesOfClinicalSessionAPIView, ImageCreateAPIView
-from .videos import VideoUploadView, VideoDeleteAPIView
+from .images import ImageDetailsAndDeleteAPIView, ImageRawContentAPIView, ImageThumbnailAPIView, ImageStatusAPIView, ImagesWithTagAPIView, ImagesOfClinicalSessionAPIView, ImageHashCheckAPIView, ImageCreateAPIView
+from .timelapses import TimelapseAPIView, TimelapseVideoAPIView
+from .videos import VideoUploadView, VideoDetailsAndDeleteAPIView, VideoUploadCreateAPIView, VideoUploadAPIView, VideoUploadFinalizeAPIView
+from .media import MediaAPIView
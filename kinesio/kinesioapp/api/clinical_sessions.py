@@ -3,10 +3,24 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.response import Response
 from rest_framework.request import HttpRequest
+from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser, JSONParser
+from django.db import transaction
+from django.db.models import Prefetch
+from django.conf import settings
+from django.http import QueryDict
+from django.core.files.uploadedfile import UploadedFile
+from typing import List, Optional, Tuple, Union
+import binascii
+import base64
 
-from ..models import ClinicalSession
+from ..models import ClinicalSession, Image
 from ..serializers import ClinicalSessionSerializer
 from ..utils.api_mixins import GenericPatchViewWithoutPut, GenericListView, GenericDeleteView
+from ..utils.image_upload import ImageTooLargeException
+from ..utils.image_processing import InvalidImageException
+from ..models.image import delete_unreferenced_blobs_on_commit
+from .. import choices
 
 
 class ClinicalSessionAPIView(generics.CreateAPIView):
@@ -16,9 +30,98 @@ class ClinicalSessionAPIView(generics.CreateAPIView):
         serializer.save(created_by=self.request.user.medic)
 
 
+class ClinicalSessionWithImagesAPIView(APIView):
+    parser_classes = (JSONParser, MultiPartParser)
+
+    @swagger_auto_schema(
+        operation_id='clinical_session_with_images_create',
+        operation_description='Creates a clinical session together with its images, all or nothing. '
+                              'The images are processed in parallel, and the session is returned with their thumbnails.',
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'patient_id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                'description': openapi.Schema(type=openapi.TYPE_STRING),
+                'images': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    description='When the request is sent as multipart/form-data, send a "content" file and a "tag" for each image instead, in the same order.',
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'content': openapi.Schema(type=openapi.TYPE_STRING, description='Image content as base64 string.'),
+                            'tag': openapi.Schema(type=openapi.TYPE_STRING, enum=[choices.images.initials()]),
+                        },
+                    ),
+                ),
+            },
+            required=['patient_id', 'images']
+        ),
+        responses={
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description='Missing or invalid patient_id, description, images or tags, or too many images.',
+            ),
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: openapi.Response(
+                description='An uploaded image file is too large.',
+            ),
+            status.HTTP_201_CREATED: openapi.Response(
+                description='Clinical session created with its images.',
+                schema=ClinicalSessionSerializer(),
+            )
+        }
+    )
+    def post(self, request: HttpRequest) -> Response:
+        serializer = ClinicalSessionSerializer(data=request.data)
+        images = self.get_images(request)
+        if not serializer.is_valid() or images is None:
+            return Response({'message': 'Ha omitido uno o más campos obligatorios. Complételos e intente nuevamente.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(images) > settings.IMAGE_BATCH_MAX_IMAGES:
+            return Response({'message': f'No puede enviar más de {settings.IMAGE_BATCH_MAX_IMAGES} imágenes a la vez.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Blobs are stored before opening the transaction, so it only lasts for the inserts.
+        try:
+            stored_images = Image.objects.store_many([content for content, _ in images], serializer.validated_data['patient_id'])
+        except ImageTooLargeException:
+            return Response({'message': 'Una o más imágenes son demasiado grandes.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except InvalidImageException:
+            # Errors of the storage are not caught, so they fail as server errors instead of blaming the images.
+            return Response({'message': 'Una o más imágenes no son válidas.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                clinical_session = serializer.save(created_by=request.user.medic)
+                Image.objects.bulk_create([Image(clinical_session=clinical_session, tag=tag, **fields)
+                                           for (_, tag), fields in zip(images, stored_images)])
+        except BaseException:
+            delete_unreferenced_blobs_on_commit([blob_hash for fields in stored_images for blob_hash in Image.blob_hashes_of(fields)])
+            raise
+        return Response(ClinicalSessionSerializer(clinical_session).data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def get_images(request: HttpRequest) -> Optional[List[Tuple[Union[bytes, UploadedFile], str]]]:
+        """ Returns the content and tag of each image of the request, or None if they are missing or invalid.
+            Uploaded files are returned as they are, so they are read in chunks when stored. """
+        if 'images' in request.data:
+            try:
+                # Remove '\n's to fix a bug in the mobile front end, as when creating a single image.
+                images = [(base64.b64decode(image['content'].replace('\\n', '').replace('\n', '')), image['tag']) for image in request.data['images']]
+            except (KeyError, TypeError, AttributeError, binascii.Error):
+                return None
+        elif isinstance(request.data, QueryDict):
+            contents, tags = request.data.getlist('content'), request.data.getlist('tag')
+            if not contents or len(contents) != len(tags) or not all(isinstance(content, UploadedFile) for content in contents):
+                return None
+            images = list(zip(contents, tags))
+        else:
+            return None
+        # Tags are checked before creating anything, as bulk_create does not validate them.
+        if not all(choices.images.is_valid(tag) for _, tag in images):
+            return None
+        return images
+
+
 class ClinicalSessionsForPatientView(GenericListView):
     serializer_class = ClinicalSessionSerializer
-    queryset = ClinicalSession.objects.all()
+    # Sessions are listed with the thumbnails of their images, fetched on a single query.
+    queryset = ClinicalSession.objects.prefetch_related(Prefetch('images', queryset=Image.objects.with_thumbnail()))
 
     @swagger_auto_schema(
         operation_id='clinical_sessions_for_patient',
@@ -3,19 +3,38 @@ from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser, JSONParser
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models
 from rest_framework.request import HttpRequest
+from typing import Optional
 
 from ..serializers import ThumbnailSerializer
-from ..models import Image, ClinicalSession
+from ..models import Image, ImageRendition, ClinicalSession
 from users.models import User
 from ..serializers import ImageSerializer
 from .. import choices
 from ..utils.api_mixins import GenericDeleteView, GenericDetailsView
+from ..utils.streaming import iterate_in_chunks
+from ..utils.image_upload import ImageTooLargeException
+from ..utils.http_caching import etag, cache_as_immutable, conditional_response
+from ..utils.pagination import KeysetPaginator, InvalidPageException, cursor_parameter, page_size_parameter
+
+
+def paginated_images_response(request: HttpRequest, images: models.QuerySet) -> Response:
+    try:
+        paginator = KeysetPaginator.from_request(request, 'clinical_session__date')
+    except InvalidPageException:
+        return Response({'message': 'El cursor o el tamaño de página no son válidos.'}, status=status.HTTP_400_BAD_REQUEST)
+    page = paginator.paginate(images)
+    return Response({'data': ImageSerializer(page, many=True).data, 'next': paginator.next_cursor}, status=status.HTTP_200_OK)
 
 
 class ImageDetailsAndDeleteAPIView(GenericDeleteView, GenericDetailsView):
     model_class = Image
+    queryset = Image.objects.with_content()
     serializer_class = ImageSerializer
 
     @swagger_auto_schema(
@@ -36,6 +55,9 @@ class ImageDetailsAndDeleteAPIView(GenericDeleteView, GenericDetailsView):
             status.HTTP_404_NOT_FOUND: openapi.Response(
                 description="Invalid image id: Image not found"
             ),
+            status.HTTP_304_NOT_MODIFIED: openapi.Response(
+                description="Image not modified since the version with the ETag on If-None-Match."
+            ),
             status.HTTP_200_OK: openapi.Response(
                 description='Image found and accessible.',
                 schema=ImageSerializer()
@@ -46,6 +68,10 @@ class ImageDetailsAndDeleteAPIView(GenericDeleteView, GenericDetailsView):
         # This method exist only to add an '@swagger_auto_schema' annotation
         return super().get(request, id)
 
+    def etag_of(self, image: Image) -> Optional[str]:
+        # The status is part of the response, so it only stops changing once the image is ready.
+        return etag(image.content_hash) if image.is_ready and image.is_in_blob_store else None
+
     @swagger_auto_schema(
         operation_id='image_delete',
         operation_description='You will not be able to delete the image if the logged user does not have access.',
@@ -78,6 +104,169 @@ class ImageDetailsAndDeleteAPIView(GenericDeleteView, GenericDetailsView):
         return super().delete(request, id)
 
 
+class ImageRawContentAPIView(APIView):
+    @swagger_auto_schema(
+        operation_id='image_raw_content',
+        operation_description='Returns the image as a file instead of a base64 string inside a JSON. '
+                              'Use size or image_format to get a resized rendition instead of the original. '
+                              'You will not get the image if the current user does not have access.',
+        manual_parameters=[
+            openapi.Parameter(
+                name='id', in_=openapi.IN_PATH,
+                type=openapi.TYPE_INTEGER,
+                description="Image's ID.",
+                required=True
+            ),
+            openapi.Parameter(
+                name='size', in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER, enum=choices.renditions.SIZES,
+                description="Maximum width and height of the rendition, in pixels. Defaults to the biggest size if only the format is given.",
+            ),
+            openapi.Parameter(
+                name='image_format', in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING, enum=choices.renditions.FORMATS,
+                description="Format of the rendition. Defaults to JPEG.",
+            ),
+        ],
+        responses={
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description='Invalid size or format',
+            ),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access that image. Only the patient and its medic can access the image."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid image id: Image not found"
+            ),
+            status.HTTP_304_NOT_MODIFIED: openapi.Response(
+                description="Image not modified since the version with the ETag on If-None-Match."
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Image found and accessible. The body is the image file.',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, id: int) -> StreamingHttpResponse:
+        image = get_object_or_404(Image.objects.with_content(), id=id)
+        if not image.can_view(request.user):
+            return Response(status=status.HTTP_401_UNAUTHORIZED,
+                            data={'message': 'No tiene permisos para ver este objeto.'})
+        size = request.query_params.get('size')
+        # 'format' is reserved by rest framework to choose the renderer.
+        format_ = request.query_params.get('image_format')
+        is_original = size is None and format_ is None
+        if not is_original:
+            size = int(size) if size and size.isdigit() else size or max(choices.renditions.SIZES)
+            format_ = (format_ or choices.renditions.JPEG).upper()
+            if not choices.renditions.is_valid(size, format_):
+                return Response({'message': 'El tamaño o el formato solicitado no es válido.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Renditions are always generated the same way from the content, so its hash identifies them too.
+        image_etag = None
+        if image.is_in_blob_store:
+            image_etag = etag(image.content_hash) if is_original else etag(image.content_hash, size, format_)
+        not_modified = conditional_response(request, image_etag)
+        if not_modified is not None:
+            return not_modified
+        if is_original:
+            content_length, chunks = image.content_chunks()
+            content_type = image.content_type
+        else:
+            rendition = ImageRendition.objects.get_or_generate(image, size, format_)
+            content, content_type = rendition.content, rendition.content_type
+            content_length, chunks = len(content), iterate_in_chunks(content)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Length'] = content_length
+        return cache_as_immutable(response, image_etag)
+
+
+class ImageStatusAPIView(GenericDetailsView):
+    model_class = Image
+    queryset = Image.objects.with_thumbnail()
+    serializer_class = ThumbnailSerializer
+
+    @swagger_auto_schema(
+        operation_id='image_status',
+        operation_description='Poll this endpoint after creating an image until its status is R (ready) or F (failed). '
+                              'The thumbnail is null while the image is pending.',
+        manual_parameters=[
+            openapi.Parameter(
+                name='id', in_=openapi.IN_PATH,
+                type=openapi.TYPE_INTEGER,
+                description="Image's ID.",
+                required=True
+            ),
+        ],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access that image. Only the patient and its medic can access the image."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid image id: Image not found"
+            ),
+            status.HTTP_304_NOT_MODIFIED: openapi.Response(
+                description="Thumbnail not modified since the version with the ETag on If-None-Match."
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Image found and accessible.',
+                schema=ThumbnailSerializer()
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, id: int) -> Response:
+        # This method exist only to add an '@swagger_auto_schema' annotation
+        return super().get(request, id)
+
+    def etag_of(self, image: Image) -> Optional[str]:
+        return etag(image.thumbnail_hash) if image.is_ready and image.thumbnail_hash else None
+
+
+class ImageThumbnailAPIView(APIView):
+    @swagger_auto_schema(
+        operation_id='image_thumbnail',
+        operation_description='Returns the thumbnail as a JPEG file instead of a base64 string inside a JSON. '
+                              'You will not get the thumbnail if the current user does not have access.',
+        manual_parameters=[
+            openapi.Parameter(
+                name='id', in_=openapi.IN_PATH,
+                type=openapi.TYPE_INTEGER,
+                description="Image's ID.",
+                required=True
+            ),
+        ],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access that image. Only the patient and its medic can access the image."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid image id, or the image is still pending."
+            ),
+            status.HTTP_304_NOT_MODIFIED: openapi.Response(
+                description="Thumbnail not modified since the version with the ETag on If-None-Match."
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Thumbnail found and accessible. The body is the thumbnail file.',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, id: int) -> StreamingHttpResponse:
+        image = get_object_or_404(Image.objects.with_thumbnail(), id=id)
+        if not image.can_view(request.user):
+            return Response(status=status.HTTP_401_UNAUTHORIZED,
+                            data={'message': 'No tiene permisos para ver este objeto.'})
+        thumbnail_etag = etag(image.thumbnail_hash) if image.thumbnail_hash else None
+        not_modified = conditional_response(request, thumbnail_etag)
+        if not_modified is not None:
+            return not_modified
+        thumbnail = image.thumbnail
+        if thumbnail is None:
+            return Response({'message': 'La miniatura todavía no está disponible.'}, status=status.HTTP_404_NOT_FOUND)
+        response = StreamingHttpResponse(iterate_in_chunks(thumbnail), content_type=choices.renditions.content_type(choices.renditions.JPEG))
+        response['Content-Length'] = len(thumbnail)
+        return cache_as_immutable(response, thumbnail_etag)
+
+
 class ImagesWithTagAPIView(APIView):
     @swagger_auto_schema(
         operation_id='images_of_patient',
@@ -94,8 +283,13 @@ class ImagesWithTagAPIView(APIView):
                 type=openapi.TYPE_STRING,
                 description="Tag (Any of: F, R, L, B, O). You can also use 'A' as a tag to get all images regardless their tags.",
             ),
+            cursor_parameter,
+            page_size_parameter,
         ],
         responses={
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description="Invalid cursor or page size."
+            ),
             status.HTTP_401_UNAUTHORIZED: openapi.Response(
                 description="User not authorized to access those images. Only the patient and its medic can access them."
             ),
@@ -103,7 +297,8 @@ class ImagesWithTagAPIView(APIView):
                 description="Invalid patient id: Patient not found"
             ),
             status.HTTP_200_OK: openapi.Response(
-                description='Images found and accessible.',
+                description="Images found and accessible, ordered by session date. They are paginated: "
+                            "'next' is the cursor of the next page, or null on the last one.",
                 schema=ImageSerializer(many=True)
             ),
         }
@@ -111,11 +306,11 @@ class ImagesWithTagAPIView(APIView):
     def get(self, request: HttpRequest, patient_id: int, tag: str) -> Response:
         patient_user = get_object_or_404(User, id=patient_id)
         tag = None if tag.lower() == 'a' else tag
-        images = Image.objects.of_patient(patient_user).by_tag(tag)
+        images = Image.objects.with_content().of_patient(patient_user).by_tag(tag)
         if patient_user not in request.user.related_patients and not patient_user.patient.allowed_user_to_see_its_information(request.user):
             return Response({'message': 'No tiene permisos para ver estas imágenes.'},
                             status=status.HTTP_401_UNAUTHORIZED)
-        return Response(ImageSerializer(images, many=True).data, status=status.HTTP_200_OK)
+        return paginated_images_response(request, images)
 
 
 class ImagesOfClinicalSessionAPIView(APIView):
@@ -129,8 +324,13 @@ class ImagesOfClinicalSessionAPIView(APIView):
                 description="Session ID.",
                 required=True
             ),
+            cursor_parameter,
+            page_size_parameter,
         ],
         responses={
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description="Invalid cursor or page size."
+            ),
             status.HTTP_401_UNAUTHORIZED: openapi.Response(
                 description="User not authorized to access those images. Only the patient and its medic can access them."
             ),
@@ -138,7 +338,8 @@ class ImagesOfClinicalSessionAPIView(APIView):
                 description="Invalid patient id: Patient not found"
             ),
             status.HTTP_200_OK: openapi.Response(
-                description='Images found and accessible.',
+                description="Images found and accessible, ordered by session date. They are paginated: "
+                            "'next' is the cursor of the next page, or null on the last one.",
                 schema=ImageSerializer(many=True)
             ),
         }
@@ -149,27 +350,84 @@ class ImagesOfClinicalSessionAPIView(APIView):
         if patient_user not in request.user.related_patients and not patient_user.patient.allowed_user_to_see_its_information(request.user):
             return Response({'message': 'No tiene permisos para ver estas imágenes.'},
                             status=status.HTTP_401_UNAUTHORIZED)
-        return Response(ImageSerializer(session.images.all(), many=True).data, status=status.HTTP_200_OK)
+        return paginated_images_response(request, session.images.with_content())
+
+
+class ImageHashCheckAPIView(APIView):
+    @swagger_auto_schema(
+        operation_id='image_hash_check',
+        operation_description='Checks if an image was already uploaded for the patient of the session, before sending it. '
+                              'If it was, create the image sending its source_hash instead of its content.',
+        manual_parameters=[
+            openapi.Parameter(
+                name='session_id', in_=openapi.IN_PATH,
+                type=openapi.TYPE_INTEGER,
+                description="Session ID.",
+                required=True
+            ),
+            openapi.Parameter(
+                name='source_hash', in_=openapi.IN_PATH,
+                type=openapi.TYPE_STRING,
+                description="SHA-256 of the image file, as 64 hexadecimal lowercase characters.",
+                required=True
+            ),
+        ],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access the session. Only the patient and its medic can access it."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid session id: Session not found"
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Whether the image is already stored.',
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={'exists': openapi.Schema(type=openapi.TYPE_BOOLEAN)})
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, session_id: int, source_hash: str) -> Response:
+        session = get_object_or_404(ClinicalSession, id=session_id)
+        if not session.can_view(request.user):
+            return Response(status=status.HTTP_401_UNAUTHORIZED,
+                            data={'message': 'No tiene permisos para ver este objeto.'})
+        duplicate = Image.objects.find_duplicate(source_hash, session.id)
+        return Response({'exists': duplicate is not None}, status=status.HTTP_200_OK)
 
 
 class ImageCreateAPIView(APIView):
+    parser_classes = (JSONParser, MultiPartParser)
+
     @swagger_auto_schema(
         operation_id='image_create',
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
                 'clinical_session_id': openapi.Schema(type=openapi.TYPE_INTEGER),
-                'content': openapi.Schema(type=openapi.TYPE_STRING, description='Image content as base64 string. Be careful to not include extra quotes.'),
+                'content': openapi.Schema(type=openapi.TYPE_STRING, description='Image content as base64 string. Be careful to not include extra quotes. '
+                                                                                'When the request is sent as multipart/form-data, upload the image as a file instead.'),
+                'source_hash': openapi.Schema(type=openapi.TYPE_STRING, description='SHA-256 of the image file. Send it instead of the content '
+                                                                                    'when /api/v1/image/of_session/<session_id>/hash/<source_hash> says the image exists.'),
                 'tag': openapi.Schema(type=openapi.TYPE_STRING, enum=[choices.images.initials()]),
             },
-            required=['clinical_session_id', 'content', 'tag']
+            required=['clinical_session_id', 'tag']
         ),
         responses={
             status.HTTP_400_BAD_REQUEST: openapi.Response(
                 description='Missing or invalid clinical_session_id, tag or content',
             ),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description='User not authorized to add images to that clinical session. Only the medic of the patient can add them.',
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description='The clinical session does not exist, or there is no stored image with the given source_hash '
+                            'for the patient. Send its content instead.',
+            ),
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: openapi.Response(
+                description='The uploaded image file is too large.',
+            ),
             status.HTTP_201_CREATED: openapi.Response(
-                description="Image created successfully.",
+                description="Image created successfully. The thumbnail is generated in the background: "
+                            "check the status and poll /api/v1/image/<id>/status while it is pending.",
                 schema=ThumbnailSerializer()
             )
         }
@@ -177,11 +435,28 @@ class ImageCreateAPIView(APIView):
     def post(self, request: HttpRequest) -> Response:
         try:
             clinical_session_id = request.data['clinical_session_id']
-            content_as_base64 = request.data['content']
+            source_hash = request.data.get('source_hash')
+            content = request.data['content'] if source_hash is None else None
             tag = request.data['tag']
         except KeyError:
             return Response({'message': 'Ha omitido uno o más campos obligatorios. Complételos e intente nuevamente.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Checked before looking for the hash, so nobody can find out which images other patients have.
+        session = get_object_or_404(ClinicalSession, id=clinical_session_id)
+        if not session.can_edit_and_delete(request.user):
+            return Response(status=status.HTTP_401_UNAUTHORIZED,
+                            data={'message': 'No tiene permisos para modificar este objeto.'})
 
-        content_as_base64 = bytes(content_as_base64, 'utf-8')
-        image = Image.objects.create(content_as_base64=content_as_base64, clinical_session_id=clinical_session_id, tag=tag)
+        if source_hash is not None:
+            duplicate = Image.objects.find_duplicate(source_hash, clinical_session_id)
+            if duplicate is None:
+                return Response({'message': 'La imagen no se encuentra almacenada. Envíe su contenido.'}, status=status.HTTP_404_NOT_FOUND)
+            image = Image.objects.create_from_duplicate(duplicate, clinical_session_id=clinical_session_id, tag=tag)
+        elif isinstance(content, UploadedFile):
+            try:
+                image = Image.objects.create_from_file(content, clinical_session_id=clinical_session_id, tag=tag)
+            except ImageTooLargeException:
+                return Response({'message': 'La imagen es demasiado grande.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        else:
+            content_as_base64 = bytes(content, 'utf-8')
+            image = Image.objects.create(content_as_base64=content_as_base64, clinical_session_id=clinical_session_id, tag=tag)
         return Response(ThumbnailSerializer(image).data, status=status.HTTP_201_CREATED)
@@ -0,0 +1,66 @@
+from rest_framework import status
+from rest_framework.response import Response
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+from rest_framework.views import APIView
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.request import HttpRequest
+from django.http import HttpResponse
+import os
+import posixpath
+
+from ..models import Video
+from ..utils.media_gateway import serve_media
+
+
+class MediaAPIView(APIView):
+    # Token first, so anonymous requests get a 401 with its WWW-Authenticate header, as players expect, instead of a 403.
+    authentication_classes = (TokenAuthentication, SessionAuthentication)
+
+    @swagger_auto_schema(
+        operation_id='media',
+        operation_description='Returns a media file: the file of a video, its thumbnail or its HLS files. '
+                              'Use the urls returned by /api/v1/video/<id>. Single byte ranges are supported.',
+        manual_parameters=[
+            openapi.Parameter(
+                name='path', in_=openapi.IN_PATH,
+                type=openapi.TYPE_STRING,
+                description="Path of the file, relative to the media url.",
+                required=True
+            ),
+            openapi.Parameter(
+                name='Range', in_=openapi.IN_HEADER,
+                type=openapi.TYPE_STRING,
+                description="Byte range of the file to return, as in 'bytes=0-1023'.",
+            ),
+        ],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="Anonymous request, or user not authorized to access the video the file belongs to. "
+                            "Only its owner and the patients of the owner can access it."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="The file does not exist or does not belong to a video."
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='File found and accessible. The body is the file.',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            status.HTTP_206_PARTIAL_CONTENT: openapi.Response(
+                description='The requested range of the file.',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE: openapi.Response(
+                description='The requested range starts after the end of the file.'
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, path: str) -> HttpResponse:
+        # Paths escaping the media folder, like '../settings.py', are not files of any video.
+        path = posixpath.normpath(path)
+        video, file_path = (None, None) if path.startswith(('../', '/')) or path == '..' else Video.objects.of_media_file(path)
+        if video is None or not os.path.isfile(file_path):
+            return Response({'message': 'El archivo no existe.'}, status=status.HTTP_404_NOT_FOUND)
+        if not video.can_view(request.user):
+            return Response({'message': 'No tiene permisos para ver este video.'}, status=status.HTTP_401_UNAUTHORIZED)
+        return serve_media(request, file_path)
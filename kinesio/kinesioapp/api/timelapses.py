@@ -0,0 +1,91 @@
+from rest_framework import status
+from rest_framework.response import Response
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+from rest_framework.views import APIView
+from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from rest_framework.request import HttpRequest
+
+from ..models import Timelapse
+from ..serializers import TimelapseSerializer
+from users.models import User
+from ..utils.streaming import iterate_in_chunks
+from .. import choices
+
+
+patient_id_parameter = openapi.Parameter(
+    name='patient_id', in_=openapi.IN_PATH,
+    type=openapi.TYPE_INTEGER,
+    description="Patient's ID.",
+    required=True
+)
+tag_parameter = openapi.Parameter(
+    name='tag', in_=openapi.IN_PATH,
+    type=openapi.TYPE_STRING,
+    description="Tag (Any of: F, R, L, B, O).",
+    required=True
+)
+
+
+class TimelapseAPIView(APIView):
+    @swagger_auto_schema(
+        operation_id='timelapse',
+        operation_description='Returns the timelapse video of the images of the patient with the tag. It is rendered in the background: '
+                              'poll this endpoint while its status is P (pending), and play its url once it is R (ready). '
+                              'It is F (failed) when it could not be rendered: it is rendered again when requested some minutes later.',
+        manual_parameters=[patient_id_parameter, tag_parameter],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access those images. Only the patient and its medic can access them."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid patient id, or the patient does not have images with the tag."
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Timelapse found and accessible.',
+                schema=TimelapseSerializer()
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, patient_id: int, tag: str) -> Response:
+        patient_user = get_object_or_404(User, id=patient_id)
+        if not patient_user.patient.can_view(request.user):
+            return Response({'message': 'No tiene permisos para ver estas imágenes.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+        if not Timelapse.images_of(patient_user.patient, tag).exists():
+            return Response({'message': 'El paciente no tiene imágenes con ese tag.'}, status=status.HTTP_404_NOT_FOUND)
+        timelapse = Timelapse.objects.get_or_render(patient_user.patient, tag)
+        return Response(TimelapseSerializer(timelapse).data, status=status.HTTP_200_OK)
+
+
+class TimelapseVideoAPIView(APIView):
+    @swagger_auto_schema(
+        operation_id='timelapse_video',
+        operation_description='Returns the timelapse as an MP4 file. Get its url from /api/v1/timelapse/<patient_id>/<tag>.',
+        manual_parameters=[patient_id_parameter, tag_parameter],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access those images. Only the patient and its medic can access them."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid patient id, or the timelapse is not ready."
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Timelapse found and accessible. The body is the video file.',
+                schema=openapi.Schema(type=openapi.TYPE_FILE)
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, patient_id: int, tag: str) -> StreamingHttpResponse:
+        patient_user = get_object_or_404(User, id=patient_id)
+        if not patient_user.patient.can_view(request.user):
+            return Response({'message': 'No tiene permisos para ver estas imágenes.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+        timelapse = Timelapse.objects.filter(patient=patient_user.patient, tag=choices.images.normalize(tag)).first()
+        if timelapse is None or not timelapse.is_ready:
+            return Response({'message': 'El timelapse todavía no está disponible.'}, status=status.HTTP_404_NOT_FOUND)
+        content = timelapse.content
+        response = StreamingHttpResponse(iterate_in_chunks(content), content_type='video/mp4')
+        response['Content-Length'] = len(content)
+        return response
@@ -5,10 +5,21 @@ from drf_yasg import openapi
 from rest_framework.parsers import MultiPartParser, JSONParser
 from rest_framework.views import APIView
 from rest_framework.request import HttpRequest
+from django.conf import settings
+from django.shortcuts import get_object_or_404
 
-from ..models import Video
-from ..serializers import VideoSerializer
-from ..utils.api_mixins import GenericDeleteView
+from ..models import Video, VideoUpload
+from ..models.video_upload import ChunkTooLargeException, IncompleteUploadException, InvalidOffsetException
+from ..serializers import VideoSerializer, VideoUploadSerializer
+from ..utils.api_mixins import GenericDeleteView, GenericDetailsView
+
+
+upload_id_parameter = openapi.Parameter(
+    name='id', in_=openapi.IN_PATH,
+    type=openapi.TYPE_INTEGER,
+    description="Upload's ID.",
+    required=True
+)
 
 
 class VideoUploadView(APIView):
@@ -29,7 +40,8 @@ class VideoUploadView(APIView):
                 description='Missing name or content',
             ),
             status.HTTP_201_CREATED: openapi.Response(
-                description="Video created successfully.",
+                description="Video created successfully. Its thumbnail is generated in the background: "
+                            "poll /api/v1/video/<id> while its status is P (pending).",
                 schema=VideoSerializer()
             )
         }
@@ -44,8 +56,39 @@ class VideoUploadView(APIView):
         return Response(VideoSerializer(video).data, status=status.HTTP_201_CREATED)
 
 
-class VideoDeleteAPIView(GenericDeleteView):
+class VideoDetailsAndDeleteAPIView(GenericDeleteView, GenericDetailsView):
     model_class = Video
+    serializer_class = VideoSerializer
+
+    @swagger_auto_schema(
+        operation_id='video_details',
+        operation_description='Poll this endpoint after uploading a video until its status is R (ready) or F (failed). '
+                              'The thumbnail, streaming and preview urls are null until the video is ready. '
+                              'Preview urls are also null for videos whose duration is not known.',
+        manual_parameters=[
+            openapi.Parameter(
+                name='id', in_=openapi.IN_PATH,
+                type=openapi.TYPE_INTEGER,
+                description="Video's ID.",
+                required=True
+            ),
+        ],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access that video. Only its owner and the patients of the owner can access it."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid video id: Video not found"
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Video found and accessible.',
+                schema=VideoSerializer()
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, id: int) -> Response:
+        # This method exist only to add an '@swagger_auto_schema' annotation
+        return super().get(request, id)
 
     @swagger_auto_schema(
         operation_id='video_delete',
@@ -73,3 +116,191 @@ class VideoDeleteAPIView(GenericDeleteView):
     def delete(self, request: HttpRequest, id: int) -> Response:
         # This method exist only to add an '@swagger_auto_schema' annotation
         return super().delete(request, id)
+
+
+class VideoUploadCreateAPIView(APIView):
+    @swagger_auto_schema(
+        operation_id='video_upload_create',
+        operation_description='Starts a resumable upload of a video. Send its content in chunks to /api/v1/video/uploads/<id>, '
+                              'in order, and then finalize it at /api/v1/video/uploads/<id>/finalize to create the video. '
+                              f'Uploads not resumed in {settings.VIDEO_UPLOAD_EXPIRATION_HOURS} hours are deleted.',
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'name': openapi.Schema(type=openapi.TYPE_STRING, description='Title of the video.'),
+                'file_name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the video file, as in "exercise.mp4".'),
+                'size': openapi.Schema(type=openapi.TYPE_INTEGER, description='Size of the video file, in bytes.'),
+            },
+            required=['name', 'file_name', 'size']
+        ),
+        responses={
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description='Missing name, file name or size',
+            ),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description='Only medics can upload videos.',
+            ),
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: openapi.Response(
+                description=f'The video is larger than {settings.VIDEO_UPLOAD_MAX_SIZE} bytes.',
+            ),
+            status.HTTP_201_CREATED: openapi.Response(
+                description='Upload started.',
+                schema=VideoUploadSerializer()
+            ),
+        }
+    )
+    def post(self, request: HttpRequest) -> Response:
+        if not request.user.is_medic:
+            return Response({'message': 'Solo los médicos pueden subir videos.'}, status=status.HTTP_401_UNAUTHORIZED)
+        serializer = VideoUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'message': 'Ha omitido uno o más campos obligatorios. Complételos e intente nuevamente.'}, status=status.HTTP_400_BAD_REQUEST)
+        if serializer.validated_data['size'] > settings.VIDEO_UPLOAD_MAX_SIZE:
+            return Response({'message': 'El video es demasiado grande.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        upload = serializer.save(owner=request.user.medic)
+        return Response(VideoUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+
+class VideoUploadAPIView(GenericDeleteView, GenericDetailsView):
+    model_class = VideoUpload
+    serializer_class = VideoUploadSerializer
+
+    @swagger_auto_schema(
+        operation_id='video_upload_details',
+        operation_description='Returns the upload and how many bytes were received. Resume a dropped upload from its offset.',
+        manual_parameters=[upload_id_parameter],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access that upload. Only the medic uploading it can access it."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid upload id: Upload not found"
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Upload found and accessible.',
+                schema=VideoUploadSerializer()
+            ),
+        }
+    )
+    def get(self, request: HttpRequest, id: int) -> Response:
+        # This method exist only to add an '@swagger_auto_schema' annotation
+        return super().get(request, id)
+
+    @swagger_auto_schema(
+        operation_id='video_upload_chunk',
+        operation_description='Appends a chunk of the video file to the upload. The body is the chunk, sent as application/octet-stream, '
+                              f'of up to {settings.VIDEO_UPLOAD_CHUNK_MAX_SIZE} bytes. Chunks have to be sent in order: '
+                              'the offset has to be the offset of the upload.',
+        manual_parameters=[
+            upload_id_parameter,
+            openapi.Parameter(
+                name='offset', in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Position of the chunk in the file, in bytes.",
+                required=True
+            ),
+        ],
+        request_body=openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_BINARY, description='The chunk.'),
+        responses={
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description='Missing offset or empty chunk.'
+            ),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access that upload. Only the medic uploading it can access it."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid upload id: Upload not found"
+            ),
+            status.HTTP_409_CONFLICT: openapi.Response(
+                description='The offset is not the offset of the upload, or the chunk goes past the size of the video. '
+                            'The body has the offset of the upload, to resume from there.',
+                schema=VideoUploadSerializer()
+            ),
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: openapi.Response(
+                description='The chunk is too large.'
+            ),
+            status.HTTP_200_OK: openapi.Response(
+                description='Chunk received. The upload has its new offset.',
+                schema=VideoUploadSerializer()
+            ),
+        }
+    )
+    def put(self, request: HttpRequest, id: int) -> Response:
+        upload = get_object_or_404(VideoUpload, id=id)
+        if not upload.can_edit_and_delete(request.user):
+            return Response(status=status.HTTP_401_UNAUTHORIZED,
+                            data={'message': 'No tiene permisos para modificar este objeto.'})
+        offset, length = request.query_params.get('offset', ''), request.META.get('CONTENT_LENGTH') or ''
+        # isdecimal, unlike isdigit, only accepts what int can parse.
+        if not offset.isdecimal() or not length.isdecimal() or int(length) == 0:
+            return Response({'message': 'Ha omitido uno o más campos obligatorios. Complételos e intente nuevamente.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # The chunk is read from the request as it is written, instead of being loaded in memory.
+            upload.write_chunk(int(offset), request.stream, int(length))
+        except ChunkTooLargeException:
+            return Response({'message': 'El fragmento del video es demasiado grande.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except InvalidOffsetException:
+            upload.refresh_from_db()
+            return Response(dict(VideoUploadSerializer(upload).data, message='El fragmento no continúa la subida del video.'),
+                            status=status.HTTP_409_CONFLICT)
+        return Response(VideoUploadSerializer(upload).data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_id='video_upload_delete',
+        operation_description='Cancels the upload and deletes what was received.',
+        manual_parameters=[upload_id_parameter],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to delete that upload. Only the medic uploading it can delete it."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid upload id: Upload not found"
+            ),
+            status.HTTP_204_NO_CONTENT: openapi.Response(
+                description="Upload deleted successfully.",
+            ),
+        }
+    )
+    def delete(self, request: HttpRequest, id: int) -> Response:
+        # This method exist only to add an '@swagger_auto_schema' annotation
+        return super().delete(request, id)
+
+
+class VideoUploadFinalizeAPIView(APIView):
+    @swagger_auto_schema(
+        operation_id='video_upload_finalize',
+        operation_description='Creates the video once the whole file was received, as /api/v1/video does with a single request, '
+                              'and deletes the upload.',
+        manual_parameters=[upload_id_parameter],
+        responses={
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(
+                description="User not authorized to access that upload. Only the medic uploading it can access it."
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response(
+                description="Invalid upload id: Upload not found, or it was finalized or cancelled by another request meanwhile"
+            ),
+            status.HTTP_409_CONFLICT: openapi.Response(
+                description='The whole file was not received yet. The body has the offset of the upload, to resume from there.',
+                schema=VideoUploadSerializer()
+            ),
+            status.HTTP_201_CREATED: openapi.Response(
+                description="Video created successfully. Its thumbnail is generated in the background: "
+                            "poll /api/v1/video/<id> while its status is P (pending).",
+                schema=VideoSerializer()
+            ),
+        }
+    )
+    def post(self, request: HttpRequest, id: int) -> Response:
+        upload = get_object_or_404(VideoUpload, id=id)
+        if not upload.can_edit_and_delete(request.user):
+            return Response(status=status.HTTP_401_UNAUTHORIZED,
+                            data={'message': 'No tiene permisos para modificar este objeto.'})
+        try:
+            video = upload.finalize()
+        except IncompleteUploadException:
+            return Response(dict(VideoUploadSerializer(upload).data, message='Todavía no se recibió el video completo.'),
+                            status=status.HTTP_409_CONFLICT)
+        except VideoUpload.DoesNotExist:
+            # Another request finalized or cancelled it meanwhile.
+            return Response({'message': 'La subida del video ya fue finalizada o cancelada.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(VideoSerializer(video).data, status=status.HTTP_201_CREATED)
@@ -1 +1 @@
-from . import images, sessions, days
+from . import images, sessions, days, renditions, processing
@@ -16,3 +16,12 @@ def get() -> List[Tuple[str, str]]:
 
 def initials() -> List[str]:
     return [tag[0] for tag in TAGS]
+
+
+def is_valid(tag: str) -> bool:
+    return isinstance(tag, str) and tag.upper() in TAGS + initials()
+
+
+def normalize(tag: str) -> str:
+    """ Tags are stored as their uppercase initial, whatever the client sends ('F', 'f', 'FRONT'...). """
+    return tag[:1].upper()
@@ -0,0 +1,12 @@
+from typing import List, Tuple
+
+
+PENDING = 'PENDING'
+READY = 'READY'
+FAILED = 'FAILED'
+
+PROCESSING_STATUS = [PENDING, READY, FAILED]
+
+
+def get() -> List[Tuple[str, str]]:
+    return [(status[0], status) for status in PROCESSING_STATUS]
@@ -0,0 +1,27 @@
+from typing import List, Tuple
+
+
+JPEG = 'JPEG'
+WEBP = 'WEBP'
+
+FORMATS = [JPEG, WEBP]
+
+CONTENT_TYPES = {
+    JPEG: 'image/jpeg',
+    WEBP: 'image/webp',
+}
+
+# Maximum width and height, in pixels, of each rendition.
+SIZES = [160, 320, 800, 1600]
+
+
+def get() -> List[Tuple[str, str]]:
+    return [(format_, format_) for format_ in FORMATS]
+
+
+def content_type(format_: str) -> str:
+    return CONTENT_TYPES[format_]
+
+
+def is_valid(size: int, format_: str) -> bool:
+    return size in SIZES and format_ in FORMATS
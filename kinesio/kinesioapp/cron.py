@@ -3,7 +3,7 @@ import logging
 from django.conf import settings
 from datetime import date
 
-from .models import Exercise
+from .models import Exercise, Image, Video, VideoUpload
 
 
 class ResetExerciseStatus(CronJobBase):
@@ -33,3 +33,43 @@ class SendExerciseReminder(CronJobBase):
         for exercise in exercises:
             exercise.send_reminder_if_necessary()
         logging.info('Done=False was set for all exercises.')
+
+
+class ProcessPendingImages(CronJobBase):
+    """ Processes images that were left pending, for instance because the server restarted before processing them. """
+    schedule = Schedule(run_every_mins=settings.PROCESS_PENDING_IMAGES_EVERY_MINUTES)
+    code = 'kinesioapp.process_pending_images'  # a unique code
+
+    def do(self):
+        images = Image.objects.pending()
+        logging.info(f'Processing {images.count()} pending images... ')
+        for image in images:
+            image.process()
+        logging.info('Pending images were processed.')
+
+
+class ProcessPendingVideos(CronJobBase):
+    """ Processes videos that were left pending, for instance because the server restarted before processing them. """
+    schedule = Schedule(run_every_mins=settings.PROCESS_PENDING_VIDEOS_EVERY_MINUTES)
+    code = 'kinesioapp.process_pending_videos'  # a unique code
+
+    def do(self):
+        videos = Video.objects.pending()
+        logging.info(f'Processing {videos.count()} pending videos... ')
+        for video in videos:
+            video.process()
+        logging.info('Pending videos were processed.')
+
+
+class DeleteAbandonedVideoUploads(CronJobBase):
+    """ Deletes resumable video uploads that were not resumed in VIDEO_UPLOAD_EXPIRATION_HOURS, and their files. """
+    schedule = Schedule(run_every_mins=settings.DELETE_ABANDONED_VIDEO_UPLOADS_EVERY_MINUTES)
+    code = 'kinesioapp.delete_abandoned_video_uploads'  # a unique code
+
+    def do(self):
+        uploads = VideoUpload.objects.abandoned()
+        logging.info(f'Deleting {uploads.count()} abandoned video uploads... ')
+        # Deleted one by one, so their files are deleted too.
+        for upload in uploads:
+            upload.delete()
+        logging.info('Abandoned video uploads were deleted.')
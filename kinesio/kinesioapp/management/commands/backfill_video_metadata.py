@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from multiprocessing import Pool
+from typing import Iterator, Optional, Tuple
+import os
+
+from ...models import Video
+from ...utils.image_processing import discard_inherited_connections
+from ...utils.video_metadata import read_metadata
+
+
+def read_metadata_of(video: Tuple[int, str]) -> Tuple[int, Optional[dict]]:
+    """ Runs on a worker process. Returns the ID of the video and the metadata of its file, or None if it cannot be read.
+        Workers only probe the files: the metadata is saved by the main process. """
+    video_id, path = video
+    try:
+        return video_id, read_metadata(path)
+    except OSError:
+        return video_id, None
+
+
+class Command(BaseCommand):
+    help = 'Reads the metadata of the files of videos uploaded before it was read on upload, and saves it on them. ' \
+           'Files are probed in parallel on several processes. Videos that already have it are skipped, ' \
+           'so the command can be interrupted and run again to resume.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Amount of worker processes. Use 1 to run on this process.')
+        parser.add_argument('--all', action='store_true', help='Read the metadata of every video again, for instance after updating ffmpeg.')
+
+    def handle(self, *args, workers: int, all: bool, **options) -> None:
+        videos = Video.objects.all() if all else Video.objects.filter(content_hash__isnull=True)
+        # Only the paths are sent to the workers.
+        targets = [(video.id, video.content.path) for video in videos.only('id', 'content').order_by('id')]
+        self.stdout.write(f'Reading the metadata of {len(targets)} videos.')
+        if workers > 1:
+            with Pool(processes=workers, initializer=discard_inherited_connections) as pool:
+                updated_videos = self._save(pool.imap_unordered(read_metadata_of, targets))
+        else:
+            updated_videos = self._save(map(read_metadata_of, targets))
+        self.stdout.write(self.style.SUCCESS(f'Done. The metadata of {updated_videos} videos was saved.'))
+
+    def _save(self, results: Iterator[Tuple[int, Optional[dict]]]) -> int:
+        updated_videos = 0
+        for video_id, metadata in results:
+            if metadata is None:
+                self.stderr.write(f'The file of video {video_id} could not be read.')
+                continue
+            Video.objects.filter(id=video_id).update(**metadata)
+            updated_videos += 1
+            self.stdout.write(f'Saved the metadata of video {video_id} ({updated_videos} videos).')
+        return updated_videos
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+import json
+
+from ...utils.benchmark import benchmark_image_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the image path (base64 cleanup, encryption, ingest, thumbnails, decryption, reading the content ' \
+           'as base64 and serialization) on generated photos, and reports throughput, latency percentiles and peak memory as JSON. ' \
+           'Save the output of two versions and diff them to compare a change. Nothing is written to the database.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4, 12], help='Sizes of the generated photos.')
+        parser.add_argument('--iterations', type=int, default=20, help='Measured runs of each operation, after a warm up run.')
+        parser.add_argument('--output', default=None, help='File to write the JSON report to. Defaults to the standard output.')
+
+    def handle(self, *args, megapixels: list, iterations: int, output: str, **options) -> None:
+        report = json.dumps(benchmark_image_pipeline(megapixels, iterations), indent=2, sort_keys=True)
+        if output is None:
+            self.stdout.write(report)
+        else:
+            with open(output, 'w') as output_file:
+                output_file.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Done. The report was saved on {output}.'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import Image
+from ...utils.blob_store import BlobStore
+
+
+class Command(BaseCommand):
+    help = 'Moves the content of images stored on the database to the blob store. ' \
+           'It works in batches and it can be interrupted and run again to resume the migration.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--batch-size', type=int, default=50, help='Images moved on each transaction.')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this amount of batches.')
+
+    def handle(self, *args, batch_size: int, max_batches: int, **options) -> None:
+        blob_store = BlobStore()
+        moved_images = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            # Already moved images leave the queryset, so each batch starts where the previous one finished.
+            with transaction.atomic():
+                images = list(Image.objects.with_content().with_thumbnail().not_in_blob_store().order_by('id').select_for_update()[:batch_size])
+                for image in images:
+                    image.move_to_blob_store(blob_store)
+            if not images:
+                break
+            batches += 1
+            moved_images += len(images)
+            self.stdout.write(f'Moved {moved_images} images ({Image.objects.not_in_blob_store().count()} remaining).')
+        self.stdout.write(self.style.SUCCESS(f'Done. {moved_images} images were moved to the blob store.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Substr, Upper
+
+from ...models import Image
+from ... import choices
+
+
+class Command(BaseCommand):
+    help = 'Normalizes the tags of images saved before tags were stored as their initial, so they can be found by tag.'
+
+    def handle(self, *args, **options) -> None:
+        normalized_images = Image.objects.exclude(tag__in=choices.images.initials()).update(tag=Upper(Substr('tag', 1, 1)))
+        self.stdout.write(self.style.SUCCESS(f'Done. {normalized_images} image tags were normalized.'))
@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+from multiprocessing import Pool
+from typing import Iterator, List
+import json
+import os
+
+from ...models import Image, Timelapse
+from ...utils.crypto import ImageCipher
+from ...utils.image_processing import discard_inherited_connections
+
+
+def reencrypt_image(image_id: int) -> int:
+    """ Returns the amount of re-encrypted images: the image and its duplicates on other batches, which share its blobs. """
+    with transaction.atomic():
+        image = Image.objects.filter(id=image_id).first()
+        if image is None:
+            return 0
+        # Lock the image and its duplicates on a single query, ordered by ID, so workers re-encrypting duplicates
+        # at the same time wait for each other instead of deadlocking. Then read it again: they may have updated it.
+        list(Image.objects.sharing_blobs_with(image).select_for_update().order_by('id').values_list('id', flat=True))
+        return Image.objects.with_content().with_thumbnail().get(id=image_id).rotate_encryption()
+
+
+def reencrypt_batch(image_ids: List[int]) -> int:
+    """ Runs on a worker process. Returns the amount of re-encrypted images. Each image is re-encrypted on its own transaction. """
+    return sum(reencrypt_image(image_id) for image_id in image_ids)
+
+
+class Command(BaseCommand):
+    help = 'Re-encrypts every image and timelapse with IMAGE_ENCRYPTION_KEY. Run it after moving the previous key to IMAGE_ENCRYPTION_OLD_KEYS, ' \
+           'or to move images encrypted with Fernet to the binary envelope format. Images are readable while it runs. ' \
+           'Batches run in parallel on several processes. Progress is saved on a checkpoint file, ' \
+           'so the command can be interrupted and run again to resume the rotation.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--batch-size', type=int, default=50, help='Images sent to a worker process at a time.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Amount of worker processes. Use 1 to run on this process.')
+        parser.add_argument('--checkpoint-file', default=os.path.join(settings.MEDIA_ROOT, 'reencrypt_images.checkpoint'))
+
+    def handle(self, *args, batch_size: int, workers: int, checkpoint_file: str, **options) -> None:
+        last_id = self._read_checkpoint(checkpoint_file)
+        image_ids = list(Image.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+        batches = [image_ids[start:start + batch_size] for start in range(0, len(image_ids), batch_size)]
+        self.stdout.write(f'Re-encrypting {len(image_ids)} images on {len(batches)} batches, starting after image {last_id}.')
+        if workers > 1:
+            with Pool(processes=workers, initializer=discard_inherited_connections) as pool:
+                reencrypted_images = self._reencrypt(batches, pool.imap(reencrypt_batch, batches), checkpoint_file)
+        else:
+            reencrypted_images = self._reencrypt(batches, map(reencrypt_batch, batches), checkpoint_file)
+        reencrypted_timelapses = self._reencrypt_timelapses()
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        self.stdout.write(self.style.SUCCESS(f'Done. {reencrypted_images} images and {reencrypted_timelapses} timelapses were re-encrypted.'))
+
+    def _reencrypt(self, batches: List[List[int]], results: Iterator[int], checkpoint_file: str) -> int:
+        reencrypted_images = 0
+        # Results arrive in order, so every batch up to the current one is done when its result arrives.
+        for batch, reencrypted_in_batch in zip(batches, results):
+            reencrypted_images += reencrypted_in_batch
+            self._write_checkpoint(checkpoint_file, batch[-1])
+            self.stdout.write(f'Re-encrypted {reencrypted_images} images.')
+        return reencrypted_images
+
+    @staticmethod
+    def _reencrypt_timelapses() -> int:
+        """ There is a single timelapse per patient and tag, so they are re-encrypted on this process, each one on its own transaction.
+            Timelapses not rendered yet have nothing to re-encrypt. """
+        reencrypted_timelapses = 0
+        for timelapse_id in Timelapse.objects.filter(blob_hash__isnull=False).order_by('id').values_list('id', flat=True):
+            with transaction.atomic():
+                timelapse = Timelapse.objects.select_for_update().filter(id=timelapse_id, blob_hash__isnull=False).first()
+                reencrypted_timelapses += bool(timelapse and timelapse.rotate_encryption())
+        return reencrypted_timelapses
+
+    @staticmethod
+    def _read_checkpoint(checkpoint_file: str) -> int:
+        """ Returns the last re-encrypted image ID. Checkpoints of a rotation to another key are ignored. """
+        try:
+            with open(checkpoint_file) as file:
+                checkpoint = json.load(file)
+        except FileNotFoundError:
+            return 0
+        return checkpoint['last_id'] if checkpoint['key'] == ImageCipher().primary_key_fingerprint else 0
+
+    @staticmethod
+    def _write_checkpoint(checkpoint_file: str, last_id: int) -> None:
+        os.makedirs(os.path.dirname(checkpoint_file), exist_ok=True)
+        with open(checkpoint_file, 'w') as file:
+            json.dump({'key': ImageCipher().primary_key_fingerprint, 'last_id': last_id}, file)
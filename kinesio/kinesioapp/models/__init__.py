@@ -1,4 +1,7 @@
 from .clinical_session import ClinicalSession
 from .exercise import Exercise
 from .image import Image
+from .image_rendition import ImageRendition
+from .timelapse import Timelapse
 from .video import Video
+from .video_upload import VideoUpload
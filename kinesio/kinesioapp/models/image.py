@@ -1,30 +1,171 @@
 from __future__ import annotations
-from django.db import models
-from cryptography.fernet import Fernet
+from django.db import models, transaction
 from django.conf import settings
-from typing import List
-from django.db.models.functions import Substr, Lower
+from django.utils import timezone
+from datetime import timedelta
+from typing import Iterator, List, Optional, Tuple, Union
+from itertools import groupby
+from operator import attrgetter
+import base64
+import hashlib
+import logging
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
 
 from .. import choices
 from users.models import User
 from ..utils.thumbnail import ThumbnailGenerator
 from ..utils.models_mixins import CanViewModelMixin
 from .clinical_session import ClinicalSession
-from ..utils.binary_field_to_string import binary_field_to_string
+from ..utils.blob_store import BlobStore
+from ..utils.crypto import ImageCipher
+from ..utils.image_upload import ImageUpload
+from ..utils.image_ingest import ImageIngest
+from ..utils.image_processing import ImageProcessingPool, store_image
+from ..utils.thumbnail_cache import ThumbnailCache
+from ..utils.streaming import iterate_in_chunks
+
+
+# Legacy columns holding whole encrypted images. They are deferred unless explicitly requested.
+CONTENT_COLUMN = '_content_base64_and_encrypted'
+THUMBNAIL_COLUMN = '_thumbnail_base64_and_encrypted'
 
 
 class ImageQuerySet(models.QuerySet):
     def create(self, content_as_base64: bytes, **kwargs) -> models.Model:
         # Replace '\n's to fix a bug in the mobile front end.
         content_as_base64 = content_as_base64.replace(b'\\n', b'').replace(b'\n', b'')
-        encrypted_content = Fernet(settings.IMAGE_ENCRYPTION_KEY).encrypt(content_as_base64)
-        encrypted_thumbnail = Fernet(settings.IMAGE_ENCRYPTION_KEY).encrypt(ThumbnailGenerator(content_as_base64).thumbnail)
-        return super().create(_content_base64_and_encrypted=encrypted_content,
-                              _thumbnail_base64_and_encrypted=encrypted_thumbnail,
-                              **kwargs)
+        content = base64.b64decode(content_as_base64)
+        return self._create_from_content(content, hashlib.sha256(content).hexdigest(), **kwargs)
+
+    def create_from_file(self, uploaded_file: UploadedFile, **kwargs) -> models.Model:
+        upload = ImageUpload(uploaded_file)
+        # The file is encrypted and written to the blob store chunk by chunk, so it is never fully loaded in memory.
+        encryptor = ImageCipher().encryptor()
+        with BlobStore().writer() as blob_writer:
+            for chunk in upload.chunks():
+                blob_writer.write(encryptor.update(chunk))
+            blob_writer.write(encryptor.finalize())
+        duplicate = self.find_duplicate(upload.hash, self._clinical_session_id(kwargs))
+        if duplicate is not None:
+            # The hash is only known after reading the whole file. Every encryption uses a new nonce, so nothing else references this blob.
+            BlobStore().delete(blob_writer.hash)
+            return self.create_from_duplicate(duplicate, **kwargs)
+        return self._create_from_blob(blob_writer.hash, blob_writer.size, source_hash=upload.hash, **kwargs)
+
+    def create_from_duplicate(self, duplicate: Image, **kwargs) -> models.Model:
+        """ Creates an image sharing the stored blobs of a duplicate instead of storing them again. """
+        image = super().create(content_hash=duplicate.content_hash,
+                               content_size=duplicate.content_size,
+                               thumbnail_hash=duplicate.thumbnail_hash,
+                               thumbnail_size=duplicate.thumbnail_size,
+                               original_hash=duplicate.original_hash,
+                               original_size=duplicate.original_size,
+                               format=duplicate.format,
+                               source_hash=duplicate.source_hash,
+                               status=duplicate.status,
+                               **kwargs)
+        if image.status == choices.processing.PENDING[0]:
+            ImageProcessingPool().submit(image)
+        return image
+
+    def find_duplicate(self, source_hash: str, clinical_session_id: int) -> Optional[Image]:
+        """ Returns a stored image with the same original file, of the patient of the given session. """
+        return self.duplicates_of(source_hash).filter(clinical_session__patient__sessions__id=clinical_session_id).first()
+
+    def duplicates_of(self, source_hash: str) -> ImageQuerySet:
+        duplicates = self.filter(source_hash=source_hash, content_hash__isnull=False)
+        return duplicates.exclude(status=choices.processing.FAILED[0]).order_by('id')
+
+    def store_many(self, contents: List[Union[bytes, UploadedFile]], patient_id: int) -> List[dict]:
+        """ Stores the images and their thumbnails, processing them in parallel, and returns the fields of their rows.
+            Rows are not saved, so they can be inserted with a single bulk_create.
+            Uploaded files are read in chunks, so they are never fully loaded in memory unless Django already kept them there.
+            Blobs of images the patient already has are reused. If any image fails, the new blobs are removed and its exception is raised. """
+        source_hashes = [self._source_hash(content) for content in contents]
+        stored_images = {}
+        for source_hash in set(source_hashes):
+            duplicate = self.duplicates_of(source_hash).filter(clinical_session__patient_id=patient_id, thumbnail_hash__isnull=False).first()
+            if duplicate is not None:
+                stored_images[source_hash] = {field: getattr(duplicate, field) for field in Image.STORED_FIELDS}
+        new_contents = {source_hash: content for source_hash, content in zip(source_hashes, contents) if source_hash not in stored_images}
+        futures = ImageProcessingPool().map(store_image, [self._worker_argument(content) for content in new_contents.values()])
+        failed_futures = [future for future in futures if future.exception() is not None]
+        if failed_futures:
+            # Every new blob was encrypted with a new nonce, so nothing else references them.
+            for future in futures:
+                if future.exception() is None:
+                    for blob_hash in Image.blob_hashes_of(future.result()):
+                        BlobStore().delete(blob_hash)
+            raise failed_futures[0].exception()
+        stored_images.update(zip(new_contents.keys(), (future.result() for future in futures)))
+        return [dict(stored_images[source_hash], source_hash=source_hash, status=choices.processing.READY[0]) for source_hash in source_hashes]
+
+    def _create_from_content(self, content: bytes, source_hash: str, **kwargs) -> models.Model:
+        duplicate = self.find_duplicate(source_hash, self._clinical_session_id(kwargs))
+        if duplicate is not None:
+            return self.create_from_duplicate(duplicate, **kwargs)
+        encrypted_content = ImageCipher().encrypt(content)
+        return self._create_from_blob(BlobStore().put(encrypted_content), len(encrypted_content), source_hash=source_hash, **kwargs)
+
+    def _create_from_blob(self, content_hash: str, content_size: int, **kwargs) -> models.Model:
+        # Only the uploaded file is stored here. It is normalized, and its thumbnail and renditions generated, in the background.
+        image = super().create(content_hash=content_hash,
+                               content_size=content_size,
+                               status=choices.processing.PENDING[0],
+                               **kwargs)
+        ImageProcessingPool().submit(image)
+        return image
+
+    @staticmethod
+    def _source_hash(content: Union[bytes, UploadedFile]) -> str:
+        if isinstance(content, bytes):
+            return hashlib.sha256(content).hexdigest()
+        upload = ImageUpload(content)
+        for _ in upload.chunks():
+            pass
+        return upload.hash
+
+    @staticmethod
+    def _worker_argument(content: Union[bytes, UploadedFile]) -> Union[bytes, str]:
+        # Open files cannot be sent to the workers. Big uploads are spooled to a temporary file, which they open by its path.
+        if isinstance(content, TemporaryUploadedFile):
+            return content.temporary_file_path()
+        if isinstance(content, UploadedFile):
+            # Small uploads are already in memory.
+            content.seek(0)
+            return content.read()
+        return content
+
+    @staticmethod
+    def _clinical_session_id(kwargs: dict) -> Optional[int]:
+        clinical_session = kwargs.get('clinical_session')
+        return clinical_session.id if clinical_session is not None else kwargs.get('clinical_session_id')
+
+    def with_content(self) -> ImageQuerySet:
+        return self._without_deferring(CONTENT_COLUMN)
+
+    def with_thumbnail(self) -> ImageQuerySet:
+        return self._without_deferring(THUMBNAIL_COLUMN)
+
+    def _without_deferring(self, column: str) -> ImageQuerySet:
+        deferred_columns, deferring = self.query.deferred_loading
+        if not deferring or column not in deferred_columns:
+            return self
+        queryset = self.defer(None)
+        other_deferred_columns = deferred_columns - {column}
+        return queryset.defer(*other_deferred_columns) if other_deferred_columns else queryset
+
+    def bulk_create(self, images: List[Image], *args, **kwargs) -> List[Image]:
+        # save() is not called on bulk inserts.
+        for image in images:
+            image.normalize_tag()
+        return super().bulk_create(images, *args, **kwargs)
 
     def by_tag(self, tag: str) -> ImageQuerySet:
-        return self.annotate(tag_initial=Lower(Substr('tag', 1, 1))).filter(tag_initial=tag[0].lower()) if tag else self
+        return self.filter(tag=choices.images.normalize(tag)) if tag else self
 
     def of_patient(self, user: User) -> ImageQuerySet:
         return self.filter(clinical_session__patient=user.patient)
@@ -33,27 +174,284 @@ class ImageQuerySet(models.QuerySet):
         return self.by_tag(tag).exists()
 
     def classified_by_tag(self) -> List[dict]:
-        return [{'tag': tag, 'images': self.by_tag(tag)} for tag in choices.images.TAGS if self.has_images_with_tag(tag)]
+        """ Lists the images of each tag that has any, fetching all of them on a single query. """
+        images_by_tag = {tag: list(images) for tag, images in groupby(self.order_by('tag', 'id'), key=attrgetter('tag'))}
+        return [{'tag': tag, 'images': images_by_tag[tag[0]]} for tag in choices.images.TAGS if tag[0] in images_by_tag]
+
+    def pending(self) -> ImageQuerySet:
+        return self.filter(status=choices.processing.PENDING[0])
+
+    def claim(self, image_id: int) -> bool:
+        """ Marks the pending image as being processed, unless another process is already processing it.
+            The claims of processes that crashed or were killed expire after IMAGE_PROCESSING_CLAIM_MINUTES. """
+        now = timezone.now()
+        expired = now - timedelta(minutes=settings.IMAGE_PROCESSING_CLAIM_MINUTES)
+        unclaimed = Q(processing_started_at__isnull=True) | Q(processing_started_at__lt=expired)
+        # A single UPDATE, so only one of the processes trying at the same time gets it.
+        return self.pending().filter(unclaimed, id=image_id).update(processing_started_at=now) == 1
+
+    def not_in_blob_store(self) -> ImageQuerySet:
+        return self.filter(content_hash__isnull=True)
+
+    def referencing_blob(self, blob_hash: str) -> ImageQuerySet:
+        return self.filter(Q(content_hash=blob_hash) | Q(thumbnail_hash=blob_hash) | Q(original_hash=blob_hash))
+
+    def sharing_blobs_with(self, image: Image) -> ImageQuerySet:
+        """ The image and its duplicates, which reference the same blobs. """
+        blob_hashes = image.blob_hashes
+        return self.filter(Q(id=image.id) | Q(content_hash__in=blob_hashes) | Q(thumbnail_hash__in=blob_hashes) | Q(original_hash__in=blob_hashes))
+
+
+class ImageManager(models.Manager.from_queryset(ImageQuerySet)):
+    def get_queryset(self) -> ImageQuerySet:
+        # Even with the blob store, legacy rows can carry megabytes on these columns.
+        # Use with_content() or with_thumbnail() to load them along with the rest of the row.
+        return super().get_queryset().defer(CONTENT_COLUMN, THUMBNAIL_COLUMN)
 
 
 class Image(models.Model, CanViewModelMixin):
-    _content_base64_and_encrypted = models.BinaryField()
-    _thumbnail_base64_and_encrypted = models.BinaryField()
+    class Meta:
+        indexes = [models.Index(fields=['clinical_session', 'tag'])]
+    # Legacy storage: images created before the blob store existed keep their content on these columns
+    # until they are moved with the 'move_images_to_blob_store' command.
+    _content_base64_and_encrypted = models.BinaryField(null=True, default=None)
+    _thumbnail_base64_and_encrypted = models.BinaryField(null=True, default=None)
+    # The encrypted content and thumbnail live in the blob store. Rows only keep their hashes and sizes.
+    content_hash = models.CharField(max_length=64, null=True, default=None, db_index=True)
+    content_size = models.PositiveIntegerField(null=True, default=None)
+    thumbnail_hash = models.CharField(max_length=64, null=True, default=None, db_index=True)
+    thumbnail_size = models.PositiveIntegerField(null=True, default=None)
+    # Format of the content. Images stored before the ingest normalization, or without it, are assumed to be JPEG.
+    format = models.CharField(max_length=4, choices=choices.renditions.get(), default=choices.renditions.JPEG)
+    # The uploaded file, encrypted, when it was normalized and IMAGE_INGEST_KEEP_ORIGINALS is set.
+    original_hash = models.CharField(max_length=64, null=True, default=None, db_index=True)
+    original_size = models.PositiveIntegerField(null=True, default=None)
+    # Whether the content is the normalized image. Uploaded files are stored as they are, and normalized when processed.
+    normalized = models.BooleanField(default=False)
+    # sha256 of the original image file, before encoding and encrypting it.
+    source_hash = models.CharField(max_length=64, null=True, default=None, db_index=True)
+    # The thumbnail and renditions of new images are generated in the background. Older images are already processed.
+    status = models.CharField(max_length=1, choices=choices.processing.get(), default=choices.processing.READY[0])
+    # When the process processing the image claimed it. Null if no process is processing it.
+    processing_started_at = models.DateTimeField(null=True, default=None)
     clinical_session = models.ForeignKey(ClinicalSession, on_delete=models.CASCADE, null=True, related_name='images')
+    # Normalized to its initial on save. Rows saved before that are normalized with the 'normalize_image_tags' command.
     tag = models.CharField(max_length=20, choices=choices.images.get())
 
-    objects = ImageQuerySet.as_manager()
+    objects = ImageManager()
+
+    # Fields describing the stored blobs, shared by duplicates of the same image.
+    STORED_FIELDS = ('content_hash', 'content_size', 'thumbnail_hash', 'thumbnail_size', 'original_hash', 'original_size', 'format', 'normalized')
+
+    @staticmethod
+    def blob_hashes_of(fields: dict) -> List[str]:
+        return [fields[field] for field in ('content_hash', 'thumbnail_hash', 'original_hash') if fields.get(field)]
+
+    def save(self, **kwargs: dict) -> None:
+        self.normalize_tag()
+        super().save(**kwargs)
+
+    def normalize_tag(self) -> None:
+        self.tag = choices.images.normalize(self.tag)
+
+    @property
+    def encrypted_content(self) -> bytes:
+        return self._read_blob_or_column(self.content_hash, self._content_base64_and_encrypted)
+
+    @property
+    def encrypted_thumbnail(self) -> bytes:
+        return self._read_blob_or_column(self.thumbnail_hash, self._thumbnail_base64_and_encrypted)
+
+    @property
+    def content(self) -> bytes:
+        """ Decrypted image as raw bytes, ready to be sent as a file. """
+        return ImageCipher().decrypt(self.encrypted_content)
+
+    def content_chunks(self) -> Tuple[int, Iterator[bytes]]:
+        """ Size of the decrypted image and an iterator over its chunks. Envelopes in the blob store are decrypted
+            while they are read, so the whole image is never in memory; its tag is checked after the last chunk. """
+        if self.content_hash:
+            blob_file = BlobStore().open(self.content_hash)
+            try:
+                decryptor = ImageCipher().decryptor(blob_file)
+            except Exception:
+                blob_file.close()
+                raise
+            if decryptor:
+                return decryptor.size, decryptor.chunks()
+            blob_file.close()
+        content = self.content
+        return len(content), iterate_in_chunks(content)
+
+    @property
+    def thumbnail(self) -> Optional[bytes]:
+        """ Decrypted thumbnail, served from the thumbnail cache when possible. None while the image is pending. """
+        return ThumbnailCache().get(self.id, self._decrypt_thumbnail)
+
+    @property
+    def original(self) -> bytes:
+        """ Decrypted uploaded file. It is the content itself unless the original was kept when normalizing it. """
+        return ImageCipher().decrypt(BlobStore().get(self.original_hash)) if self.original_hash else self.content
+
+    @property
+    def content_type(self) -> str:
+        return choices.renditions.content_type(self.format)
 
     @property
     def content_as_base64(self) -> str:
-        return binary_field_to_string(self._content_base64_and_encrypted, decrypt=True)
+        return base64.b64encode(self.content).decode('utf-8')
+
+    @property
+    def thumbnail_as_base64(self) -> Optional[str]:
+        thumbnail = self.thumbnail
+        return base64.b64encode(thumbnail).decode('utf-8') if thumbnail else None
 
     @property
-    def thumbnail_as_base64(self) -> str:
-        return binary_field_to_string(self._thumbnail_base64_and_encrypted, decrypt=True)
+    def blob_hashes(self) -> List[str]:
+        return [blob_hash for blob_hash in (self.content_hash, self.thumbnail_hash, self.original_hash) if blob_hash]
+
+    @property
+    def is_in_blob_store(self) -> bool:
+        return self.content_hash is not None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == choices.processing.READY[0]
 
     def can_edit_and_delete(self, user: User) -> bool:
         return self.clinical_session.can_edit_and_delete(user)
 
     def can_view(self, user: User) -> bool:
         return self.clinical_session.can_view(user)
+
+    def generate_thumbnail(self) -> None:
+        thumbnail = ThumbnailGenerator.from_raw(self.content).thumbnail_raw
+        encrypted_thumbnail = ImageCipher().encrypt(thumbnail)
+        self.thumbnail_hash = BlobStore().put(encrypted_thumbnail)
+        self.thumbnail_size = len(encrypted_thumbnail)
+        ThumbnailCache().invalidate(self.id)
+
+    def normalize(self) -> None:
+        """ Replaces the content with the normalized image, keeping the uploaded file as the original if IMAGE_INGEST_KEEP_ORIGINALS is set.
+            Images that cannot be decoded are left as they are. Renditions of the uploaded file are deleted. """
+        # We need to use dynamic imports to avoid circular imports.
+        from .image_rendition import ImageRendition
+        ingest = ImageIngest(self.content)
+        if not ingest.is_normalized:
+            return
+        if settings.IMAGE_INGEST_KEEP_ORIGINALS:
+            self.original_hash, self.original_size = self.content_hash, self.content_size
+        encrypted_content = ImageCipher().encrypt(ingest.content)
+        self.content_hash, self.content_size = BlobStore().put(encrypted_content), len(encrypted_content)
+        self.format, self.normalized = ingest.format, True
+        ImageRendition.objects.filter(image_id=self.id).delete()
+
+    def process(self) -> None:
+        """ Normalizes the image if IMAGE_INGEST_ENABLED is set, and generates the thumbnail and the renditions listed on
+            IMAGE_RENDITIONS_GENERATED_ON_UPLOAD. Images already being processed by another process (the pool or the cron job) are skipped. """
+        # We need to use dynamic imports to avoid circular imports.
+        from .image_rendition import ImageRendition
+        if not Image.objects.claim(self.id):
+            logging.info(f'Image {self.id} is already being processed.')
+            return
+        previous_thumbnail_hash, previous_content_hash = self.thumbnail_hash, self.content_hash
+        try:
+            if settings.IMAGE_INGEST_ENABLED and not self.normalized and self.is_in_blob_store:
+                self.normalize()
+            self.generate_thumbnail()
+            for size, format_ in settings.IMAGE_RENDITIONS_GENERATED_ON_UPLOAD:
+                ImageRendition.objects.get_or_generate(self, size, format_)
+            self.status = choices.processing.READY[0]
+        except Exception:
+            logging.exception(f'Failed to process image {self.id}.')
+            self.status = choices.processing.FAILED[0]
+        self.processing_started_at = None
+        # Only update the row if it is still there: the image may have been deleted while it was processed.
+        # The content is only written when it was normalized, swapping the uploaded file for the normalized image.
+        fields = self.STORED_FIELDS if self.content_hash != previous_content_hash else ('thumbnail_hash', 'thumbnail_size')
+        updated = Image.objects.filter(id=self.id).update(**{field: getattr(self, field) for field in fields},
+                                                          status=self.status, processing_started_at=None)
+        new_blob_hashes = [blob_hash for blob_hash in (self.thumbnail_hash, self.content_hash)
+                           if blob_hash and blob_hash not in (previous_thumbnail_hash, previous_content_hash)]
+        if not updated:
+            logging.info(f'Image {self.id} was deleted while being processed.')
+            delete_unreferenced_blobs_on_commit(new_blob_hashes)
+        else:
+            # The uploaded file is still referenced as the original when it is kept, and by duplicates not processed yet.
+            delete_unreferenced_blobs_on_commit([blob_hash for blob_hash in (previous_thumbnail_hash, previous_content_hash)
+                                                 if blob_hash and blob_hash not in self.blob_hashes])
+
+    def move_to_blob_store(self, blob_store: Optional[BlobStore] = None) -> None:
+        """ Moves the content and thumbnail from the legacy columns to the blob store. """
+        if self.is_in_blob_store:
+            return
+        blob_store = blob_store or BlobStore()
+        encrypted_content = bytes(self._content_base64_and_encrypted)
+        encrypted_thumbnail = bytes(self._thumbnail_base64_and_encrypted)
+        self.content_hash = blob_store.put(encrypted_content)
+        self.content_size = len(encrypted_content)
+        self.thumbnail_hash = blob_store.put(encrypted_thumbnail)
+        self.thumbnail_size = len(encrypted_thumbnail)
+        self._content_base64_and_encrypted = None
+        self._thumbnail_base64_and_encrypted = None
+        self.save(update_fields=['content_hash', 'content_size', 'thumbnail_hash', 'thumbnail_size',
+                                 '_content_base64_and_encrypted', '_thumbnail_base64_and_encrypted'])
+
+    def rotate_encryption(self) -> int:
+        """ Re-encrypts the content, the original and the thumbnail with the primary key, on the binary envelope format.
+            Each blob is re-encrypted once, and every image referencing it is updated to the new one, so duplicates keep sharing it.
+            Their renditions are deleted instead: they will be generated again, with the new key, when requested.
+            Lock the images sharing blobs with this one before calling it. Returns the amount of updated images,
+            0 if every blob of the image was already encrypted with the primary key. """
+        # We need to use dynamic imports to avoid circular imports.
+        from .image_rendition import ImageRendition
+        self.move_to_blob_store()
+        cipher = ImageCipher()
+        blob_store = BlobStore()
+        obsolete_blob_hashes, reencrypted_image_ids = [], set()
+        for hash_field, size_field in (('content_hash', 'content_size'), ('original_hash', 'original_size'), ('thumbnail_hash', 'thumbnail_size')):
+            blob_hash = getattr(self, hash_field)
+            if not blob_hash:
+                continue
+            encrypted_blob = blob_store.get(blob_hash)
+            if cipher.is_encrypted_with_primary_key(encrypted_blob):
+                continue
+            encrypted_blob = cipher.rotate(encrypted_blob)
+            setattr(self, hash_field, blob_store.put(encrypted_blob))
+            setattr(self, size_field, len(encrypted_blob))
+            sharing_images = Image.objects.filter(**{hash_field: blob_hash})
+            reencrypted_image_ids.update(sharing_images.values_list('id', flat=True))
+            sharing_images.update(**{hash_field: getattr(self, hash_field), size_field: len(encrypted_blob)})
+            obsolete_blob_hashes.append(blob_hash)
+        delete_unreferenced_blobs_on_commit(obsolete_blob_hashes)
+        ImageRendition.objects.filter(image_id__in=reencrypted_image_ids).delete()
+        return len(reencrypted_image_ids)
+
+    def _decrypt_thumbnail(self) -> Optional[bytes]:
+        encrypted_thumbnail = self.encrypted_thumbnail
+        return ImageCipher().decrypt(encrypted_thumbnail) if encrypted_thumbnail else None
+
+    @staticmethod
+    def _read_blob_or_column(blob_hash: Optional[str], column: Optional[memoryview]) -> bytes:
+        return BlobStore().get(blob_hash) if blob_hash else column
+
+
+def delete_unreferenced_blobs_on_commit(blob_hashes: List[str]) -> None:
+    def delete_blobs() -> None:
+        blob_store = BlobStore()
+        for blob_hash in blob_hashes:
+            if not Image.objects.referencing_blob(blob_hash).exists():
+                blob_store.delete(blob_hash)
+    # Files are not transactional: wait until the rows stop referencing them before removing them.
+    transaction.on_commit(delete_blobs)
+
+
+# Signals
+@receiver(post_delete, sender=Image)
+def delete_unreferenced_blobs(sender: type, instance: Image, **kwargs: dict) -> None:
+    delete_unreferenced_blobs_on_commit(instance.blob_hashes)
+
+
+@receiver(post_delete, sender=Image)
+def invalidate_cached_thumbnail(sender: type, instance: Image, **kwargs: dict) -> None:
+    ThumbnailCache().invalidate(instance.id)
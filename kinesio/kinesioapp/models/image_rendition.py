@@ -0,0 +1,92 @@
+from __future__ import annotations
+from django.db import models, transaction, IntegrityError
+from django.db.models import Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.conf import settings
+from typing import Optional
+
+from .. import choices
+from .image import Image
+from ..utils.blob_store import BlobStore
+from ..utils.crypto import ImageCipher
+from ..utils.thumbnail import ThumbnailGenerator
+
+
+class ImageRenditionQuerySet(models.QuerySet):
+    def get_or_generate(self, image: Image, size: int, format_: str) -> ImageRendition:
+        rendition = self.filter(image=image, size=size, format=format_).first()
+        if rendition is not None:
+            rendition.touch()
+            return rendition
+        rendition = self._generate(image, size, format_)
+        # The new rendition is about to be served, so make room for it by evicting the other ones.
+        budget = settings.IMAGE_RENDITIONS_DISK_BUDGET - rendition.blob_size
+        ImageRendition.objects.exclude(id=rendition.id).evict_least_recently_used(budget)
+        return rendition
+
+    def _generate(self, image: Image, size: int, format_: str) -> ImageRendition:
+        content = ThumbnailGenerator.from_raw(image.content, size=size, format_=format_,
+                                              quality=settings.IMAGE_RENDITION_QUALITY).thumbnail_raw
+        encrypted_content = ImageCipher().encrypt(content)
+        blob_store = BlobStore(settings.IMAGE_RENDITIONS_ROOT)
+        blob_hash = blob_store.put(encrypted_content)
+        try:
+            with transaction.atomic():
+                return self.create(image=image, size=size, format=format_,
+                                   blob_hash=blob_hash, blob_size=len(encrypted_content))
+        except IntegrityError:
+            # Another request generated the same rendition meanwhile. Keep that one.
+            blob_store.delete(blob_hash)
+            return self.get(image=image, size=size, format=format_)
+
+    def total_size(self) -> int:
+        return self.aggregate(total_size=Sum('blob_size'))['total_size'] or 0
+
+    def evict_least_recently_used(self, budget: Optional[int] = None) -> int:
+        """ Deletes the least recently used renditions until their total size fits in the budget.
+            Returns how many renditions were deleted. """
+        budget = settings.IMAGE_RENDITIONS_DISK_BUDGET if budget is None else budget
+        excess = self.total_size() - budget
+        evicted = 0
+        for rendition in self.order_by('last_accessed', 'id').iterator():
+            if excess <= 0:
+                break
+            excess -= rendition.blob_size
+            rendition.delete()
+            evicted += 1
+        return evicted
+
+
+class ImageRendition(models.Model):
+    """ Resized copy of an image, generated the first time it is requested. Renditions can be evicted at any time. """
+    class Meta:
+        unique_together = ('image', 'size', 'format')
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='renditions')
+    size = models.PositiveSmallIntegerField()
+    format = models.CharField(max_length=4, choices=choices.renditions.get())
+    blob_hash = models.CharField(max_length=64)
+    blob_size = models.PositiveIntegerField()
+    last_accessed = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = ImageRenditionQuerySet.as_manager()
+
+    @property
+    def content(self) -> bytes:
+        encrypted_content = BlobStore(settings.IMAGE_RENDITIONS_ROOT).get(self.blob_hash)
+        return ImageCipher().decrypt(encrypted_content)
+
+    @property
+    def content_type(self) -> str:
+        return choices.renditions.content_type(self.format)
+
+    def touch(self) -> None:
+        self.last_accessed = timezone.now()
+        ImageRendition.objects.filter(id=self.id).update(last_accessed=self.last_accessed)
+
+
+# Signals
+@receiver(post_delete, sender=ImageRendition)
+def delete_rendition_blob(sender: type, instance: ImageRendition, **kwargs: dict) -> None:
+    transaction.on_commit(lambda: BlobStore(settings.IMAGE_RENDITIONS_ROOT).delete(instance.blob_hash))
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from ffmpy import FFmpeg
+from PIL import Image as PILImage
+from typing import List, Optional
+import hashlib
+import logging
+import os
+import tempfile
+
+from .. import choices
+from users.models import Patient
+from .image import Image
+from ..utils.blob_store import BlobStore
+from ..utils.crypto import ImageCipher
+from ..utils.django_server import DjangoServerConfiguration
+from ..utils.ffmpeg import run_ffmpeg
+from ..utils.image_processing import ImageProcessingPool
+from ..utils.thumbnail import ThumbnailGenerator
+
+
+class TimelapseQuerySet(models.QuerySet):
+    def get_or_render(self, patient: Patient, tag: str) -> Timelapse:
+        """ Returns the timelapse of the images of the patient with the tag.
+            It is rendered in the background when it is missing, when those images changed since it was rendered,
+            or when it failed to be rendered more than TIMELAPSE_RETRY_MINUTES ago. """
+        tag = choices.images.normalize(tag)
+        images_key = Timelapse.images_key_of(list(Timelapse.images_of(patient, tag).values_list('id', flat=True)))
+        timelapse, created = self.get_or_create(patient=patient, tag=tag, defaults={'images_key': images_key})
+        if created or timelapse.images_key != images_key or timelapse.can_be_retried:
+            timelapse.images_key = images_key
+            timelapse.status = choices.processing.PENDING[0]
+            timelapse.save(update_fields=['images_key', 'status'])
+            ImageProcessingPool().submit_timelapse(timelapse)
+        return timelapse
+
+
+class Timelapse(models.Model):
+    """ MP4 video of the images of a patient with a tag, ordered by session. It is stored encrypted, like the images. """
+    class Meta:
+        unique_together = ('patient', 'tag')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='timelapses')
+    tag = models.CharField(max_length=1, choices=choices.images.get())
+    # Identifies the images the timelapse was rendered from, to know when it has to be rendered again.
+    images_key = models.CharField(max_length=64)
+    status = models.CharField(max_length=1, choices=choices.processing.get(), default=choices.processing.PENDING[0])
+    blob_hash = models.CharField(max_length=64, null=True, default=None)
+    blob_size = models.PositiveIntegerField(null=True, default=None)
+    # When it was last rendered, or failed to be.
+    rendered_at = models.DateTimeField(null=True, default=None)
+
+    objects = TimelapseQuerySet.as_manager()
+
+    @staticmethod
+    def images_of(patient: Patient, tag: str) -> models.QuerySet:
+        # Images that failed to be processed cannot be decoded, so they are left out of the video.
+        images = Image.objects.filter(clinical_session__patient=patient, tag=choices.images.normalize(tag))
+        return images.exclude(status=choices.processing.FAILED[0]).order_by('clinical_session__date', 'id')
+
+    @staticmethod
+    def images_key_of(image_ids: List[int]) -> str:
+        return hashlib.sha256(','.join(str(image_id) for image_id in image_ids).encode('utf-8')).hexdigest()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == choices.processing.READY[0]
+
+    @property
+    def is_failed(self) -> bool:
+        return self.status == choices.processing.FAILED[0]
+
+    @property
+    def can_be_retried(self) -> bool:
+        retry_after = timezone.now() - timedelta(minutes=settings.TIMELAPSE_RETRY_MINUTES)
+        return self.is_failed and (self.rendered_at is None or self.rendered_at < retry_after)
+
+    @property
+    def path(self) -> str:
+        return f'/api/v1/timelapse/{self.patient.user.id}/{self.tag}/video'
+
+    @property
+    def url(self) -> Optional[str]:
+        return f'http://{DjangoServerConfiguration().base_url}{self.path}' if self.is_ready else None
+
+    @property
+    def content(self) -> bytes:
+        return ImageCipher().decrypt(BlobStore(settings.TIMELAPSE_ROOT).get(self.blob_hash))
+
+    def _frame(self, image: Image) -> Optional[bytes]:
+        """ The image scaled down to a frame, or None if it cannot be decoded: a single bad image does not spoil the video. """
+        try:
+            return ThumbnailGenerator.from_raw(image.content, size=settings.TIMELAPSE_SIZE, quality=90).thumbnail_raw
+        except (OSError, PILImage.DecompressionBombError, ValueError):
+            logging.warning(f'Image {image.id} could not be added to timelapse {self.id}.', exc_info=True)
+            return None
+
+    def rotate_encryption(self) -> bool:
+        """ Re-encrypts the video with the primary key. Returns False if it was already encrypted with it. """
+        cipher, blob_store = ImageCipher(), BlobStore(settings.TIMELAPSE_ROOT)
+        encrypted_content = blob_store.get(self.blob_hash)
+        if cipher.is_encrypted_with_primary_key(encrypted_content):
+            return False
+        obsolete_blob_hash = self.blob_hash
+        encrypted_content = cipher.rotate(encrypted_content)
+        self.blob_hash, self.blob_size = blob_store.put(encrypted_content), len(encrypted_content)
+        self.save(update_fields=['blob_hash', 'blob_size'])
+        transaction.on_commit(lambda: blob_store.delete(obsolete_blob_hash))
+        return True
+
+    def process(self) -> None:
+        try:
+            self.render()
+            self.status = choices.processing.READY[0]
+        except Exception:
+            logging.exception(f'Timelapse {self.id} could not be rendered.')
+            self.status = choices.processing.FAILED[0]
+        self.rendered_at = timezone.now()
+        self.save(update_fields=['images_key', 'status', 'blob_hash', 'blob_size', 'rendered_at'])
+
+    def render(self) -> None:
+        images = list(Timelapse.images_of(self.patient, self.tag).with_content())
+        # Frames are scaled down before being piped to ffmpeg, so the whole set fits in memory.
+        frames = b''.join(filter(None, (self._frame(image) for image in images)))
+        if not frames:
+            raise ValueError(f'None of the images of timelapse {self.id} could be decoded.')
+        size = settings.TIMELAPSE_SIZE
+        with tempfile.TemporaryDirectory() as directory:
+            output_file_path = os.path.join(directory, 'timelapse.mp4')
+            command = FFmpeg(global_options=settings.FFMPEG_GLOBAL_OPTIONS,
+                             inputs={'pipe:0': ['-f', 'image2pipe', '-c:v', 'mjpeg',
+                                                '-framerate', f'1/{settings.TIMELAPSE_SECONDS_PER_IMAGE}']},
+                             outputs={output_file_path: ['-vf', f'scale={size}:{size}:force_original_aspect_ratio=decrease,'
+                                                                f'pad={size}:{size}:(ow-iw)/2:(oh-ih)/2,format=yuv420p',
+                                                         '-r', '25', '-c:v', 'libx264', '-movflags', '+faststart']})
+            run_ffmpeg(command, settings.TIMELAPSE_RENDER_TIMEOUT, input_data=frames)
+            with open(output_file_path, 'rb') as output_file:
+                encrypted_content = ImageCipher().encrypt(output_file.read())
+        obsolete_blob_hash = self.blob_hash
+        self.blob_hash = BlobStore(settings.TIMELAPSE_ROOT).put(encrypted_content)
+        self.blob_size = len(encrypted_content)
+        # The images may have changed while rendering: keep the key of the ones on the video.
+        self.images_key = Timelapse.images_key_of([image.id for image in images])
+        if obsolete_blob_hash:
+            transaction.on_commit(lambda: BlobStore(settings.TIMELAPSE_ROOT).delete(obsolete_blob_hash))
+
+
+# Signals
+@receiver(post_delete, sender=Timelapse)
+def delete_timelapse_blob(sender: type, instance: Timelapse, **kwargs: dict) -> None:
+    if instance.blob_hash:
+        transaction.on_commit(lambda: BlobStore(settings.TIMELAPSE_ROOT).delete(instance.blob_hash))
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def invalidate_timelapse(sender: type, instance: Image, created: bool = True, **kwargs: dict) -> None:
+    # Only adding or removing images changes a timelapse, not updating them. It is rendered again on its next request.
+    if created:
+        Timelapse.objects.filter(patient__sessions__id=instance.clinical_session_id, tag=instance.tag).update(images_key='')
@@ -1,26 +1,94 @@
 from __future__ import annotations
 from django.db import models
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from ffmpy import FFmpeg
 from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from typing import List, Optional, Tuple
+import logging
+import math
+import os
+import shutil
 
+from .. import choices
 from kinesioapp.utils.django_server import DjangoServerConfiguration
+from ..utils.ffmpeg import run_ffmpeg
+from ..utils.image_processing import ImageProcessingPool
+from ..utils.video_metadata import METADATA_FIELDS, read_metadata
 from users.models import User, Medic
 
 
+# Thumbnails are saved next to their video, with the name of the video and this suffix
+THUMBNAIL_SUFFIX = '_thumb.jpg'
+
+
+def vtt_timestamp(seconds: float) -> str:
+    milliseconds = round(seconds * 1000)
+    return f'{milliseconds // 3600000:02}:{milliseconds // 60000 % 60:02}:{milliseconds // 1000 % 60:02}.{milliseconds % 1000:03}'
+
+
 class VideoQuerySet(models.QuerySet):
     def accessible_by(self, user: User) -> models.QuerySet:
         return self.filter(owner=user.related_medic.medic)
 
     def create(self, medic_id: int, **kwargs) -> models.Model:
-        video = super().create(owner=Medic.objects.get(id=medic_id), **kwargs)
-        video.generate_thumbnail()
+        # Only the file is saved here. The thumbnail is generated in the background, so ffmpeg never blocks the upload.
+        video = super().create(owner=Medic.objects.get(id=medic_id), status=choices.processing.PENDING[0], **kwargs)
+        ImageProcessingPool().submit_video(video)
         return video
 
+    def pending(self) -> VideoQuerySet:
+        return self.filter(status=choices.processing.PENDING[0])
+
+    def claim(self, video_id: int) -> bool:
+        """ Marks the pending video as being processed, unless another process is already processing it.
+            The claims of processes that crashed or were killed expire after VIDEO_PROCESSING_CLAIM_MINUTES. """
+        now = timezone.now()
+        expired = now - timedelta(minutes=settings.VIDEO_PROCESSING_CLAIM_MINUTES)
+        unclaimed = Q(processing_started_at__isnull=True) | Q(processing_started_at__lt=expired)
+        # A single UPDATE, so only one of the processes trying at the same time gets it.
+        return self.pending().filter(unclaimed, id=video_id).update(processing_started_at=now) == 1
+
+    def of_media_file(self, path: str) -> Tuple[Optional[Video], Optional[str]]:
+        """ Returns the video the media file belongs to and the path of the file on disk, or None and None.
+            The path is the normalized URL of the file, relative to MEDIA_URL. Videos own their upload, its thumbnail, their HLS files and their previews. """
+        # Files generated from a video are saved on a folder named after its ID.
+        for url, root in ((settings.VIDEO_HLS_URL, settings.VIDEO_HLS_ROOT), (settings.VIDEO_PREVIEWS_URL, settings.VIDEO_PREVIEWS_ROOT)):
+            prefix = url[len(settings.MEDIA_URL):]
+            if path.startswith(prefix):
+                video_id, _, file_name = path[len(prefix):].partition('/')
+                video = self.filter(id=video_id).first() if video_id.isdigit() and file_name else None
+                return (video, os.path.join(root, video_id, file_name)) if video is not None else (None, None)
+        content_name = path[:-len(THUMBNAIL_SUFFIX)] if path.endswith(THUMBNAIL_SUFFIX) else path
+        video = self.filter(content=content_name).first()
+        return (video, os.path.join(settings.MEDIA_ROOT, path)) if video is not None else (None, None)
+
 
 class Video(models.Model):
     name = models.CharField(max_length=255)
     content = models.FileField(upload_to='')
     owner = models.ForeignKey(Medic, on_delete=models.CASCADE, related_name='videos')
+    # The thumbnail of new videos is generated in the background. Older videos are already processed.
+    status = models.CharField(max_length=1, choices=choices.processing.get(), default=choices.processing.READY[0])
+    # Processing attempts, counted before each one starts, so videos crashing the worker are not retried forever.
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When the process processing the video claimed it, or started its last attempt. Null if no process is processing it.
+    processing_started_at = models.DateTimeField(null=True, default=None)
+    # Path of the HLS master playlist, relative to VIDEO_HLS_ROOT. Videos uploaded before HLS only have their file.
+    hls_playlist = models.CharField(max_length=255, null=True, default=None)
+    # Sprite sheet and WebVTT track of preview frames, for scrubbing. Only videos with a known duration have them.
+    has_previews = models.BooleanField(default=False)
+    # Metadata of the file, read when the video is processed. Older videos get it from the backfill_video_metadata command.
+    # The values read by ffprobe are null if it could not read them. Duration in seconds, bitrate in bits per second.
+    duration = models.FloatField(null=True, default=None)
+    width = models.PositiveIntegerField(null=True, default=None)
+    height = models.PositiveIntegerField(null=True, default=None)
+    codec = models.CharField(max_length=32, null=True, default=None)
+    bitrate = models.PositiveIntegerField(null=True, default=None)
+    content_hash = models.CharField(max_length=64, null=True, default=None)
 
     objects = VideoQuerySet.as_manager()
 
@@ -29,19 +97,167 @@ class Video(models.Model):
         return f'http://{DjangoServerConfiguration().base_url}{self.content.url}'
 
     @property
-    def thumbnail_url(self) -> str:
-        return f'{self.url}_thumb.jpg'
+    def thumbnail_url(self) -> Optional[str]:
+        return f'{self.url}{THUMBNAIL_SUFFIX}' if self.is_ready else None
+
+    @property
+    def streaming_url(self) -> Optional[str]:
+        if not self.is_ready or self.hls_playlist is None:
+            return None
+        return f'http://{DjangoServerConfiguration().base_url}{settings.VIDEO_HLS_URL}{self.hls_playlist}'
+
+    @property
+    def previews_url(self) -> Optional[str]:
+        if not self.is_ready or not self.has_previews:
+            return None
+        return f'http://{DjangoServerConfiguration().base_url}{settings.VIDEO_PREVIEWS_URL}{self.id}/previews.vtt'
+
+    @property
+    def sprite_url(self) -> Optional[str]:
+        if not self.is_ready or not self.has_previews:
+            return None
+        return f'http://{DjangoServerConfiguration().base_url}{settings.VIDEO_PREVIEWS_URL}{self.id}/sprite.jpg'
+
+    @property
+    def previews_directory(self) -> str:
+        return os.path.join(settings.VIDEO_PREVIEWS_ROOT, str(self.id))
+
+    @property
+    def hls_directory(self) -> str:
+        return os.path.join(settings.VIDEO_HLS_ROOT, str(self.id))
+
+    @property
+    def hls_renditions(self) -> List[Tuple[int, int]]:
+        """ Renditions of VIDEO_HLS_RENDITIONS not taller than the video, or only the smallest one for smaller videos.
+            Videos whose height is not known get all of them. """
+        renditions = sorted(settings.VIDEO_HLS_RENDITIONS)
+        if self.height is None:
+            return renditions
+        return [rendition for rendition in renditions if rendition[0] <= self.height] or renditions[:1]
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == choices.processing.READY[0]
 
     def can_edit_and_delete(self, user: User) -> bool:
         return self.owner == user.medic
 
     def can_view(self, user: User) -> bool:
-        return self.owner == user.related_medic
+        return self.owner.user == user.related_medic
+
+    def process(self) -> None:
+        """ Reads the metadata of the file, and generates the thumbnail, the HLS renditions and the previews,
+            retrying up to VIDEO_PROCESSING_MAX_ATTEMPTS times in total.
+            Videos already being processed by another process (the pool or the cron job) are skipped. """
+        if not Video.objects.claim(self.id):
+            logging.info(f'Video {self.id} is already being processed.')
+            return
+        # Attempts may have been made since the video was read.
+        self.refresh_from_db(fields=['attempts'])
+        while self.attempts < settings.VIDEO_PROCESSING_MAX_ATTEMPTS:
+            self.attempts += 1
+            # Each attempt renews the claim, so long videos are not taken over while they are still being processed.
+            self.processing_started_at = timezone.now()
+            self.save(update_fields=['attempts', 'processing_started_at'])
+            try:
+                self.read_metadata()
+                self.generate_thumbnail()
+                self.generate_hls()
+                self.generate_previews()
+                self.status = choices.processing.READY[0]
+                break
+            except Exception:
+                logging.exception(f'Failed to process video {self.id} (attempt {self.attempts}).')
+        else:
+            self.status = choices.processing.FAILED[0]
+        self.processing_started_at = None
+        self.save(update_fields=['status', 'processing_started_at', 'hls_playlist', 'has_previews', *METADATA_FIELDS])
+
+    def read_metadata(self) -> None:
+        for field, value in read_metadata(self.content.path).items():
+            setattr(self, field, value)
 
     def generate_thumbnail(self) -> None:
         video_file_path = self.content.path
-        output_file_path = f'{video_file_path}_thumb.jpg'
+        output_file_path = f'{video_file_path}{THUMBNAIL_SUFFIX}'
+        # '-y' overwrites the thumbnail left by a previous attempt.
         command = FFmpeg(global_options=settings.FFMPEG_GLOBAL_OPTIONS,
                          inputs={video_file_path: None},
-                         outputs={output_file_path: ['-ss', '00:00:00', '-vframes', '1']})
-        command.run()
+                         outputs={output_file_path: ['-ss', '00:00:00', '-vframes', '1', '-y']})
+        run_ffmpeg(command, settings.VIDEO_PROCESSING_TIMEOUT)
+
+    def generate_hls(self) -> None:
+        """ Transcodes the video to each of its HLS renditions, each one with its own playlist, and lists them on a master playlist.
+            Each rendition is a separate ffmpeg run, so each one gets the whole timeout and audio can be optional. """
+        shutil.rmtree(self.hls_directory, ignore_errors=True)
+        variants = []
+        for height, video_kbps in self.hls_renditions:
+            name = f'{height}p'
+            directory = os.path.join(self.hls_directory, name)
+            os.makedirs(directory)
+            segment_seconds = settings.VIDEO_HLS_SEGMENT_SECONDS
+            command = FFmpeg(global_options=settings.FFMPEG_GLOBAL_OPTIONS,
+                             inputs={self.content.path: None},
+                             outputs={os.path.join(directory, 'index.m3u8'): [
+                                 '-y', '-map', '0:v:0', '-map', '0:a:0?',
+                                 # Never upscale: small uploads get renditions of their own height.
+                                 '-vf', f'scale=-2:min({height}\\,ih)',
+                                 '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+                                 '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps * 3 // 2}k', '-bufsize', f'{video_kbps * 2}k',
+                                 # Keyframes on every segment boundary, so every segment starts playing on its own.
+                                 '-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})',
+                                 '-c:a', 'aac', '-b:a', f'{settings.VIDEO_HLS_AUDIO_KBPS}k', '-ac', '2',
+                                 '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+                                 '-hls_segment_filename', os.path.join(directory, 'segment_%03d.ts')]})
+            run_ffmpeg(command, settings.VIDEO_PROCESSING_TIMEOUT)
+            stream_info = f'BANDWIDTH={(video_kbps + settings.VIDEO_HLS_AUDIO_KBPS) * 1000}'
+            if self.width and self.height:
+                # Players pick the rendition that fits their screen right away, instead of trying them.
+                stream_info += f',RESOLUTION={self.rendition_width(height)}x{min(height, self.height)}'
+            variants.append((name, stream_info))
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+        for name, stream_info in variants:
+            lines += [f'#EXT-X-STREAM-INF:{stream_info}', f'{name}/index.m3u8']
+        with open(os.path.join(self.hls_directory, 'master.m3u8'), 'w') as master_playlist:
+            master_playlist.write('\n'.join(lines) + '\n')
+        self.hls_playlist = f'{self.id}/master.m3u8'
+
+    def generate_previews(self) -> None:
+        """ Extracts VIDEO_PREVIEW_FRAMES frames, one from the middle of each equal interval of the video, in a single ffmpeg run.
+            They are tiled on a sprite sheet, and a WebVTT track maps each interval to its frame on it. """
+        shutil.rmtree(self.previews_directory, ignore_errors=True)
+        self.has_previews = False
+        if not self.duration or not self.width or not self.height:
+            return
+        os.makedirs(self.previews_directory)
+        frames, columns = settings.VIDEO_PREVIEW_FRAMES, settings.VIDEO_PREVIEW_COLUMNS
+        rows = math.ceil(frames / columns)
+        interval = self.duration / frames
+        frame_height = min(settings.VIDEO_PREVIEW_HEIGHT, self.height)
+        frame_width = self.rendition_width(frame_height)
+        command = FFmpeg(global_options=settings.FFMPEG_GLOBAL_OPTIONS,
+                         inputs={self.content.path: ['-ss', f'{interval / 2:.3f}']},
+                         outputs={os.path.join(self.previews_directory, 'sprite.jpg'): [
+                             '-y', '-an', '-vf', f'fps=1/{interval:.6f},scale={frame_width}:{frame_height},tile={columns}x{rows}',
+                             '-frames:v', '1', '-q:v', str(settings.VIDEO_PREVIEW_QUALITY)]})
+        run_ffmpeg(command, settings.VIDEO_PROCESSING_TIMEOUT)
+        lines = ['WEBVTT', '']
+        for frame in range(frames):
+            x, y = frame % columns * frame_width, frame // columns * frame_height
+            lines += [f'{vtt_timestamp(frame * interval)} --> {vtt_timestamp((frame + 1) * interval)}',
+                      f'sprite.jpg#xywh={x},{y},{frame_width},{frame_height}', '']
+        with open(os.path.join(self.previews_directory, 'previews.vtt'), 'w') as track:
+            track.write('\n'.join(lines))
+        self.has_previews = True
+
+    def rendition_width(self, height: int) -> int:
+        # As ffmpeg scales it with '-2': keeping the aspect ratio, rounded to an even width.
+        height = min(height, self.height)
+        return round(self.width * height / self.height / 2) * 2
+
+
+# Signals
+@receiver(post_delete, sender=Video)
+def delete_generated_files(sender: type, instance: Video, **kwargs: dict) -> None:
+    shutil.rmtree(instance.hls_directory, ignore_errors=True)
+    shutil.rmtree(instance.previews_directory, ignore_errors=True)
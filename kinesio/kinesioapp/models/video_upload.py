@@ -0,0 +1,127 @@
+from __future__ import annotations
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.conf import settings
+from datetime import timedelta
+from typing import BinaryIO
+import os
+import shutil
+import tempfile
+
+from .video import Video
+from users.models import User, Medic
+
+
+class InvalidOffsetException(Exception):
+    pass
+
+
+class ChunkTooLargeException(Exception):
+    pass
+
+
+class IncompleteUploadException(Exception):
+    pass
+
+
+class VideoUploadQuerySet(models.QuerySet):
+    def accessible_by(self, user: User) -> models.QuerySet:
+        return self.filter(owner__user=user)
+
+    def abandoned(self) -> VideoUploadQuerySet:
+        return self.filter(last_updated__lt=timezone.now() - timedelta(hours=settings.VIDEO_UPLOAD_EXPIRATION_HOURS))
+
+
+class VideoUpload(models.Model):
+    """ Video being uploaded in chunks. Chunks are appended to a file on disk, in order, so a dropped connection only
+        loses the chunk being sent: the client asks for the offset and resumes from there. Once the whole file is
+        received, it is finalized into a Video. """
+    name = models.CharField(max_length=255)
+    file_name = models.CharField(max_length=255)
+    owner = models.ForeignKey(Medic, on_delete=models.CASCADE, related_name='video_uploads')
+    # Sizes go up to VIDEO_UPLOAD_MAX_SIZE, above the range of integer columns: use 64 bits.
+    size = models.BigIntegerField()
+    # Bytes received so far. The next chunk has to start here.
+    offset = models.BigIntegerField(default=0)
+    last_updated = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = VideoUploadQuerySet.as_manager()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.VIDEO_UPLOADS_ROOT, f'{self.id}.part')
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset == self.size
+
+    def can_edit_and_delete(self, user: User) -> bool:
+        return self.owner.user == user
+
+    def can_view(self, user: User) -> bool:
+        return self.can_edit_and_delete(user)
+
+    def write_chunk(self, offset: int, stream: BinaryIO, length: int) -> None:
+        """ Writes the chunk read from the stream at the offset, which has to be the offset of the upload.
+            The chunk is read into a temporary file first, since the client may send it slowly. Only then is the row
+            locked, to check the offset and append the chunk, so two requests sending the same chunk cannot both write it. """
+        if length > settings.VIDEO_UPLOAD_CHUNK_MAX_SIZE:
+            raise ChunkTooLargeException(f'Chunk of {length} bytes for upload {self.id}.')
+        os.makedirs(settings.VIDEO_UPLOADS_ROOT, exist_ok=True)
+        with tempfile.TemporaryFile(dir=settings.VIDEO_UPLOADS_ROOT) as chunk_file:
+            received = 0
+            while received < length:
+                chunk = stream.read(min(settings.STREAMING_CHUNK_SIZE, length - received))
+                if not chunk:
+                    break
+                chunk_file.write(chunk)
+                received += len(chunk)
+            chunk_file.seek(0)
+            with transaction.atomic():
+                upload = VideoUpload.objects.select_for_update().get(id=self.id)
+                if offset != upload.offset or offset + length > upload.size:
+                    raise InvalidOffsetException(f'Chunk of {length} bytes at {offset} for upload {self.id} at {upload.offset}.')
+                with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as file:
+                    file.seek(offset)
+                    shutil.copyfileobj(chunk_file, file, settings.STREAMING_CHUNK_SIZE)
+                    # Drop anything left by a chunk that failed before its offset was saved.
+                    file.truncate()
+                upload.offset += received
+                upload.last_updated = timezone.now()
+                upload.save(update_fields=['offset', 'last_updated'])
+        self.offset, self.last_updated = upload.offset, upload.last_updated
+
+    def finalize(self) -> Video:
+        """ Creates the video from the received file, exactly as if it was uploaded at once, and deletes the upload.
+            The row is locked meanwhile, so when it is finalized twice at the same time only one video is created:
+            the other one raises VideoUpload.DoesNotExist, since the upload is gone when it gets the lock. """
+        content_path = None
+        try:
+            with transaction.atomic():
+                upload = VideoUpload.objects.select_for_update().get(id=self.id)
+                self.offset = upload.offset
+                if not upload.is_complete:
+                    raise IncompleteUploadException(f'Upload {self.id} has {upload.offset} of {upload.size} bytes.')
+                # The file is moved, not copied, into the media folder. Video files are saved there with their file name.
+                # It has to be there before the video is created, as the video is processed from it.
+                content_name = default_storage.get_available_name(default_storage.get_valid_name(upload.file_name))
+                content_path = default_storage.path(content_name)
+                shutil.move(upload.path, content_path)
+                video = Video.objects.create(name=upload.name, content=content_name, medic_id=upload.owner_id)
+                upload.delete()
+        except BaseException:
+            # Files are not transactional: if the video was not saved, move the file back so the upload can be finalized again.
+            if content_path is not None and os.path.exists(content_path):
+                shutil.move(content_path, self.path)
+            raise
+        return video
+
+
+# Signals
+@receiver(post_delete, sender=VideoUpload)
+def delete_upload_file(sender: type, instance: VideoUpload, **kwargs: dict) -> None:
+    if os.path.exists(instance.path):
+        os.remove(instance.path)
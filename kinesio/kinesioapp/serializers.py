@@ -1,21 +1,36 @@
 from rest_framework import serializers
-from .models import ClinicalSession, Image, Video, Exercise
+from .models import ClinicalSession, Image, Timelapse, Video, VideoUpload, Exercise
 
 
 class ImageSerializer(serializers.ModelSerializer):
+    # Tags are stored as their initial, but clients have always got their full name.
+    tag = serializers.CharField(source='get_tag_display', read_only=True)
+    status = serializers.CharField(read_only=True)
     content = serializers.CharField(source='content_as_base64', read_only=True)
 
     class Meta:
         model = Image
-        fields = ('id', 'tag', 'content')
+        fields = ('id', 'tag', 'status', 'content')
 
 
 class ThumbnailSerializer(serializers.ModelSerializer):
+    tag = serializers.CharField(source='get_tag_display', read_only=True)
+    status = serializers.CharField(read_only=True)
     thumbnail = serializers.CharField(source='thumbnail_as_base64', read_only=True)
 
     class Meta:
         model = Image
-        fields = ('id', 'tag', 'thumbnail')
+        fields = ('id', 'tag', 'status', 'thumbnail')
+
+
+class TimelapseSerializer(serializers.ModelSerializer):
+    tag = serializers.CharField(source='get_tag_display', read_only=True)
+    status = serializers.CharField(read_only=True)
+    url = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Timelapse
+        fields = ('tag', 'status', 'url')
 
 
 class ClinicalSessionSerializer(serializers.ModelSerializer):
@@ -32,10 +47,25 @@ class ClinicalSessionSerializer(serializers.ModelSerializer):
 class VideoSerializer(serializers.ModelSerializer):
     url = serializers.CharField(read_only=True)
     thumbnail_url = serializers.CharField(read_only=True)
+    streaming_url = serializers.CharField(read_only=True)
+    previews_url = serializers.CharField(read_only=True)
+    sprite_url = serializers.CharField(read_only=True)
+    status = serializers.CharField(read_only=True)
 
     class Meta:
         model = Video
-        fields = ('id', 'name', 'url', 'thumbnail_url')
+        fields = ('id', 'name', 'status', 'url', 'streaming_url', 'thumbnail_url', 'previews_url', 'sprite_url',
+                  'duration', 'width', 'height', 'codec', 'bitrate', 'content_hash')
+        read_only_fields = ('duration', 'width', 'height', 'codec', 'bitrate', 'content_hash')
+
+
+class VideoUploadSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(min_value=0)
+    offset = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = VideoUpload
+        fields = ('id', 'name', 'file_name', 'size', 'offset')
 
 
 class ExerciseSerializer(serializers.ModelSerializer):
@@ -0,0 +1,36 @@
+from PIL import Image as PILImage
+from django.test import TestCase
+from django.core.management import call_command
+from io import BytesIO, StringIO
+import tempfile
+import json
+import os
+
+from ..models import Image
+from ..utils.benchmark import generate_photo, percentile
+
+
+class TestImageBenchmark(TestCase):
+    def test_report_every_operation_of_every_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark_images', megapixels=[0.05, 0.1], iterations=2, output=output, stdout=StringIO())
+            with open(output) as output_file:
+                report = json.load(output_file)
+        self.assertEquals(set(report['results']), {'0.05MP', '0.1MP'})
+        operations = report['results']['0.1MP']['operations']
+        self.assertEquals(set(operations), {'base64_cleanup', 'encryption', 'decryption', 'ingest', 'thumbnail_generation',
+                                            'content_as_base64', 'image_serialization', 'thumbnail_serialization'})
+        self.assertEquals(set(operations['ingest']['latency_ms']), {'p50', 'p90', 'p99', 'min', 'max', 'mean'})
+        self.assertTrue(operations['encryption']['peak_traced_memory_bytes'] > 0)
+
+    def test_nothing_is_written_to_the_database(self):
+        call_command('benchmark_images', megapixels=[0.05], iterations=1, stdout=StringIO())
+        self.assertFalse(Image.objects.exists())
+
+    def test_generated_photos_have_the_requested_size(self):
+        self.assertEquals(PILImage.open(BytesIO(generate_photo(0.12))).size, (400, 300))
+
+    def test_percentile(self):
+        self.assertEquals(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEquals(percentile([1, 2, 3, 4], 99), 4)
@@ -0,0 +1,106 @@
+from django.test import TestCase
+from django.core.management import call_command
+from django.conf import settings
+from django.utils import timezone
+from cryptography.fernet import Fernet
+from io import StringIO
+import tempfile
+import shutil
+import base64
+import os
+
+from ..models import ClinicalSession, Image
+from ..utils.blob_store import BlobStore, BlobNotFoundException
+from ..utils.thumbnail import ThumbnailGenerator
+from users.models import User
+from .. import choices
+
+
+class TestBlobStore(TestCase):
+    def setUp(self) -> None:
+        self.root = tempfile.mkdtemp()
+        self.blob_store = BlobStore(self.root)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root)
+
+    def test_blobs_are_addressed_by_their_content(self):
+        self.assertEquals(self.blob_store.put(b'some content'), self.blob_store.put(b'some content'))
+        self.assertNotEquals(self.blob_store.put(b'some content'), self.blob_store.put(b'other content'))
+
+    def test_get_returns_the_stored_content(self):
+        blob_hash = self.blob_store.put(b'some content')
+        self.assertEquals(self.blob_store.get(blob_hash), b'some content')
+
+    def test_blobs_are_sharded(self):
+        blob_hash = self.blob_store.put(b'some content')
+        self.assertEquals(self.blob_store.path(blob_hash), os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash))
+        self.assertTrue(os.path.isfile(self.blob_store.path(blob_hash)))
+
+    def test_deleted_blobs_are_not_found(self):
+        blob_hash = self.blob_store.put(b'some content')
+        self.blob_store.delete(blob_hash)
+        self.assertFalse(self.blob_store.exists(blob_hash))
+        with self.assertRaises(BlobNotFoundException):
+            self.blob_store.get(blob_hash)
+
+
+class TestImagesOnBlobStore(TestCase):
+    def setUp(self) -> None:
+        medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                         last_name='gomez', license='matricula #15433',
+                                         dni=39203040, birth_date=timezone.now())
+        patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                           password='12345', current_medic=medic,
+                                           dni=564353, birth_date=timezone.now())
+        self.clinical_session = ClinicalSession.objects.create(patient=patient.patient)
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.content = base64.b64encode(file.read())
+
+    def create_legacy_image(self) -> Image:
+        fernet = Fernet(settings.IMAGE_ENCRYPTION_KEY)
+        thumbnail = ThumbnailGenerator(self.content).thumbnail
+        image = Image(_content_base64_and_encrypted=fernet.encrypt(self.content),
+                      _thumbnail_base64_and_encrypted=fernet.encrypt(thumbnail),
+                      clinical_session=self.clinical_session,
+                      tag=choices.images.FRONT)
+        # Saving the instance directly skips the blob store, as it was done before it existed.
+        image.save()
+        return image
+
+    def test_new_images_are_not_stored_on_the_database(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        image.refresh_from_db()
+        self.assertIsNone(image._content_base64_and_encrypted)
+        self.assertIsNone(image._thumbnail_base64_and_encrypted)
+        self.assertTrue(BlobStore().exists(image.content_hash))
+        self.assertTrue(BlobStore().exists(image.thumbnail_hash))
+        self.assertEquals(image.content_size, len(BlobStore().get(image.content_hash)))
+
+    def test_stored_blobs_are_encrypted(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        self.assertNotEquals(BlobStore().get(image.content_hash), self.content)
+        self.assertEquals(image.content_as_base64.encode('utf-8'), self.content)
+
+    def test_legacy_images_are_still_readable(self):
+        image = Image.objects.get(id=self.create_legacy_image().id)
+        self.assertEquals(image.content_as_base64.encode('utf-8'), self.content)
+
+    def test_command_moves_legacy_images_to_the_blob_store(self):
+        self.create_legacy_image()
+        self.create_legacy_image()
+        self.create_legacy_image()
+        call_command('move_images_to_blob_store', batch_size=2, stdout=StringIO())
+        self.assertEquals(Image.objects.not_in_blob_store().count(), 0)
+        for image in Image.objects.all():
+            self.assertIsNone(image._content_base64_and_encrypted)
+            self.assertEquals(image.content_as_base64.encode('utf-8'), self.content)
+
+    def test_command_can_be_resumed(self):
+        self.create_legacy_image()
+        self.create_legacy_image()
+        self.create_legacy_image()
+        call_command('move_images_to_blob_store', batch_size=2, max_batches=1, stdout=StringIO())
+        self.assertEquals(Image.objects.not_in_blob_store().count(), 1)
+        call_command('move_images_to_blob_store', batch_size=2, stdout=StringIO())
+        self.assertEquals(Image.objects.not_in_blob_store().count(), 0)
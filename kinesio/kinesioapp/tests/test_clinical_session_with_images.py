@@ -0,0 +1,132 @@
+from rest_framework import status
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image as PILImage
+from unittest import mock
+import tempfile
+import base64
+import os
+
+from ..utils.test_utils import APITestCase
+from ..models import ClinicalSession, Image
+from ..utils.blob_store import BlobStore
+from users.models import User
+from .. import choices
+
+
+class TestClinicalSessionWithImagesAPI(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        with self.get_file_descriptor() as file:
+            self.content = base64.b64encode(file.read()).decode('utf-8')
+        self._log_in(self.medic, '12345')
+
+    def get_file_descriptor(self):
+        return open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb')
+
+    def post(self, images: list) -> dict:
+        data = {'patient_id': self.patient.patient.id, 'description': 'control', 'images': images}
+        return self.client.post('/api/v1/clinical_sessions/with_images/', data, format='json')
+
+    def test_create_session_with_images(self):
+        response = self.post([{'content': self.content, 'tag': 'F'}, {'content': self.content, 'tag': 'B'}])
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(response.json()['description'], 'control')
+        self.assertEquals(ClinicalSession.objects.count(), 1)
+        self.assertEquals(sorted(Image.objects.values_list('tag', flat=True)), ['B', 'F'])
+
+    def test_images_are_returned_ready_with_their_thumbnails(self):
+        response = self.post([{'content': self.content, 'tag': 'F'}])
+        image = response.json()['images'][0]
+        self.assertEquals(image['status'], choices.processing.READY[0])
+        self.assertIsNotNone(image['thumbnail'])
+        self.assertEquals(Image.objects.get().content_as_base64, self.content)
+
+    def test_create_session_uploading_files(self):
+        with self.get_file_descriptor() as first_file, self.get_file_descriptor() as second_file:
+            data = {'patient_id': self.patient.patient.id, 'content': [first_file, second_file], 'tag': ['F', 'R']}
+            response = self.client.post('/api/v1/clinical_sessions/with_images/', data, format='multipart')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(len(response.json()['images']), 2)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_create_session_uploading_files_spooled_to_disk(self):
+        with self.get_file_descriptor() as file:
+            data = {'patient_id': self.patient.patient.id, 'content': [file], 'tag': ['F']}
+            response = self.client.post('/api/v1/clinical_sessions/with_images/', data, format='multipart')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(Image.objects.with_content().get().content_as_base64, self.content)
+
+    def test_full_tag_names_are_stored_as_initials(self):
+        self.post([{'content': self.content, 'tag': choices.images.FRONT}])
+        self.assertEquals(Image.objects.get().tag, 'F')
+
+    def test_fail_to_create_session_with_an_invalid_tag(self):
+        response = self.post([{'content': self.content, 'tag': 'F'}, {'content': self.content, 'tag': 'X'}])
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(ClinicalSession.objects.count(), 0)
+        self.assertEquals(Image.objects.count(), 0)
+
+    def test_storage_errors_are_not_blamed_on_the_images(self):
+        with mock.patch.object(BlobStore, 'put', side_effect=OSError('No space left on device')):
+            with self.assertRaises(OSError):
+                self.post([{'content': self.content, 'tag': 'F'}])
+        self.assertEquals(ClinicalSession.objects.count(), 0)
+
+    def test_repeated_images_share_their_blobs(self):
+        self.post([{'content': self.content, 'tag': 'F'}, {'content': self.content, 'tag': 'B'}])
+        self.assertEquals(Image.objects.values('content_hash').distinct().count(), 1)
+
+    def test_images_the_patient_already_has_share_their_blobs(self):
+        self.post([{'content': self.content, 'tag': 'F'}])
+        self.post([{'content': self.content, 'tag': 'F'}])
+        self.assertEquals(Image.objects.count(), 2)
+        self.assertEquals(Image.objects.values('content_hash').distinct().count(), 1)
+
+    def test_nothing_is_created_if_an_image_is_invalid(self):
+        with override_settings(IMAGE_STORAGE_ROOT=tempfile.mkdtemp()):
+            invalid_content = base64.b64encode(b'not an image').decode('utf-8')
+            response = self.post([{'content': self.content, 'tag': 'F'}, {'content': invalid_content, 'tag': 'B'}])
+            blob_files = [file for _, _, files in os.walk(BlobStore().root) for file in files]
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(ClinicalSession.objects.count(), 0)
+        self.assertEquals(Image.objects.count(), 0)
+        self.assertEquals(blob_files, [])
+
+    def test_decompression_bombs_are_rejected(self):
+        with mock.patch.object(PILImage, 'MAX_IMAGE_PIXELS', 100):
+            response = self.post([{'content': self.content, 'tag': 'F'}])
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(ClinicalSession.objects.count(), 0)
+
+    def test_images_pillow_cannot_process_are_rejected(self):
+        with mock.patch('kinesioapp.utils.image_processing.ThumbnailGenerator.from_raw', side_effect=ValueError('unsupported mode')):
+            response = self.post([{'content': self.content, 'tag': 'F'}])
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(ClinicalSession.objects.count(), 0)
+
+    def test_fail_to_create_session_without_images(self):
+        response = self.client.post('/api/v1/clinical_sessions/with_images/', {'patient_id': self.patient.patient.id}, format='json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(ClinicalSession.objects.count(), 0)
+
+    def test_fail_to_create_session_with_images_without_tag(self):
+        response = self.post([{'content': self.content}])
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMAGE_BATCH_MAX_IMAGES=1)
+    def test_fail_to_create_session_with_too_many_images(self):
+        response = self.post([{'content': self.content, 'tag': 'F'}, {'content': self.content, 'tag': 'B'}])
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(ClinicalSession.objects.count(), 0)
+
+    @override_settings(IMAGE_PROCESSING_SYNCHRONOUS=False)
+    def test_images_are_processed_on_the_process_pool(self):
+        response = self.post([{'content': self.content, 'tag': 'F'}, {'content': self.content, 'tag': 'B'}])
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(all(image['thumbnail'] for image in response.json()['images']))
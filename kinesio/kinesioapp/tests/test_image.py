@@ -1,5 +1,8 @@
 from rest_framework import status
 from django.utils import timezone
+from django.test import override_settings
+from django.core.management import call_command
+from io import StringIO
 import base64
 
 from ..utils.test_utils import APITestCase
@@ -44,6 +47,29 @@ class TestImageAPI(APITestCase):
         self.assertEquals(Image.objects.count(), 1)
         self.assertEquals(bytes(Image.objects.get().content_as_base64.encode('utf-8')), self.content)
 
+    def test_create_image_uploading_a_file(self):
+        with self.get_file_descriptor() as file:
+            data = {'content': file, 'clinical_session_id': self.clinical_session.pk, 'tag': 'F'}
+            response = self.client.post('/api/v1/image/', data, format='multipart')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(Image.objects.count(), 1)
+        self.assertEquals(bytes(Image.objects.get().content_as_base64.encode('utf-8')), self.content)
+
+    def test_both_upload_modes_compute_the_same_source_hash(self):
+        self.client.post('/api/v1/image/', {'content': self.content, 'clinical_session_id': self.clinical_session.pk, 'tag': 'F'}, format='json')
+        with self.get_file_descriptor() as file:
+            data = {'content': file, 'clinical_session_id': self.clinical_session.pk, 'tag': 'F'}
+            self.client.post('/api/v1/image/', data, format='multipart')
+        self.assertEquals(Image.objects.values('source_hash').distinct().count(), 1)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+    def test_fail_to_upload_a_file_bigger_than_the_maximum_size(self):
+        with self.get_file_descriptor() as file:
+            data = {'content': file, 'clinical_session_id': self.clinical_session.pk, 'tag': 'F'}
+            response = self.client.post('/api/v1/image/', data, format='multipart')
+        self.assertEquals(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEquals(Image.objects.count(), 0)
+
     def test_delete_image(self):
         image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
         response = self.client.delete(f'/api/v1/image/{image.id}')
@@ -67,7 +93,34 @@ class TestImageAPI(APITestCase):
         Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session,
                              tag=choices.images.RIGHT)
         self.assertEquals(len(Image.objects.classified_by_tag()), 3)
-        self.assertEquals(sum([item['images'].count() for item in Image.objects.classified_by_tag()]), 4)
+        self.assertEquals(sum([len(item['images']) for item in Image.objects.classified_by_tag()]), 4)
+
+    def test_images_are_classified_by_tag_on_a_single_query(self):
+        Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.BACK)
+        with self.assertNumQueries(1):
+            buckets = Image.objects.classified_by_tag()
+        self.assertEquals([bucket['tag'] for bucket in buckets], [choices.images.FRONT, choices.images.BACK])
+
+    def test_tags_are_stored_as_their_initial(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag='right_side')
+        self.assertEquals(Image.objects.get(id=image.id).tag, 'R')
+
+    def test_images_created_with_the_initial_are_returned_with_the_full_tag_name(self):
+        Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag='B')
+        response = self.client.get(f'/api/v1/image/of_session/{self.clinical_session.id}')
+        self.assertEquals(response.json()['data'][0]['tag'], choices.images.BACK)
+
+    def test_get_images_with_a_lowercase_tag(self):
+        Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.BACK)
+        response = self.client.get(f'/api/v1/image/{self.patient.id}/back')
+        self.assertEquals(len(response.json()['data']), 1)
+
+    def test_normalize_tags_of_old_images(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        Image.objects.filter(id=image.id).update(tag='front')
+        call_command('normalize_image_tags', stdout=StringIO())
+        self.assertEquals(Image.objects.get(id=image.id).tag, 'F')
 
     def test_images_only_get_images_with_the_selected_tag(self):
         Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session,
@@ -124,3 +177,41 @@ class TestImageAPI(APITestCase):
         self.assertEquals(response.status_code, status.HTTP_200_OK)
         self.assertEquals(len(response.json()['data']), 1)
         self.assertEquals(response.json()['data'][0]['tag'], choices.images.FRONT)
+
+    def test_get_raw_image(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        response = self.client.get(f'/api/v1/image/{image.id}/raw')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'image/jpeg')
+        self.assertEquals(int(response['Content-Length']), len(base64.b64decode(self.content)))
+        self.assertEquals(b''.join(response.streaming_content), base64.b64decode(self.content))
+
+    @override_settings(STREAMING_CHUNK_SIZE=1024)
+    def test_raw_image_is_decrypted_in_chunks(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        response = self.client.get(f'/api/v1/image/{image.id}/raw')
+        chunks = list(response.streaming_content)
+        self.assertTrue(all(len(chunk) <= 1024 for chunk in chunks))
+        self.assertEquals(b''.join(chunks), base64.b64decode(self.content))
+
+    def test_fail_to_get_raw_image_of_another_medic(self):
+        another_medic = User.objects.create_user(username='raul22', password='12345', first_name='raul',
+                                                 last_name='sanchez', license='matricula #5555',
+                                                 dni=9203040, birth_date=timezone.now())
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        self._log_in(another_medic, '12345')
+        response = self.client.get(f'/api/v1/image/{image.id}/raw')
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_get_thumbnail(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        response = self.client.get(f'/api/v1/image/{image.id}/thumbnail')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'image/jpeg')
+        self.assertEquals(b''.join(response.streaming_content), Image.objects.with_thumbnail().get(id=image.id).thumbnail)
+
+    def test_thumbnail_of_pending_image_is_not_found(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        Image.objects.filter(id=image.id).update(status=choices.processing.PENDING[0], thumbnail_hash=None)
+        response = self.client.get(f'/api/v1/image/{image.id}/thumbnail')
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
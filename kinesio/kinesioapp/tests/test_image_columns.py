@@ -0,0 +1,92 @@
+from rest_framework import status
+from django.utils import timezone
+from cryptography.fernet import Fernet
+from django.conf import settings
+import base64
+
+from ..utils.test_utils import APITestCase
+from ..models import ClinicalSession, Image
+from users.models import User
+from .. import choices
+
+
+CONTENT_COLUMN = '_content_base64_and_encrypted'
+THUMBNAIL_COLUMN = '_thumbnail_base64_and_encrypted'
+
+
+class TestImageColumnsDeferral(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        self.clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.content = base64.b64encode(file.read())
+        self.image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        self._log_in(self.medic, '12345')
+
+    def create_legacy_image(self) -> Image:
+        fernet = Fernet(settings.IMAGE_ENCRYPTION_KEY)
+        image = Image(_content_base64_and_encrypted=fernet.encrypt(self.content),
+                      _thumbnail_base64_and_encrypted=fernet.encrypt(self.content),
+                      clinical_session=self.clinical_session,
+                      tag=choices.images.FRONT)
+        image.save()
+        return image
+
+    def test_heavy_columns_are_deferred_by_default(self):
+        with self.assertSelectsColumns(Image, selected=['content_hash', 'thumbnail_hash'], not_selected=[CONTENT_COLUMN, THUMBNAIL_COLUMN]):
+            list(Image.objects.all())
+
+    def test_related_images_defer_heavy_columns(self):
+        with self.assertSelectsColumns(Image, not_selected=[CONTENT_COLUMN, THUMBNAIL_COLUMN]):
+            list(self.clinical_session.images.all())
+
+    def test_load_content(self):
+        with self.assertSelectsColumns(Image, selected=[CONTENT_COLUMN], not_selected=[THUMBNAIL_COLUMN]):
+            list(Image.objects.with_content())
+
+    def test_load_thumbnail(self):
+        with self.assertSelectsColumns(Image, selected=[THUMBNAIL_COLUMN], not_selected=[CONTENT_COLUMN]):
+            list(Image.objects.with_thumbnail())
+
+    def test_load_content_and_thumbnail(self):
+        with self.assertSelectsColumns(Image, selected=[CONTENT_COLUMN, THUMBNAIL_COLUMN]):
+            list(Image.objects.with_thumbnail().with_content())
+
+    def test_deferred_columns_of_legacy_images_are_still_readable(self):
+        image = self.create_legacy_image()
+        self.assertEquals(Image.objects.get(id=image.id).content_as_base64.encode('utf-8'), self.content)
+
+    def test_image_details_only_select_the_content(self):
+        with self.assertSelectsColumns(Image, selected=[CONTENT_COLUMN], not_selected=[THUMBNAIL_COLUMN]):
+            response = self.client.get(f'/api/v1/image/{self.image.id}')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+    def test_image_raw_content_only_select_the_content(self):
+        with self.assertSelectsColumns(Image, selected=[CONTENT_COLUMN], not_selected=[THUMBNAIL_COLUMN]):
+            response = self.client.get(f'/api/v1/image/{self.image.id}/raw')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+    def test_image_status_only_select_the_thumbnail(self):
+        with self.assertSelectsColumns(Image, selected=[THUMBNAIL_COLUMN], not_selected=[CONTENT_COLUMN]):
+            response = self.client.get(f'/api/v1/image/{self.image.id}/status')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+    def test_images_with_tag_only_select_the_content(self):
+        with self.assertSelectsColumns(Image, selected=[CONTENT_COLUMN], not_selected=[THUMBNAIL_COLUMN]):
+            response = self.client.get(f'/api/v1/image/{self.patient.id}/F')
+        self.assertEquals(len(response.json()['data']), 1)
+
+    def test_images_of_session_only_select_the_content(self):
+        with self.assertSelectsColumns(Image, selected=[CONTENT_COLUMN], not_selected=[THUMBNAIL_COLUMN]):
+            response = self.client.get(f'/api/v1/image/of_session/{self.clinical_session.id}')
+        self.assertEquals(len(response.json()['data']), 1)
+
+    def test_clinical_sessions_only_select_the_thumbnails(self):
+        with self.assertSelectsColumns(Image, selected=[THUMBNAIL_COLUMN], not_selected=[CONTENT_COLUMN]):
+            response = self.client.get(f'/api/v1/clinical_sessions_for_patient/{self.patient.id}')
+        self.assertEquals(len(response.json()['data'][0]['images']), 1)
@@ -0,0 +1,129 @@
+from rest_framework import status
+from django.test import override_settings
+from django.utils import timezone
+from unittest import mock
+import tempfile
+import hashlib
+import base64
+import os
+
+from ..utils.test_utils import APITestCase
+from ..models import ClinicalSession, Image
+from ..utils.blob_store import BlobStore
+from users.models import User
+from .. import choices
+
+
+class TestImageDeduplication(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        self.other_patient = User.objects.create_user(first_name='maria', last_name='gomez', username='mgomez',
+                                                      password='12345', current_medic=self.medic,
+                                                      dni=2432457, birth_date=timezone.now())
+        self.clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        with self.get_file_descriptor() as file:
+            raw_content = file.read()
+        self.content = base64.b64encode(raw_content)
+        self.source_hash = hashlib.sha256(raw_content).hexdigest()
+        self._log_in(self.medic, '12345')
+
+    def get_file_descriptor(self):
+        return open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb')
+
+    def create_image(self, clinical_session: ClinicalSession) -> Image:
+        return Image.objects.create(content_as_base64=self.content, clinical_session=clinical_session, tag=choices.images.FRONT)
+
+    def test_duplicates_of_the_same_session_share_their_blobs(self):
+        image = self.create_image(self.clinical_session)
+        duplicate = self.create_image(self.clinical_session)
+        self.assertNotEquals(image.id, duplicate.id)
+        self.assertEquals(duplicate.content_hash, image.content_hash)
+        self.assertEquals(duplicate.thumbnail_hash, image.thumbnail_hash)
+
+    def test_duplicates_of_another_session_of_the_patient_share_their_blobs(self):
+        image = self.create_image(self.clinical_session)
+        duplicate = self.create_image(ClinicalSession.objects.create(patient=self.patient.patient))
+        self.assertEquals(duplicate.content_hash, image.content_hash)
+
+    def test_images_of_other_patients_are_not_shared(self):
+        image = self.create_image(self.clinical_session)
+        other_image = self.create_image(ClinicalSession.objects.create(patient=self.other_patient.patient))
+        self.assertNotEquals(other_image.content_hash, image.content_hash)
+
+    def test_failed_images_are_not_reused(self):
+        image = self.create_image(self.clinical_session)
+        Image.objects.filter(id=image.id).update(status=choices.processing.FAILED[0])
+        self.assertNotEquals(self.create_image(self.clinical_session).content_hash, image.content_hash)
+
+    def test_duplicated_uploaded_files_do_not_leave_blobs_behind(self):
+        with override_settings(IMAGE_STORAGE_ROOT=tempfile.mkdtemp()):
+            self.create_image(self.clinical_session)
+            with self.get_file_descriptor() as file:
+                data = {'content': file, 'clinical_session_id': self.clinical_session.pk, 'tag': 'F'}
+                response = self.client.post('/api/v1/image/', data, format='multipart')
+            self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+            blob_files = [file for _, _, files in os.walk(BlobStore().root) for file in files]
+            self.assertEquals(len(blob_files), 2)
+
+    def test_shared_blobs_are_kept_while_an_image_references_them(self):
+        image = self.create_image(self.clinical_session)
+        duplicate = self.create_image(self.clinical_session)
+        # Run the blob deletion right away instead of waiting for a commit that never comes while testing.
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda function: function()):
+            image.delete()
+        self.assertEquals(Image.objects.get(id=duplicate.id).content_as_base64.encode('utf-8'), self.content)
+
+    def test_hash_check_of_a_stored_image(self):
+        self.create_image(self.clinical_session)
+        response = self.client.get(f'/api/v1/image/of_session/{self.clinical_session.id}/hash/{self.source_hash}')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()['exists'])
+
+    def test_hash_check_of_an_unknown_image(self):
+        response = self.client.get(f'/api/v1/image/of_session/{self.clinical_session.id}/hash/{self.source_hash}')
+        self.assertFalse(response.json()['exists'])
+
+    def test_hash_check_does_not_find_images_of_other_patients(self):
+        self.create_image(ClinicalSession.objects.create(patient=self.other_patient.patient))
+        response = self.client.get(f'/api/v1/image/of_session/{self.clinical_session.id}/hash/{self.source_hash}')
+        self.assertFalse(response.json()['exists'])
+
+    def test_fail_to_check_a_hash_on_a_session_of_another_medic(self):
+        User.objects.create_user(username='pedro', password='12345', first_name='pedro',
+                                 last_name='garcia', license='matricula #15434',
+                                 dni=39203041, birth_date=timezone.now())
+        self.client.login(username='pedro', password='12345')
+        response = self.client.get(f'/api/v1/image/of_session/{self.clinical_session.id}/hash/{self.source_hash}')
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_create_image_sending_its_hash(self):
+        image = self.create_image(self.clinical_session)
+        data = {'source_hash': self.source_hash, 'clinical_session_id': self.clinical_session.pk, 'tag': 'B'}
+        response = self.client.post('/api/v1/image/', data, format='json')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        created_image = Image.objects.get(id=response.json()['id'])
+        self.assertEquals(created_image.tag, 'B')
+        self.assertEquals(created_image.content_hash, image.content_hash)
+
+    def test_fail_to_create_image_sending_an_unknown_hash(self):
+        data = {'source_hash': self.source_hash, 'clinical_session_id': self.clinical_session.pk, 'tag': 'F'}
+        response = self.client.post('/api/v1/image/', data, format='json')
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEquals(Image.objects.count(), 0)
+
+    def test_fail_to_create_image_sending_its_hash_on_a_session_of_another_medic(self):
+        self.create_image(self.clinical_session)
+        User.objects.create_user(username='pedro', password='12345', first_name='pedro',
+                                 last_name='garcia', license='matricula #15434',
+                                 dni=39203041, birth_date=timezone.now())
+        self.client.login(username='pedro', password='12345')
+        for source_hash in (self.source_hash, '0' * 64):
+            data = {'source_hash': source_hash, 'clinical_session_id': self.clinical_session.pk, 'tag': 'B'}
+            response = self.client.post('/api/v1/image/', data, format='json')
+            self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEquals(Image.objects.count(), 1)
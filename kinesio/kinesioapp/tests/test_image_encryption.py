@@ -0,0 +1,196 @@
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.conf import settings
+from django.utils import timezone
+from cryptography.fernet import Fernet, InvalidToken
+from io import BytesIO, StringIO
+import tempfile
+import base64
+import os
+
+from ..models import ClinicalSession, Image, ImageRendition, Timelapse
+from ..utils.crypto import ImageCipher
+from ..utils.blob_store import BlobStore
+from users.models import User
+from .. import choices
+
+
+OLD_KEY = settings.IMAGE_ENCRYPTION_KEY
+NEW_KEY = Fernet.generate_key()
+rotated_keys = override_settings(IMAGE_ENCRYPTION_KEY=NEW_KEY, IMAGE_ENCRYPTION_OLD_KEYS=[OLD_KEY])
+only_new_key = override_settings(IMAGE_ENCRYPTION_KEY=NEW_KEY, IMAGE_ENCRYPTION_OLD_KEYS=[])
+
+
+class TestImageCipher(TestCase):
+    def test_ciphers_are_reused(self):
+        self.assertIs(ImageCipher().primary_envelope_key, ImageCipher().primary_envelope_key)
+
+    def test_encrypted_data_can_be_decrypted(self):
+        self.assertEquals(ImageCipher().decrypt(ImageCipher().encrypt(b'some content')), b'some content')
+
+    def test_envelope_overhead_is_small(self):
+        self.assertEquals(len(ImageCipher().encrypt(b'x' * 1000)), 1000 + 36)
+
+    def test_streamed_envelopes_can_be_decrypted(self):
+        encryptor = ImageCipher().encryptor()
+        token = encryptor.update(b'some ') + encryptor.update(b'content') + encryptor.finalize()
+        self.assertEquals(ImageCipher().decrypt(token), b'some content')
+
+    def test_fail_to_decrypt_a_tampered_envelope(self):
+        token = bytearray(ImageCipher().encrypt(b'some content'))
+        token[-1] ^= 1
+        with self.assertRaises(InvalidToken):
+            ImageCipher().decrypt(bytes(token))
+
+    def test_envelopes_can_be_decrypted_in_chunks(self):
+        decryptor = ImageCipher().decryptor(BytesIO(ImageCipher().encrypt(b'some content')))
+        self.assertEquals(decryptor.size, len(b'some content'))
+        self.assertEquals(list(decryptor.chunks(chunk_size=5)), [b'some ', b'conte', b'nt'])
+
+    def test_fail_to_decrypt_a_tampered_envelope_in_chunks(self):
+        token = bytearray(ImageCipher().encrypt(b'some content'))
+        token[-1] ^= 1
+        decryptor = ImageCipher().decryptor(BytesIO(bytes(token)))
+        with self.assertRaises(InvalidToken):
+            list(decryptor.chunks())
+
+    def test_fernet_tokens_cannot_be_decrypted_in_chunks(self):
+        token = Fernet(settings.IMAGE_ENCRYPTION_KEY).encrypt(base64.b64encode(b'some content'))
+        self.assertIsNone(ImageCipher().decryptor(BytesIO(token)))
+
+    def test_legacy_fernet_tokens_are_decrypted_as_raw_bytes(self):
+        token = Fernet(settings.IMAGE_ENCRYPTION_KEY).encrypt(base64.b64encode(b'some content'))
+        self.assertEquals(ImageCipher().decrypt(token), b'some content')
+
+    def test_old_keys_can_decrypt(self):
+        token = ImageCipher().encrypt(b'some content')
+        with rotated_keys:
+            self.assertEquals(ImageCipher().decrypt(token), b'some content')
+
+    def test_old_keys_are_not_used_to_encrypt(self):
+        with rotated_keys:
+            token = ImageCipher().encrypt(b'some content')
+        with self.assertRaises(InvalidToken):
+            ImageCipher().decrypt(token)
+
+    def test_rotated_tokens_use_the_primary_key(self):
+        token = ImageCipher().encrypt(b'some content')
+        with rotated_keys:
+            self.assertFalse(ImageCipher().is_encrypted_with_primary_key(token))
+            self.assertTrue(ImageCipher().is_encrypted_with_primary_key(ImageCipher().rotate(token)))
+
+    def test_rotated_fernet_tokens_use_the_envelope(self):
+        token = ImageCipher().rotate(Fernet(settings.IMAGE_ENCRYPTION_KEY).encrypt(base64.b64encode(b'some content')))
+        self.assertTrue(ImageCipher().is_envelope(token))
+        self.assertEquals(ImageCipher().decrypt(token), b'some content')
+
+
+class TestReencryptImagesCommand(TestCase):
+    def setUp(self) -> None:
+        medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                         last_name='gomez', license='matricula #15433',
+                                         dni=39203040, birth_date=timezone.now())
+        patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                           password='12345', current_medic=medic,
+                                           dni=564353, birth_date=timezone.now())
+        self.patient = patient.patient
+        self.clinical_session = ClinicalSession.objects.create(patient=self.patient)
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.content = base64.b64encode(file.read())
+        self.checkpoint_file = os.path.join(tempfile.mkdtemp(), 'checkpoint')
+
+    def create_image(self) -> Image:
+        return Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+
+    def create_legacy_image(self) -> Image:
+        fernet = Fernet(settings.IMAGE_ENCRYPTION_KEY)
+        image = Image(_content_base64_and_encrypted=fernet.encrypt(self.content),
+                      _thumbnail_base64_and_encrypted=fernet.encrypt(self.content),
+                      clinical_session=self.clinical_session,
+                      tag=choices.images.FRONT)
+        image.save()
+        return image
+
+    def reencrypt(self) -> None:
+        call_command('reencrypt_images', workers=1, checkpoint_file=self.checkpoint_file, stdout=StringIO())
+
+    def write_checkpoint(self, key_fingerprint: str, last_id: int) -> None:
+        with open(self.checkpoint_file, 'w') as file:
+            file.write(f'{{"key": "{key_fingerprint}", "last_id": {last_id}}}')
+
+    def test_images_are_encrypted_with_the_new_key(self):
+        image = self.create_image()
+        with rotated_keys:
+            self.reencrypt()
+        image.refresh_from_db()
+        with only_new_key:
+            self.assertTrue(ImageCipher().is_encrypted_with_primary_key(BlobStore().get(image.content_hash)))
+            self.assertTrue(ImageCipher().is_encrypted_with_primary_key(BlobStore().get(image.thumbnail_hash)))
+            self.assertEquals(image.content_as_base64.encode('utf-8'), self.content)
+
+    def test_old_blobs_are_replaced(self):
+        image = self.create_image()
+        with rotated_keys:
+            self.reencrypt()
+        self.assertNotEquals(Image.objects.get(id=image.id).content_hash, image.content_hash)
+
+    def test_images_already_encrypted_with_the_primary_key_are_skipped(self):
+        image = self.create_image()
+        self.reencrypt()
+        self.assertEquals(Image.objects.get(id=image.id).content_hash, image.content_hash)
+
+    def test_legacy_images_are_moved_to_the_envelope_format(self):
+        image = self.create_legacy_image()
+        self.reencrypt()
+        image.refresh_from_db()
+        self.assertTrue(ImageCipher().is_envelope(BlobStore().get(image.content_hash)))
+        self.assertEquals(image.content_as_base64.encode('utf-8'), self.content)
+
+    def test_duplicates_keep_sharing_their_blobs(self):
+        image = self.create_image()
+        duplicate = Image.objects.create_from_duplicate(image, clinical_session=ClinicalSession.objects.create(patient=self.patient),
+                                                        tag=choices.images.FRONT)
+        with rotated_keys:
+            call_command('reencrypt_images', workers=1, batch_size=1, checkpoint_file=self.checkpoint_file, stdout=StringIO())
+        image.refresh_from_db()
+        duplicate.refresh_from_db()
+        self.assertEquals([duplicate.content_hash, duplicate.thumbnail_hash], [image.content_hash, image.thumbnail_hash])
+        with only_new_key:
+            self.assertTrue(ImageCipher().is_encrypted_with_primary_key(BlobStore().get(image.content_hash)))
+            self.assertEquals(duplicate.content_as_base64.encode('utf-8'), self.content)
+
+    def test_renditions_are_dropped(self):
+        image = self.create_image()
+        ImageRendition.objects.get_or_generate(image, 160, choices.renditions.JPEG)
+        with rotated_keys:
+            self.reencrypt()
+        self.assertEquals(ImageRendition.objects.count(), 0)
+
+    def test_rotation_resumes_from_the_checkpoint(self):
+        first_image = self.create_image()
+        # Another file, so it is not a duplicate of the first image, re-encrypted along with it.
+        second_image = Image.objects.create(content_as_base64=base64.b64encode(base64.b64decode(self.content) + b'\x00'),
+                                            clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        with rotated_keys:
+            self.write_checkpoint(ImageCipher().primary_key_fingerprint, first_image.id)
+            self.reencrypt()
+        self.assertEquals(Image.objects.get(id=first_image.id).content_hash, first_image.content_hash)
+        self.assertNotEquals(Image.objects.get(id=second_image.id).content_hash, second_image.content_hash)
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_checkpoints_of_a_rotation_to_another_key_are_ignored(self):
+        first_image = self.create_image()
+        with rotated_keys:
+            self.write_checkpoint('another key', first_image.id)
+            self.reencrypt()
+        self.assertNotEquals(Image.objects.get(id=first_image.id).content_hash, first_image.content_hash)
+
+    def test_timelapses_are_encrypted_with_the_new_key(self):
+        encrypted_video = ImageCipher().encrypt(b'timelapse video')
+        timelapse = Timelapse.objects.create(patient=self.patient, tag=choices.images.FRONT, images_key='', status=choices.processing.READY[0],
+                                             blob_hash=BlobStore(settings.TIMELAPSE_ROOT).put(encrypted_video), blob_size=len(encrypted_video))
+        with rotated_keys:
+            self.reencrypt()
+        timelapse.refresh_from_db()
+        with only_new_key:
+            self.assertEquals(timelapse.content, b'timelapse video')
@@ -0,0 +1,93 @@
+from rest_framework import status
+from django.utils import timezone
+from django.conf import settings
+from cryptography.fernet import Fernet
+from unittest import mock
+import base64
+
+from ..utils.test_utils import APITestCase
+from ..models import ClinicalSession, Image
+from ..utils.blob_store import BlobStore
+from ..utils.crypto import ImageCipher
+from users.models import User
+from .. import choices
+
+
+class TestImageHttpCaching(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        self.clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.content = base64.b64encode(file.read())
+        self.image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        self._log_in(self.medic, '12345')
+
+    def test_raw_image_has_strong_etag_and_is_immutable(self):
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw')
+        self.assertEquals(response['ETag'], f'"{self.image.content_hash}"')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_raw_image_not_modified_does_not_load_the_blob(self):
+        etag = self.client.get(f'/api/v1/image/{self.image.id}/raw')['ETag']
+        with mock.patch.object(BlobStore, 'get') as get_blob, mock.patch.object(ImageCipher, 'decrypt') as decrypt:
+            response = self.client.get(f'/api/v1/image/{self.image.id}/raw', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEquals(response['ETag'], etag)
+        self.assertEquals(response.content, b'')
+        get_blob.assert_not_called()
+        decrypt.assert_not_called()
+
+    def test_raw_image_with_another_etag_is_sent(self):
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw', HTTP_IF_NONE_MATCH='"another"')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+    def test_renditions_have_their_own_etag(self):
+        original_etag = self.client.get(f'/api/v1/image/{self.image.id}/raw')['ETag']
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw', {'size': 320, 'image_format': 'webp'})
+        self.assertNotEquals(response['ETag'], original_etag)
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw', {'size': 320, 'image_format': 'webp'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_image_details_not_modified(self):
+        etag = self.client.get(f'/api/v1/image/{self.image.id}')['ETag']
+        with mock.patch.object(ImageCipher, 'decrypt') as decrypt:
+            response = self.client.get(f'/api/v1/image/{self.image.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        decrypt.assert_not_called()
+
+    def test_thumbnail_not_modified(self):
+        response = self.client.get(f'/api/v1/image/{self.image.id}/status')
+        self.assertEquals(response['ETag'], f'"{self.image.thumbnail_hash}"')
+        response = self.client.get(f'/api/v1/image/{self.image.id}/status', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_pending_images_are_not_cached(self):
+        Image.objects.filter(id=self.image.id).update(status=choices.processing.PENDING[0])
+        self.assertFalse(self.client.get(f'/api/v1/image/{self.image.id}/status').has_header('ETag'))
+        self.assertFalse(self.client.get(f'/api/v1/image/{self.image.id}').has_header('ETag'))
+
+    def test_legacy_images_are_not_cached(self):
+        fernet = Fernet(settings.IMAGE_ENCRYPTION_KEY)
+        image = Image(_content_base64_and_encrypted=fernet.encrypt(self.content),
+                      _thumbnail_base64_and_encrypted=fernet.encrypt(self.content),
+                      clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        image.save()
+        response = self.client.get(f'/api/v1/image/{image.id}/raw')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_not_modified_is_only_answered_to_allowed_users(self):
+        etag = self.client.get(f'/api/v1/image/{self.image.id}/raw')['ETag']
+        another_medic = User.objects.create_user(username='raul22', password='12345', first_name='raul',
+                                                 last_name='sanchez', license='matricula #5555',
+                                                 dni=9203040, birth_date=timezone.now())
+        self._log_in(another_medic, '12345')
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,163 @@
+from PIL import Image as PILImage
+from rest_framework import status
+from django.test import override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.utils import timezone
+from unittest import mock
+from io import BytesIO
+import base64
+
+from ..utils.test_utils import APITestCase
+from ..models import ClinicalSession, Image
+from ..models.image import ImageQuerySet
+from ..utils.blob_store import BlobStore
+from ..utils.image_ingest import ImageNormalizer
+from ..utils.image_processing import ImageProcessingPool
+from users.models import User
+from .. import choices
+
+
+ORIENTATION = 0x0112
+ROTATED_90_DEGREES = 6
+
+
+@override_settings(IMAGE_INGEST_ENABLED=True, IMAGE_INGEST_MAX_SIZE=100, IMAGE_INGEST_FORMAT='JPEG', IMAGE_INGEST_KEEP_ORIGINALS=False)
+class TestImageIngest(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        self.clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.raw_content = file.read()
+        self._log_in(self.medic, '12345')
+
+    def create_image(self, raw_content: bytes) -> Image:
+        return Image.objects.create(content_as_base64=base64.b64encode(raw_content), clinical_session=self.clinical_session, tag=choices.images.FRONT)
+
+    @staticmethod
+    def rotated_photo() -> bytes:
+        """ A 80x40 photo taken with the camera rotated, as phones save them: the pixels as captured plus the EXIF orientation. """
+        exif = PILImage.Exif()
+        exif[ORIENTATION] = ROTATED_90_DEGREES
+        output = BytesIO()
+        PILImage.new('RGB', (80, 40), 'red').save(output, format='JPEG', exif=exif.tobytes())
+        return output.getvalue()
+
+    @staticmethod
+    def open(content: bytes) -> PILImage.Image:
+        return PILImage.open(BytesIO(content))
+
+    def test_longest_side_is_capped(self):
+        image = self.create_image(self.raw_content)
+        self.assertEquals(max(self.open(image.content).size), 100)
+        self.assertTrue(len(image.content) < len(self.raw_content))
+
+    def test_orientation_is_applied(self):
+        image = self.create_image(self.rotated_photo())
+        self.assertEquals(self.open(image.content).size, (40, 80))
+
+    def test_metadata_is_stripped(self):
+        image = self.create_image(self.rotated_photo())
+        self.assertNotIn('exif', self.open(image.content).info)
+
+    def test_images_are_encoded_as_progressive_jpeg(self):
+        image = self.create_image(self.raw_content)
+        self.assertTrue(self.open(image.content).info.get('progressive'))
+        self.assertEquals(image.format, choices.renditions.JPEG)
+
+    @override_settings(IMAGE_INGEST_FORMAT='WEBP')
+    def test_images_are_encoded_as_webp(self):
+        image = self.create_image(self.raw_content)
+        self.assertEquals(self.open(image.content).format, 'WEBP')
+        response = self.client.get(f'/api/v1/image/{image.id}/raw')
+        self.assertEquals(response['Content-Type'], 'image/webp')
+
+    def test_uploaded_files_are_normalized(self):
+        file = SimpleUploadedFile('kinesio.jpg', self.raw_content, content_type='image/jpeg')
+        response = self.client.post('/api/v1/image/', {'content': file, 'clinical_session_id': self.clinical_session.id, 'tag': 'F'}, format='multipart')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(max(self.open(Image.objects.get().content).size), 100)
+
+    @override_settings(IMAGE_INGEST_KEEP_ORIGINALS=True)
+    def test_files_spooled_to_disk_are_stored_from_the_file(self):
+        with TemporaryUploadedFile('kinesio.jpg', 'image/jpeg', len(self.raw_content), None) as file:
+            file.write(self.raw_content)
+            file.seek(0)
+            with mock.patch.object(ImageQuerySet, '_create_from_content') as create_from_content:
+                image = Image.objects.create_from_file(file, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        create_from_content.assert_not_called()
+        self.assertEquals(max(self.open(image.content).size), 100)
+        self.assertEquals(image.original, self.raw_content)
+
+    def test_images_are_normalized_in_the_background(self):
+        with mock.patch.object(ImageProcessingPool, 'submit'):
+            image = self.create_image(self.raw_content)
+        self.assertEquals(image.content, self.raw_content)
+        uploaded_file_hash = image.content_hash
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda function: function()):
+            image.process()
+        image = Image.objects.with_content().get(id=image.id)
+        self.assertTrue(image.normalized)
+        self.assertEquals(max(self.open(image.content).size), 100)
+        self.assertFalse(BlobStore().exists(uploaded_file_hash))
+
+    @override_settings(IMAGE_INGEST_KEEP_ORIGINALS=True)
+    def test_uploaded_files_are_kept_as_originals_when_normalized_in_the_background(self):
+        with mock.patch.object(ImageProcessingPool, 'submit'):
+            image = self.create_image(self.raw_content)
+        uploaded_file_hash = image.content_hash
+        image.process()
+        self.assertEquals(Image.objects.get(id=image.id).original_hash, uploaded_file_hash)
+        self.assertEquals(image.original, self.raw_content)
+
+    def test_images_of_a_session_with_images_are_normalized(self):
+        data = {'patient_id': self.patient.patient.id, 'images': [{'content': base64.b64encode(self.raw_content).decode('utf-8'), 'tag': 'F'}]}
+        response = self.client.post('/api/v1/clinical_sessions/with_images/', data, format='json')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(max(self.open(Image.objects.get().content).size), 100)
+
+    def test_originals_are_discarded_by_default(self):
+        image = self.create_image(self.raw_content)
+        self.assertIsNone(image.original_hash)
+        self.assertEquals(image.original, image.content)
+
+    @override_settings(IMAGE_INGEST_KEEP_ORIGINALS=True)
+    def test_originals_are_kept_encrypted(self):
+        image = self.create_image(self.raw_content)
+        self.assertEquals(image.original, self.raw_content)
+        self.assertNotEquals(BlobStore().get(image.original_hash), self.raw_content)
+
+    @override_settings(IMAGE_INGEST_KEEP_ORIGINALS=True)
+    def test_originals_are_deleted_with_their_images(self):
+        image = self.create_image(self.raw_content)
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda function: function()):
+            image.delete()
+        self.assertFalse(BlobStore().exists(image.original_hash))
+
+    @override_settings(IMAGE_INGEST_KEEP_ORIGINALS=True)
+    def test_duplicates_share_their_original(self):
+        image = self.create_image(self.raw_content)
+        duplicate = self.create_image(self.raw_content)
+        self.assertEquals(duplicate.original_hash, image.original_hash)
+
+    def test_duplicates_are_found_by_the_uploaded_file(self):
+        image = self.create_image(self.raw_content)
+        self.assertEquals(self.create_image(self.raw_content).content_hash, image.content_hash)
+
+    def test_invalid_images_are_stored_as_uploaded(self):
+        image = self.create_image(b'not an image')
+        self.assertEquals(image.content, b'not an image')
+        self.assertEquals(Image.objects.get(id=image.id).status, choices.processing.FAILED[0])
+
+    def test_invalid_uploaded_files_are_stored_as_uploaded(self):
+        file = SimpleUploadedFile('kinesio.jpg', b'not an image', content_type='image/jpeg')
+        image = Image.objects.create_from_file(file, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        self.assertEquals(image.content, b'not an image')
+
+    def test_small_images_are_not_enlarged(self):
+        content = ImageNormalizer(max_size=1000).normalize(self.rotated_photo())
+        self.assertEquals(self.open(content).size, (40, 80))
@@ -0,0 +1,85 @@
+from rest_framework import status
+from django.test import override_settings
+from django.utils import timezone
+from datetime import timedelta
+import base64
+
+from ..utils.test_utils import APITestCase
+from ..models import ClinicalSession, Image
+from ..utils.pagination import KeysetPaginator
+from users.models import User
+from .. import choices
+
+
+@override_settings(IMAGE_PAGE_SIZE=2, IMAGE_MAX_PAGE_SIZE=3)
+class TestImagePagination(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        self.later_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        self.earlier_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        ClinicalSession.objects.filter(id=self.earlier_session.id).update(date=timezone.now() - timedelta(days=7))
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.content = base64.b64encode(file.read())
+        # Images of the later session are created first, so the order by date differs from the order by id.
+        self.images = [self.create_image(self.later_session) for _ in range(3)] + [self.create_image(self.earlier_session) for _ in range(2)]
+        self._log_in(self.medic, '12345')
+
+    def create_image(self, clinical_session: ClinicalSession) -> Image:
+        return Image.objects.create(content_as_base64=self.content, clinical_session=clinical_session, tag=choices.images.FRONT)
+
+    def get_all_pages(self, url: str) -> list:
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(url, {'cursor': cursor} if cursor else {})
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(len(response.json()['data']) <= 2)
+            ids += [image['id'] for image in response.json()['data']]
+            cursor = response.json()['next']
+            if cursor is None:
+                return ids
+
+    def test_images_with_tag_are_paginated_by_session_date(self):
+        ids = self.get_all_pages(f'/api/v1/image/{self.patient.id}/F')
+        self.assertEquals(ids, [image.id for image in self.images[3:] + self.images[:3]])
+
+    def test_images_of_session_are_paginated(self):
+        ids = self.get_all_pages(f'/api/v1/image/of_session/{self.later_session.id}')
+        self.assertEquals(ids, [image.id for image in self.images[:3]])
+
+    def test_last_page_has_no_next_cursor(self):
+        response = self.client.get(f'/api/v1/image/of_session/{self.earlier_session.id}')
+        self.assertEquals(len(response.json()['data']), 2)
+        self.assertIsNone(response.json()['next'])
+
+    def test_page_size(self):
+        response = self.client.get(f'/api/v1/image/{self.patient.id}/A', {'page_size': 3})
+        self.assertEquals(len(response.json()['data']), 3)
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_page_size_above_the_maximum(self):
+        response = self.client.get(f'/api/v1/image/{self.patient.id}/A', {'page_size': 4})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'/api/v1/image/{self.patient.id}/A', {'cursor': 'not a cursor'})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_images_created_meanwhile_are_not_repeated(self):
+        response = self.client.get(f'/api/v1/image/{self.patient.id}/F')
+        self.create_image(self.earlier_session)
+        response = self.client.get(f'/api/v1/image/{self.patient.id}/F', {'cursor': response.json()['next']})
+        first_page_ids = [image.id for image in self.images[3:]]
+        self.assertFalse(set(first_page_ids) & {image['id'] for image in response.json()['data']})
+
+    def test_cursor_round_trip(self):
+        date = timezone.now()
+        self.assertEquals(KeysetPaginator.decode(KeysetPaginator.encode(date, 15)), (date, 15))
+
+    def test_pages_do_not_count_the_images(self):
+        with self.assertNumQueries(1):
+            KeysetPaginator('clinical_session__date', page_size='2').paginate(Image.objects.all())
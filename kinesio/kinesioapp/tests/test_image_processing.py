@@ -0,0 +1,101 @@
+from rest_framework import status
+from django.utils import timezone
+from django.test import override_settings
+from unittest import mock
+import base64
+
+from ..utils.test_utils import APITestCase
+from ..utils.blob_store import BlobStore
+from ..utils.image_processing import process_image
+from ..models import ClinicalSession, Image, ImageRendition
+from ..cron import ProcessPendingImages
+from users.models import User
+from .. import choices
+
+
+@override_settings(IMAGE_PROCESSING_SYNCHRONOUS=False)
+class TestImageProcessing(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        self.clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.content = base64.b64encode(file.read())
+        self._log_in(self.medic, '12345')
+
+    def test_created_images_are_pending(self):
+        data = {'content': self.content, 'clinical_session_id': self.clinical_session.pk, 'tag': 'F'}
+        response = self.client.post('/api/v1/image/', data, format='json')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(response.json()['status'], choices.processing.PENDING[0])
+        self.assertIsNone(response.json()['thumbnail'])
+
+    def test_pending_images_content_is_available(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        self.assertEquals(image.content_as_base64.encode('utf-8'), self.content)
+
+    def test_processed_images_are_ready(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        process_image(image.id)
+        response = self.client.get(f'/api/v1/image/{image.id}/status')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.json()['status'], choices.processing.READY[0])
+        self.assertIsNotNone(response.json()['thumbnail'])
+
+    def test_processing_a_deleted_image_does_not_fail(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        image_id = image.id
+        image.delete()
+        process_image(image_id)
+
+    def test_images_that_can_not_be_processed_are_marked_as_failed(self):
+        image = Image.objects.create(content_as_base64=base64.b64encode(b'not an image'), clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        process_image(image.id)
+        self.assertEquals(Image.objects.get(id=image.id).status, choices.processing.FAILED[0])
+
+    @override_settings(IMAGE_RENDITIONS_GENERATED_ON_UPLOAD=[(160, choices.renditions.JPEG), (800, choices.renditions.WEBP)])
+    def test_configured_renditions_are_generated_while_processing(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        process_image(image.id)
+        self.assertEquals(ImageRendition.objects.filter(image=image).count(), 2)
+
+    def test_cron_processes_pending_images(self):
+        Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.BACK)
+        ProcessPendingImages().do()
+        self.assertEquals(Image.objects.pending().count(), 0)
+        self.assertTrue(all(image.thumbnail_as_base64 for image in Image.objects.all()))
+
+    def test_images_being_processed_are_skipped_by_the_cron_job(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        self.assertTrue(Image.objects.claim(image.id))
+        with mock.patch.object(Image, 'generate_thumbnail') as generate_thumbnail:
+            ProcessPendingImages().do()
+        generate_thumbnail.assert_not_called()
+        self.assertEquals(Image.objects.get(id=image.id).status, choices.processing.PENDING[0])
+
+    def test_expired_claims_are_taken_over(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        Image.objects.filter(id=image.id).update(processing_started_at=timezone.now() - timezone.timedelta(hours=1))
+        ProcessPendingImages().do()
+        image = Image.objects.get(id=image.id)
+        self.assertEquals(image.status, choices.processing.READY[0])
+        self.assertIsNone(image.processing_started_at)
+
+    def test_thumbnail_of_an_image_deleted_while_being_processed_is_deleted(self):
+        image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        generate_thumbnail, thumbnail_hashes = Image.generate_thumbnail, []
+
+        def generate_thumbnail_and_delete(processed_image: Image) -> None:
+            generate_thumbnail(processed_image)
+            thumbnail_hashes.append(processed_image.thumbnail_hash)
+            Image.objects.filter(id=processed_image.id).delete()
+        with mock.patch.object(Image, 'generate_thumbnail', generate_thumbnail_and_delete), \
+                mock.patch('django.db.transaction.on_commit', side_effect=lambda function: function()):
+            process_image(image.id)
+        self.assertFalse(Image.objects.filter(id=image.id).exists())
+        self.assertFalse(BlobStore().exists(thumbnail_hashes[0]))
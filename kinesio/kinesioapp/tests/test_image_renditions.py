@@ -0,0 +1,72 @@
+from rest_framework import status
+from django.utils import timezone
+from django.test import override_settings
+from django.conf import settings
+from PIL import Image as PILImage
+from io import BytesIO
+import base64
+
+from ..utils.test_utils import APITestCase
+from ..models import ClinicalSession, Image, ImageRendition
+from ..utils.blob_store import BlobStore
+from users.models import User
+from .. import choices
+
+
+class TestImageRenditions(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        self.clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.content = base64.b64encode(file.read())
+        self.image = Image.objects.create(content_as_base64=self.content, clinical_session=self.clinical_session, tag=choices.images.FRONT)
+        self._log_in(self.medic, '12345')
+
+    def test_get_rendition(self):
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw?size=160')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'image/jpeg')
+        self.assertEquals(max(PILImage.open(BytesIO(b''.join(response.streaming_content))).size), 160)
+
+    def test_get_rendition_in_another_format(self):
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw?size=320&image_format=webp')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'image/webp')
+        self.assertEquals(PILImage.open(BytesIO(b''.join(response.streaming_content))).format, 'WEBP')
+
+    def test_fail_to_get_rendition_with_invalid_size(self):
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw?size=123')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_renditions_are_generated_once(self):
+        self.client.get(f'/api/v1/image/{self.image.id}/raw?size=160')
+        self.client.get(f'/api/v1/image/{self.image.id}/raw?size=160')
+        self.client.get(f'/api/v1/image/{self.image.id}/raw?size=800')
+        self.assertEquals(ImageRendition.objects.count(), 2)
+
+    def test_renditions_are_stored_encrypted(self):
+        rendition = ImageRendition.objects.get_or_generate(self.image, 160, choices.renditions.JPEG)
+        encrypted_content = BlobStore(settings.IMAGE_RENDITIONS_ROOT).get(rendition.blob_hash)
+        self.assertNotIn(rendition.content, encrypted_content)
+        self.assertNotIn(base64.b64encode(rendition.content), encrypted_content)
+
+    def test_least_recently_used_renditions_are_evicted(self):
+        oldest = ImageRendition.objects.get_or_generate(self.image, 160, choices.renditions.JPEG)
+        newest = ImageRendition.objects.get_or_generate(self.image, 320, choices.renditions.JPEG)
+        ImageRendition.objects.get_or_generate(self.image, 160, choices.renditions.JPEG)
+        # Only one of them fits in the budget. The 160px rendition was accessed last, so it stays.
+        ImageRendition.objects.evict_least_recently_used(budget=newest.blob_size)
+        self.assertEquals(list(ImageRendition.objects.all()), [oldest])
+
+    @override_settings(IMAGE_RENDITIONS_DISK_BUDGET=0)
+    def test_new_renditions_evict_older_ones_when_the_budget_is_exceeded(self):
+        self.client.get(f'/api/v1/image/{self.image.id}/raw?size=160')
+        response = self.client.get(f'/api/v1/image/{self.image.id}/raw?size=320')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(max(PILImage.open(BytesIO(b''.join(response.streaming_content))).size), 320)
+        self.assertEquals(list(ImageRendition.objects.values_list('size', flat=True)), [320])
@@ -0,0 +1,118 @@
+from rest_framework import status
+from django.test import override_settings
+from django.conf import settings
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest import mock
+import os
+
+from ..utils.test_utils import APITestCase
+from ..models import Video
+from ..utils.media_gateway import RangeNotSatisfiableException, parse_range
+from users.models import User
+
+
+class TestMediaGateway(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/test_video.mp4', 'rb') as file:
+            self.content = file.read()
+        # Only the tests of the thumbnail and the HLS files need them: the others skip ffmpeg.
+        with mock.patch.object(Video, 'process'):
+            self.video = Video.objects.create(name='leg exercise', content=SimpleUploadedFile('test_video.mp4', self.content), medic_id=self.medic.id)
+        self.path = f'{settings.MEDIA_URL}{self.video.content.name}'
+        self._log_in(self.medic, '12345')
+
+    def tearDown(self) -> None:
+        for video in Video.objects.all():
+            for path in (video.content.path, f'{video.content.path}_thumb.jpg'):
+                if os.path.exists(path):
+                    os.remove(path)
+            video.delete()
+
+    def test_video_file_is_sent(self):
+        response = self.client.get(self.path)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(b''.join(response.streaming_content), self.content)
+        self.assertEquals(response['Content-Type'], 'video/mp4')
+        self.assertEquals(response['Accept-Ranges'], 'bytes')
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_range_is_sent(self):
+        response = self.client.get(self.path, HTTP_RANGE='bytes=100-199')
+        self.assertEquals(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEquals(b''.join(response.streaming_content), self.content[100:200])
+        self.assertEquals(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEquals(response['Content-Length'], '100')
+
+    def test_range_until_the_end(self):
+        response = self.client.get(self.path, HTTP_RANGE='bytes=-100')
+        self.assertEquals(b''.join(response.streaming_content), self.content[-100:])
+        response = self.client.get(self.path, HTTP_RANGE='bytes=100-')
+        self.assertEquals(b''.join(response.streaming_content), self.content[100:])
+
+    def test_range_after_the_end(self):
+        response = self.client.get(self.path, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEquals(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEquals(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_parse_range(self):
+        self.assertEquals(parse_range('bytes=0-0', 10), (0, 0))
+        self.assertEquals(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertEquals(parse_range('bytes=-100', 10), (0, 9))
+        # Ranges that are not handled mean the whole file
+        self.assertIsNone(parse_range(None, 10))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 10))
+        self.assertIsNone(parse_range('bytes=5-1', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+        with self.assertRaises(RangeNotSatisfiableException):
+            parse_range('bytes=-0', 10)
+
+    def test_patients_of_the_owner_can_see_the_video(self):
+        self._log_in(self.patient, '12345')
+        self.assertEquals(self.client.get(self.path).status_code, status.HTTP_200_OK)
+
+    def test_other_medics_cannot_see_the_video(self):
+        another_medic = User.objects.create_user(username='raul22', password='12345', first_name='raul',
+                                                 last_name='sanchez', license='matricula #5555',
+                                                 dni=9203040, birth_date=timezone.now())
+        self._log_in(another_medic, '12345')
+        self.assertEquals(self.client.get(self.path).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_anonymous_users_cannot_see_the_video(self):
+        self.client.logout()
+        self.assertEquals(self.client.get(self.path).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_files_of_no_video_are_not_sent(self):
+        for path in ('images/0000', 'another_video.mp4', '../kinesio/manage.py', f'hls/{self.video.id}/../../{self.video.content.name}x'):
+            self.assertEquals(self.client.get(f'{settings.MEDIA_URL}{path}').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_thumbnail_and_hls_files_are_sent(self):
+        self.video.process()
+        self.assertEquals(self.client.get(f'{self.path}_thumb.jpg')['Content-Type'], 'image/jpeg')
+        response = self.client.get(self.video.streaming_url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'application/vnd.apple.mpegurl')
+        response = self.client.get(f'{settings.VIDEO_HLS_URL}{self.video.id}/240p/segment_000.ts')
+        self.assertEquals(response['Content-Type'], 'video/mp2t')
+
+    def test_missing_hls_files_are_not_found(self):
+        self.assertEquals(self.client.get(f'{settings.VIDEO_HLS_URL}{self.video.id}/master.m3u8').status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(MEDIA_GATEWAY_BACKEND='x-accel-redirect')
+    def test_files_are_sent_by_nginx(self):
+        response = self.client.get(self.path)
+        self.assertEquals(response['X-Accel-Redirect'], f'{settings.MEDIA_GATEWAY_INTERNAL_URL}{self.video.content.name}')
+        self.assertEquals(response['Content-Type'], 'video/mp4')
+        self.assertEquals(response.content, b'')
+
+    @override_settings(MEDIA_GATEWAY_BACKEND='x-sendfile')
+    def test_files_are_sent_by_sendfile(self):
+        response = self.client.get(self.path)
+        self.assertEquals(response['X-Sendfile'], self.video.content.path)
+        self.assertEquals(response.content, b'')
@@ -0,0 +1,86 @@
+from django.test import TestCase
+from django.conf import settings
+from django.utils import timezone
+from unittest import mock
+import base64
+
+from ..models import ClinicalSession, Image
+from ..utils.crypto import ImageCipher
+from ..utils.thumbnail_cache import ThumbnailCache
+from users.models import User
+from .. import choices
+
+
+class TestThumbnailCache(TestCase):
+    def setUp(self) -> None:
+        ThumbnailCache().clear()
+
+    def test_count_hits_and_misses(self):
+        ThumbnailCache().get(1, lambda: b'thumbnail')
+        ThumbnailCache().get(1, lambda: b'thumbnail')
+        ThumbnailCache().get(2, lambda: b'thumbnail')
+        self.assertEquals(ThumbnailCache().hits, 1)
+        self.assertEquals(ThumbnailCache().misses, 2)
+
+    def test_cached_thumbnails_are_not_loaded_again(self):
+        load = mock.Mock(return_value=b'thumbnail')
+        ThumbnailCache().get(1, load)
+        self.assertEquals(ThumbnailCache().get(1, load), b'thumbnail')
+        load.assert_called_once()
+
+    def test_missing_thumbnails_are_not_cached(self):
+        ThumbnailCache().get(1, lambda: None)
+        self.assertEquals(ThumbnailCache().get(1, lambda: b'thumbnail'), b'thumbnail')
+
+    def test_size_is_counted_in_bytes(self):
+        ThumbnailCache().get(1, lambda: b'12345')
+        ThumbnailCache().get(2, lambda: b'123')
+        self.assertEquals(ThumbnailCache().size, 8)
+
+    def test_least_recently_used_thumbnails_are_evicted_above_the_budget(self):
+        thumbnail = b'x' * (settings.THUMBNAIL_CACHE_SIZE // 2)
+        ThumbnailCache().get(1, lambda: thumbnail)
+        ThumbnailCache().get(2, lambda: thumbnail)
+        ThumbnailCache().get(1, lambda: thumbnail)
+        ThumbnailCache().get(3, lambda: thumbnail)
+        self.assertEquals(ThumbnailCache().size, settings.THUMBNAIL_CACHE_SIZE)
+        load = mock.Mock(return_value=thumbnail)
+        ThumbnailCache().get(1, load)
+        ThumbnailCache().get(2, load)
+        self.assertEquals(load.call_count, 1)
+
+    def test_thumbnails_bigger_than_the_budget_are_not_cached(self):
+        ThumbnailCache().get(1, lambda: b'x' * (settings.THUMBNAIL_CACHE_SIZE + 1))
+        self.assertEquals(ThumbnailCache().size, 0)
+
+
+class TestImageThumbnailCache(TestCase):
+    def setUp(self) -> None:
+        ThumbnailCache().clear()
+        medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                         last_name='gomez', license='matricula #15433',
+                                         dni=39203040, birth_date=timezone.now())
+        patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                           password='12345', current_medic=medic,
+                                           dni=564353, birth_date=timezone.now())
+        clinical_session = ClinicalSession.objects.create(patient=patient.patient)
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            content = base64.b64encode(file.read())
+        self.image = Image.objects.create(content_as_base64=content, clinical_session=clinical_session, tag=choices.images.FRONT)
+
+    def test_thumbnails_are_decrypted_once(self):
+        thumbnail = Image.objects.get(id=self.image.id).thumbnail_as_base64
+        with mock.patch.object(ImageCipher, 'decrypt') as decrypt:
+            self.assertEquals(Image.objects.get(id=self.image.id).thumbnail_as_base64, thumbnail)
+        decrypt.assert_not_called()
+        self.assertEquals(ThumbnailCache().hits, 1)
+
+    def test_thumbnails_of_deleted_images_are_invalidated(self):
+        self.image.thumbnail
+        self.image.delete()
+        self.assertEquals(ThumbnailCache().size, 0)
+
+    def test_thumbnails_are_invalidated_when_generated_again(self):
+        self.image.thumbnail
+        self.image.generate_thumbnail()
+        self.assertEquals(ThumbnailCache().size, 0)
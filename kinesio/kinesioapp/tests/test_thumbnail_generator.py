@@ -1,5 +1,7 @@
 from django.test import TestCase
-import os
+from unittest import mock
+from PIL import Image
+from io import BytesIO
 import base64
 
 from ..utils.thumbnail import ThumbnailGenerator
@@ -8,17 +10,31 @@ from ..utils.thumbnail import ThumbnailGenerator
 class TestThumbnailGenerator(TestCase):
     def setUp(self) -> None:
         with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as image_file_:
-            content = base64.b64encode(image_file_.read())
-        self.thumbnail = ThumbnailGenerator(content).thumbnail
+            self.content = base64.b64encode(image_file_.read())
+        self.thumbnail = ThumbnailGenerator(self.content).thumbnail
 
     def test_thumbnail_mime_type(self):
         assert self.thumbnail[:20] == b'/9j/4AAQSkZJRgABAQAA'
 
     def test_thumbail_length(self):
-        assert len(self.thumbnail) == 6676
+        assert len(self.thumbnail) < len(self.content)
+
+    def test_thumbnail_dimensions(self):
+        assert max(Image.open(BytesIO(base64.b64decode(self.thumbnail))).size) == 320
+
+    def test_custom_thumbnail_size(self):
+        thumbnail = ThumbnailGenerator(self.content, size=160).thumbnail_raw
+        assert max(Image.open(BytesIO(thumbnail)).size) == 160
+
+    def test_lower_quality_makes_smaller_thumbnails(self):
+        assert len(ThumbnailGenerator(self.content, quality=30).thumbnail) < len(ThumbnailGenerator(self.content, quality=90).thumbnail)
+
+    def test_raw_and_base64_thumbnails_match(self):
+        assert ThumbnailGenerator.from_raw(base64.b64decode(self.content)).thumbnail == self.thumbnail
 
     def test_thumbnail_type_is_byes(self):
         assert type(self.thumbnail) == bytes
 
-    def test_no_remaining_temporary_files(self):
-        assert os.listdir('/tmpfs') == []
+    def test_no_temporary_files_are_used(self):
+        with mock.patch('builtins.open', side_effect=AssertionError('The filesystem should not be used.')):
+            assert ThumbnailGenerator(self.content).thumbnail == self.thumbnail
@@ -0,0 +1,162 @@
+from rest_framework import status
+from django.utils import timezone
+from django.test import override_settings
+from django.template.loader import render_to_string
+from unittest import mock
+from datetime import timedelta
+import subprocess
+import base64
+
+from ..utils.test_utils import APITestCase
+from ..models import ClinicalSession, Image, Timelapse
+from ..utils.image_processing import ImageProcessingPool
+from users.models import User
+from .. import choices
+
+
+class TestTimelapse(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        self.other_medic = User.objects.create_user(username='mariano', password='12345', first_name='mariano',
+                                                    last_name='lopez', license='matricula #18323',
+                                                    dni=2432457, birth_date=timezone.now())
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            self.content = base64.b64encode(file.read())
+        self.create_image()
+        self.create_image()
+        self._log_in(self.medic, '12345')
+
+    def create_image(self) -> Image:
+        clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        return Image.objects.create(content_as_base64=self.content, clinical_session=clinical_session, tag=choices.images.FRONT)
+
+    def get_timelapse(self, tag: str = 'F'):
+        return self.client.get(f'/api/v1/timelapse/{self.patient.id}/{tag}')
+
+    def test_render_timelapse(self):
+        response = self.get_timelapse()
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['status'], choices.processing.READY[0])
+        self.assertEquals(response.data['url'], Timelapse.objects.get().url)
+        self.assertTrue(Timelapse.objects.get().content.startswith(b'\x00\x00\x00'))
+
+    def test_get_timelapse_video(self):
+        self.get_timelapse()
+        response = self.client.get(f'/api/v1/timelapse/{self.patient.id}/F/video')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'video/mp4')
+        self.assertEquals(b''.join(response.streaming_content), Timelapse.objects.get().content)
+
+    def test_lowercase_tag(self):
+        response = self.get_timelapse('f')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(Timelapse.objects.get().tag, choices.images.FRONT[0])
+
+    def test_video_of_pending_timelapse_is_not_found(self):
+        with mock.patch.object(ImageProcessingPool, 'submit_timelapse'):
+            self.get_timelapse()
+        self.assertEquals(Timelapse.objects.get().status, choices.processing.PENDING[0])
+        response = self.client.get(f'/api/v1/timelapse/{self.patient.id}/F/video')
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_video_of_missing_timelapse_is_not_found(self):
+        response = self.client.get(f'/api/v1/timelapse/{self.patient.id}/F/video')
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_timelapse_without_images(self):
+        response = self.get_timelapse('B')
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Timelapse.objects.exists())
+
+    def test_timelapse_of_not_related_patient(self):
+        self._log_in(self.other_medic, '12345')
+        self.assertEquals(self.get_timelapse().status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(f'/api/v1/timelapse/{self.patient.id}/F/video')
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_timelapse_is_not_rendered_again_if_images_did_not_change(self):
+        self.get_timelapse()
+        with mock.patch.object(ImageProcessingPool, 'submit_timelapse') as submit_timelapse:
+            response = self.get_timelapse()
+        submit_timelapse.assert_not_called()
+        self.assertEquals(response.data['status'], choices.processing.READY[0])
+
+    def test_adding_an_image_renders_the_timelapse_again(self):
+        self.get_timelapse()
+        timelapse = Timelapse.objects.get()
+        self.create_image()
+        self.assertEquals(Timelapse.objects.get().images_key, '')
+        self.get_timelapse()
+        rendered_timelapse = Timelapse.objects.get()
+        self.assertNotEquals(rendered_timelapse.blob_hash, timelapse.blob_hash)
+        self.assertEquals(rendered_timelapse.images_key,
+                          Timelapse.images_key_of(list(Timelapse.images_of(self.patient.patient, 'F').values_list('id', flat=True))))
+
+    def test_removing_an_image_renders_the_timelapse_again(self):
+        self.get_timelapse()
+        Image.objects.filter(clinical_session__patient=self.patient.patient).first().delete()
+        self.assertEquals(Timelapse.objects.get().images_key, '')
+        with mock.patch.object(ImageProcessingPool, 'submit_timelapse') as submit_timelapse:
+            self.get_timelapse()
+        submit_timelapse.assert_called_once()
+
+    @override_settings(TIMELAPSE_RENDER_TIMEOUT=1)
+    def test_hanging_render_fails(self):
+        with mock.patch('kinesioapp.models.timelapse.run_ffmpeg', side_effect=subprocess.TimeoutExpired('ffmpeg', 1)) as run_ffmpeg:
+            response = self.get_timelapse()
+        self.assertEquals(run_ffmpeg.call_args[0][1], 1)
+        self.assertEquals(response.data['status'], choices.processing.FAILED[0])
+        self.assertIsNone(response.data['url'])
+
+    def test_failed_timelapse_is_rendered_again_later(self):
+        with mock.patch('kinesioapp.models.timelapse.run_ffmpeg', side_effect=subprocess.CalledProcessError(1, 'ffmpeg')):
+            self.get_timelapse()
+        with mock.patch.object(ImageProcessingPool, 'submit_timelapse') as submit_timelapse:
+            self.get_timelapse()
+        submit_timelapse.assert_not_called()
+        Timelapse.objects.update(rendered_at=timezone.now() - timedelta(hours=1))
+        response = self.get_timelapse()
+        self.assertEquals(response.data['status'], choices.processing.READY[0])
+
+    def test_failed_timelapse_page(self):
+        with mock.patch('kinesioapp.models.timelapse.run_ffmpeg', side_effect=subprocess.CalledProcessError(1, 'ffmpeg')):
+            timelapse = Timelapse.objects.get_or_render(self.patient.patient, 'F')
+        response = render_to_string('kinesioapp/users/timelapse.html', {'timelapse': timelapse})
+        self.assertIn('No se pudo generar el timelapse', response)
+
+    def test_timelapse_page(self):
+        response = self.client.get('/timelapse', {'patient_id': self.patient.patient.id, 'tag': 'F'})
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.context['timelapse'], Timelapse.objects.get())
+
+    def test_timelapse_page_of_unknown_patient_is_not_found(self):
+        response = self.client.get('/timelapse', {'patient_id': 9999, 'tag': 'F'})
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_timelapse_page_of_not_related_patient_is_forbidden(self):
+        self._log_in(self.other_medic, '12345')
+        response = self.client.get('/timelapse', {'patient_id': self.patient.patient.id, 'tag': 'F'})
+        self.assertEquals(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Timelapse.objects.exists())
+
+    def test_images_that_cannot_be_decoded_are_left_out(self):
+        clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        # Stored as uploaded, and marked as failed once processed.
+        corrupt_image = Image.objects.create(content_as_base64=base64.b64encode(b'not an image'), clinical_session=clinical_session,
+                                             tag=choices.images.FRONT)
+        self.assertEquals(Image.objects.get(id=corrupt_image.id).status, choices.processing.FAILED[0])
+        response = self.get_timelapse()
+        self.assertEquals(response.data['status'], choices.processing.READY[0])
+
+    def test_frames_that_cannot_be_decoded_are_skipped(self):
+        clinical_session = ClinicalSession.objects.create(patient=self.patient.patient)
+        # Not processed yet, so only rendering finds out it cannot be decoded.
+        with mock.patch.object(ImageProcessingPool, 'submit'):
+            Image.objects.create(content_as_base64=base64.b64encode(b'not an image'), clinical_session=clinical_session, tag=choices.images.FRONT)
+        response = self.get_timelapse()
+        self.assertEquals(response.data['status'], choices.processing.READY[0])
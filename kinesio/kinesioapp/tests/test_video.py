@@ -1,7 +1,8 @@
 from rest_framework import status
 from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
-import requests
+from django.test import override_settings
+from urllib.parse import urlparse
 import os
 from django.conf import settings
 from typing import List, BinaryIO
@@ -32,14 +33,39 @@ class TestVideoAPI(APITestCase):
     def get_file_descriptor(self) -> BinaryIO:
         return open(f'/kinesio/kinesio/kinesioapp/tests/resources/{self.file_name}', 'rb')
 
+    def create_video(self) -> Video:
+        file = SimpleUploadedFile(self.file_name, self.get_file_descriptor().read())
+        return Video.objects.create(name='leg exercise', content=file, medic_id=self.medic.id)
+
     def test_get_video(self):
         self._log_in(self.medic, '12345')
-        file = SimpleUploadedFile(self.file_name, self.get_file_descriptor().read())
-        video = Video.objects.create(name='leg exercise', content=file, medic_id=self.medic.id)
-        # We request the video from the outside because otherwise is unreachable.
-        response = requests.get(video.url.replace(f'{settings.PUBLIC_IP}:80', 'localhost'))
+        video = self.create_video()
+        # Media files are sent by the authenticated gateway, so they are requested as the logged in user.
+        response = self.client.get(urlparse(video.url).path)
         self.assertEquals(response.status_code, status.HTTP_200_OK)
-        self.assertEquals(response.content, self.get_file_descriptor().read())
+        self.assertEquals(b''.join(response.streaming_content), self.get_file_descriptor().read())
+
+    @override_settings(MEDIA_GATEWAY_BACKEND='python')
+    def test_get_a_range_of_the_video(self):
+        self._log_in(self.medic, '12345')
+        video = self.create_video()
+        response = self.client.get(urlparse(video.url).path, HTTP_RANGE='bytes=0-99')
+        self.assertEquals(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEquals(b''.join(response.streaming_content), self.get_file_descriptor().read()[:100])
+
+    def test_anonymous_users_cannot_get_the_video(self):
+        video = self.create_video()
+        response = self.client.get(urlparse(video.url).path)
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_other_medics_cannot_get_the_video(self):
+        video = self.create_video()
+        User.objects.create_user(username='pedro', password='12345', first_name='pedro',
+                                 last_name='garcia', license='matricula #15434',
+                                 dni=39203041, birth_date=timezone.now())
+        self.client.login(username='pedro', password='12345')
+        response = self.client.get(urlparse(video.url).path)
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
     def test_thumbnail_file_is_generated_after_video_creation(self):
         self._log_in(self.medic, '12345')
@@ -0,0 +1,116 @@
+from rest_framework import status
+from django.test import override_settings
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from unittest import mock, skipUnless
+from io import StringIO
+import hashlib
+import shutil
+import os
+
+from ..utils.test_utils import APITestCase
+from ..models import Video
+from ..utils.video_metadata import read_metadata
+from users.models import User
+from .. import choices
+
+
+# What ffprobe says about the test video, trimmed to what is read from it
+PROBE = {
+    'streams': [
+        {'codec_type': 'audio', 'codec_name': 'aac'},
+        {'codec_type': 'video', 'codec_name': 'h264', 'width': 864, 'height': 480},
+    ],
+    'format': {'duration': '10.000000', 'bit_rate': '1015040'},
+}
+
+
+class TestVideoMetadata(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/test_video.mp4', 'rb') as file:
+            self.content = file.read()
+        self._log_in(self.medic, '12345')
+
+    def tearDown(self) -> None:
+        for video in Video.objects.all():
+            for path in (video.content.path, f'{video.content.path}_thumb.jpg'):
+                if os.path.exists(path):
+                    os.remove(path)
+            video.delete()
+
+    def create_video(self) -> Video:
+        return Video.objects.create(name='leg exercise', content=SimpleUploadedFile('test_video.mp4', self.content), medic_id=self.medic.id)
+
+    def test_metadata_is_read_when_the_video_is_processed(self):
+        with mock.patch('kinesioapp.utils.video_metadata.run_ffprobe', return_value=PROBE):
+            video = self.create_video()
+        response = self.client.get(f'/api/v1/video/{video.id}')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.json()['duration'], 10.0)
+        self.assertEquals((response.json()['width'], response.json()['height']), (864, 480))
+        self.assertEquals(response.json()['codec'], 'h264')
+        self.assertEquals(response.json()['bitrate'], 1015040)
+        self.assertEquals(response.json()['content_hash'], hashlib.sha256(self.content).hexdigest())
+
+    @skipUnless(shutil.which('ffprobe'), 'ffprobe is not installed.')
+    def test_metadata_read_by_ffprobe(self):
+        metadata = read_metadata('/kinesio/kinesio/kinesioapp/tests/resources/test_video.mp4')
+        self.assertEquals((metadata['width'], metadata['height'], metadata['codec']), (864, 480, 'h264'))
+        self.assertAlmostEquals(metadata['duration'], 10, places=0)
+
+    def test_videos_ffprobe_cannot_read_are_processed(self):
+        with mock.patch('kinesioapp.utils.video_metadata.run_ffprobe', side_effect=FileNotFoundError('ffprobe')):
+            video = Video.objects.get(id=self.create_video().id)
+        self.assertEquals(video.status, choices.processing.READY[0])
+        self.assertIsNone(video.duration)
+        self.assertEquals(video.content_hash, hashlib.sha256(self.content).hexdigest())
+
+    def test_portrait_videos_have_their_size_as_played(self):
+        probe = {'streams': [{'codec_type': 'video', 'width': 1920, 'height': 1080, 'side_data_list': [{'rotation': -90}]}], 'format': {}}
+        with mock.patch('kinesioapp.utils.video_metadata.run_ffprobe', return_value=probe):
+            metadata = read_metadata('/kinesio/kinesio/kinesioapp/tests/resources/test_video.mp4')
+        self.assertEquals((metadata['width'], metadata['height']), (1080, 1920))
+
+    def test_unknown_values_are_null(self):
+        probe = {'streams': [], 'format': {'duration': 'N/A'}}
+        with mock.patch('kinesioapp.utils.video_metadata.run_ffprobe', return_value=probe):
+            metadata = read_metadata('/kinesio/kinesio/kinesioapp/tests/resources/test_video.mp4')
+        self.assertIsNone(metadata['duration'])
+        self.assertIsNone(metadata['height'])
+
+    @override_settings(VIDEO_HLS_RENDITIONS=[(720, 2400), (240, 300), (1080, 4800)])
+    def test_only_renditions_up_to_the_height_of_the_video_are_generated(self):
+        self.assertEquals(Video(height=720).hls_renditions, [(240, 300), (720, 2400)])
+        self.assertEquals(Video(height=120).hls_renditions, [(240, 300)])
+        self.assertEquals(len(Video().hls_renditions), 3)
+
+    def test_master_playlist_has_the_resolution_of_each_rendition(self):
+        with mock.patch('kinesioapp.utils.video_metadata.run_ffprobe', return_value=PROBE):
+            video = self.create_video()
+        with open(os.path.join(video.hls_directory, 'master.m3u8')) as master_playlist:
+            stream_infos = [line for line in master_playlist.read().splitlines() if line.startswith('#EXT-X-STREAM-INF')]
+        self.assertEquals([stream_info.split('RESOLUTION=')[1] for stream_info in stream_infos], ['260x144', '432x240'])
+
+    def test_backfill_reads_the_metadata_of_older_videos(self):
+        with mock.patch.object(Video, 'process'):
+            videos = [self.create_video() for _ in range(3)]
+        Video.objects.filter(id=videos[0].id).update(content_hash='0' * 64)
+        with mock.patch('kinesioapp.utils.video_metadata.run_ffprobe', return_value=PROBE):
+            call_command('backfill_video_metadata', workers=2, stdout=StringIO())
+        self.assertEquals(Video.objects.get(id=videos[0].id).content_hash, '0' * 64)
+        for video in Video.objects.filter(id__in=[video.id for video in videos[1:]]):
+            self.assertEquals(video.height, 480)
+            self.assertEquals(video.content_hash, hashlib.sha256(self.content).hexdigest())
+
+    def test_backfill_skips_missing_files(self):
+        with mock.patch.object(Video, 'process'):
+            missing, present = self.create_video(), self.create_video()
+        os.remove(missing.content.path)
+        with mock.patch('kinesioapp.utils.video_metadata.run_ffprobe', return_value=PROBE):
+            call_command('backfill_video_metadata', workers=1, all=True, stdout=StringIO(), stderr=StringIO())
+        self.assertIsNone(Video.objects.get(id=missing.id).content_hash)
+        self.assertIsNotNone(Video.objects.get(id=present.id).content_hash)
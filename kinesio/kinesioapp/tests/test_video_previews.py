@@ -0,0 +1,74 @@
+from rest_framework import status
+from django.test import override_settings
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image as PILImage
+from unittest import mock
+import os
+
+from ..utils.test_utils import APITestCase
+from ..models import Video
+from ..models.video import vtt_timestamp
+from .test_video_metadata import PROBE
+from users.models import User
+
+
+@override_settings(VIDEO_PREVIEW_FRAMES=8, VIDEO_PREVIEW_COLUMNS=3, VIDEO_PREVIEW_HEIGHT=90)
+class TestVideoPreviews(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/test_video.mp4', 'rb') as file:
+            self.content = file.read()
+        self._log_in(self.medic, '12345')
+
+    def tearDown(self) -> None:
+        for video in Video.objects.all():
+            for path in (video.content.path, f'{video.content.path}_thumb.jpg'):
+                if os.path.exists(path):
+                    os.remove(path)
+            video.delete()
+
+    def create_video(self, probe: dict = PROBE) -> Video:
+        with mock.patch('kinesioapp.utils.video_metadata.run_ffprobe', return_value=probe):
+            return Video.objects.create(name='leg exercise', content=SimpleUploadedFile('test_video.mp4', self.content), medic_id=self.medic.id)
+
+    def test_sprite_sheet_has_every_frame(self):
+        video = self.create_video()
+        sprite = PILImage.open(os.path.join(video.previews_directory, 'sprite.jpg'))
+        # 8 frames of 162x90 on 3 columns: 3 rows, the last one with 2 frames.
+        self.assertEquals(sprite.size, (3 * 162, 3 * 90))
+
+    def test_track_maps_each_interval_to_its_frame(self):
+        video = self.create_video()
+        with open(os.path.join(video.previews_directory, 'previews.vtt')) as track:
+            cues = track.read().split('\n\n')
+        self.assertEquals(cues[0], 'WEBVTT')
+        self.assertEquals(cues[1], '00:00:00.000 --> 00:00:01.250\nsprite.jpg#xywh=0,0,162,90')
+        self.assertEquals(cues[8], '00:00:08.750 --> 00:00:10.000\nsprite.jpg#xywh=162,180,162,90\n')
+
+    def test_previews_are_served(self):
+        video = self.create_video()
+        response = self.client.get(f'/api/v1/video/{video.id}')
+        self.assertTrue(response.json()['sprite_url'].endswith(f'/media/previews/{video.id}/sprite.jpg'))
+        response = self.client.get(response.json()['previews_url'])
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'text/vtt')
+
+    def test_videos_without_duration_have_no_previews(self):
+        video = self.create_video(probe={'streams': [], 'format': {}})
+        response = self.client.get(f'/api/v1/video/{video.id}')
+        self.assertIsNone(response.json()['previews_url'])
+        self.assertIsNone(response.json()['sprite_url'])
+        self.assertFalse(os.path.exists(video.previews_directory))
+
+    def test_previews_are_deleted_with_the_video(self):
+        video = self.create_video()
+        video.delete()
+        self.assertFalse(os.path.exists(video.previews_directory))
+        os.remove(video.content.path)
+        os.remove(f'{video.content.path}_thumb.jpg')
+
+    def test_vtt_timestamp(self):
+        self.assertEquals(vtt_timestamp(3725.1234), '01:02:05.123')
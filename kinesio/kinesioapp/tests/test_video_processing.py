@@ -0,0 +1,139 @@
+from rest_framework import status
+from django.test import override_settings
+from django.conf import settings
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from ffmpy import FFmpeg
+from unittest import mock
+from datetime import timedelta
+import subprocess
+import os
+
+from ..utils.test_utils import APITestCase
+from ..models import Video
+from ..cron import ProcessPendingVideos
+from ..utils.ffmpeg import run_ffmpeg
+from ..utils.image_processing import ImageProcessingPool, process_video
+from users.models import User
+from .. import choices
+
+
+class TestVideoProcessing(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/test_video.mp4', 'rb') as file:
+            self.content = file.read()
+        self._log_in(self.medic, '12345')
+
+    def tearDown(self) -> None:
+        for video in Video.objects.all():
+            for path in (video.content.path, f'{video.content.path}_thumb.jpg'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def create_video(self) -> Video:
+        return Video.objects.create(name='leg exercise', content=SimpleUploadedFile('test_video.mp4', self.content), medic_id=self.medic.id)
+
+    @override_settings(IMAGE_PROCESSING_SYNCHRONOUS=False)
+    def test_upload_returns_before_processing(self):
+        with mock.patch('django.db.transaction.on_commit') as on_commit:
+            response = self.client.post('/api/v1/video/', {'content': SimpleUploadedFile('test_video.mp4', self.content), 'name': 'leg exercise'})
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(response.json()['status'], choices.processing.PENDING[0])
+        self.assertIsNone(response.json()['thumbnail_url'])
+        on_commit.assert_called_once()
+        self.assertFalse(os.path.exists(f'{Video.objects.get().content.path}_thumb.jpg'))
+
+    @override_settings(IMAGE_PROCESSING_SYNCHRONOUS=False)
+    def test_videos_are_processed_apart_from_images(self):
+        with mock.patch.object(ImageProcessingPool, 'executor', new_callable=mock.PropertyMock) as executor, \
+                mock.patch.object(ImageProcessingPool, 'video_executor', new_callable=mock.PropertyMock) as video_executor, \
+                mock.patch('django.db.transaction.on_commit', side_effect=lambda function: function()):
+            video = self.create_video()
+        video_executor.return_value.submit.assert_called_once_with(process_video, video.id)
+        executor.assert_not_called()
+
+    def test_processed_video_is_ready(self):
+        video = self.create_video()
+        response = self.client.get(f'/api/v1/video/{video.id}')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.json()['status'], choices.processing.READY[0])
+        self.assertTrue(response.json()['thumbnail_url'].endswith('_thumb.jpg'))
+        self.assertTrue(response.json()['streaming_url'].endswith(f'/media/hls/{video.id}/master.m3u8'))
+        self.assertTrue(os.path.exists(f'{video.content.path}_thumb.jpg'))
+
+    def test_hls_renditions_are_listed_on_the_master_playlist(self):
+        video = self.create_video()
+        with open(os.path.join(video.hls_directory, 'master.m3u8')) as master_playlist:
+            lines = master_playlist.read().splitlines()
+        self.assertEquals(lines[0], '#EXTM3U')
+        renditions = [line for line in lines if not line.startswith('#')]
+        self.assertEquals(renditions, [f'{height}p/index.m3u8' for height, _ in settings.VIDEO_HLS_RENDITIONS])
+        for rendition in renditions:
+            directory = os.path.dirname(os.path.join(video.hls_directory, rendition))
+            self.assertTrue(os.path.exists(os.path.join(directory, 'index.m3u8')))
+            # The test video lasts 10 seconds, so it is split in two segments.
+            self.assertEquals(len([file for file in os.listdir(directory) if file.endswith('.ts')]), 2)
+
+    def test_hls_files_are_deleted_with_the_video(self):
+        video = self.create_video()
+        video.delete()
+        self.assertFalse(os.path.exists(video.hls_directory))
+        # The uploaded file is kept, as always, so remove it here since the video is no longer there for tearDown.
+        os.remove(video.content.path)
+        os.remove(f'{video.content.path}_thumb.jpg')
+
+    def test_videos_uploaded_before_hls_have_no_streaming_url(self):
+        video = self.create_video()
+        Video.objects.filter(id=video.id).update(hls_playlist=None)
+        self.assertIsNone(Video.objects.get(id=video.id).streaming_url)
+
+    def test_failed_attempts_are_retried(self):
+        with mock.patch.object(Video, 'generate_thumbnail', side_effect=[subprocess.CalledProcessError(1, 'ffmpeg'), None]):
+            video = self.create_video()
+        video = Video.objects.get(id=video.id)
+        self.assertEquals(video.status, choices.processing.READY[0])
+        self.assertEquals(video.attempts, 2)
+
+    @override_settings(VIDEO_PROCESSING_MAX_ATTEMPTS=2)
+    def test_video_fails_after_the_last_attempt(self):
+        with mock.patch.object(Video, 'generate_thumbnail', side_effect=subprocess.TimeoutExpired('ffmpeg', 1)) as generate_thumbnail:
+            video = self.create_video()
+        video = Video.objects.get(id=video.id)
+        self.assertEquals(video.status, choices.processing.FAILED[0])
+        self.assertEquals(generate_thumbnail.call_count, 2)
+        self.assertIsNone(video.thumbnail_url)
+
+    def test_pending_videos_are_processed_by_the_cron_job(self):
+        with mock.patch.object(Video, 'process'):
+            video = self.create_video()
+        self.assertEquals(Video.objects.get(id=video.id).status, choices.processing.PENDING[0])
+        ProcessPendingVideos().do()
+        self.assertEquals(Video.objects.get(id=video.id).status, choices.processing.READY[0])
+
+    def test_videos_being_processed_are_skipped_by_the_cron_job(self):
+        with mock.patch.object(Video, 'process'):
+            video = self.create_video()
+        self.assertTrue(Video.objects.claim(video.id))
+        with mock.patch.object(Video, 'generate_thumbnail') as generate_thumbnail:
+            ProcessPendingVideos().do()
+        generate_thumbnail.assert_not_called()
+        video = Video.objects.get(id=video.id)
+        self.assertEquals((video.status, video.attempts), (choices.processing.PENDING[0], 0))
+
+    def test_expired_claims_are_taken_over(self):
+        with mock.patch.object(Video, 'process'):
+            video = self.create_video()
+        Video.objects.filter(id=video.id).update(processing_started_at=timezone.now() - timedelta(hours=2), attempts=1)
+        ProcessPendingVideos().do()
+        video = Video.objects.get(id=video.id)
+        self.assertEquals((video.status, video.attempts), (choices.processing.READY[0], 2))
+        self.assertIsNone(video.processing_started_at)
+
+    def test_hanging_ffmpeg_is_killed(self):
+        # An endless generated input never finishes on its own.
+        command = FFmpeg(global_options='-loglevel quiet', inputs={'testsrc': ['-f', 'lavfi', '-re']}, outputs={'-': ['-f', 'null']})
+        with self.assertRaises(subprocess.TimeoutExpired):
+            run_ffmpeg(command, timeout=1)
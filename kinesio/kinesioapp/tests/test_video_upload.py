@@ -0,0 +1,198 @@
+from rest_framework import status
+from django.test import override_settings
+from django.conf import settings
+from django.utils import timezone
+from unittest import mock
+from datetime import timedelta
+from io import BytesIO
+import os
+
+from ..utils.test_utils import APITestCase
+from ..models import Video, VideoUpload
+from ..cron import DeleteAbandonedVideoUploads
+from users.models import User
+from .. import choices
+
+
+class TestVideoUpload(APITestCase):
+    def setUp(self) -> None:
+        self.medic = User.objects.create_user(username='juan', password='12345', first_name='juan',
+                                              last_name='gomez', license='matricula #15433',
+                                              dni=39203040, birth_date=timezone.now())
+        self.patient = User.objects.create_user(first_name='facundo', last_name='perez', username='pepe',
+                                                password='12345', current_medic=self.medic,
+                                                dni=564353, birth_date=timezone.now())
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/test_video.mp4', 'rb') as file:
+            self.content = file.read()
+        self._log_in(self.medic, '12345')
+
+    def tearDown(self) -> None:
+        for video in Video.objects.all():
+            for path in (video.content.path, f'{video.content.path}_thumb.jpg'):
+                if os.path.exists(path):
+                    os.remove(path)
+            video.delete()
+        VideoUpload.objects.all().delete()
+
+    def start_upload(self, size: int = None) -> dict:
+        data = {'name': 'leg exercise', 'file_name': 'test_video.mp4', 'size': len(self.content) if size is None else size}
+        response = self.client.post('/api/v1/video/uploads/', data, format='json')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        return response.json()
+
+    def send_chunk(self, upload_id: int, offset: int, chunk: bytes):
+        return self.client.put(f'/api/v1/video/uploads/{upload_id}?offset={offset}', chunk, content_type='application/octet-stream')
+
+    def send_all_chunks(self, upload_id: int, chunk_size: int = 200 * 1024) -> None:
+        for offset in range(0, len(self.content), chunk_size):
+            response = self.send_chunk(upload_id, offset, self.content[offset:offset + chunk_size])
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            self.assertEquals(response.json()['offset'], min(offset + chunk_size, len(self.content)))
+
+    def test_video_uploaded_in_chunks_is_created(self):
+        upload = self.start_upload()
+        self.assertEquals(upload['offset'], 0)
+        self.send_all_chunks(upload['id'])
+        response = self.client.post(f'/api/v1/video/uploads/{upload["id"]}/finalize')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        video = Video.objects.get(id=response.json()['id'])
+        self.assertEquals(video.name, 'leg exercise')
+        self.assertEquals(video.status, choices.processing.READY[0])
+        with open(video.content.path, 'rb') as file:
+            self.assertEquals(file.read(), self.content)
+        self.assertFalse(VideoUpload.objects.exists())
+
+    def test_finalized_uploads_do_not_replace_videos_with_the_same_file_name(self):
+        with mock.patch.object(Video, 'process'):
+            videos = []
+            for _ in range(2):
+                upload = self.start_upload()
+                self.send_all_chunks(upload['id'], chunk_size=len(self.content))
+                videos.append(Video.objects.get(id=self.client.post(f'/api/v1/video/uploads/{upload["id"]}/finalize').json()['id']))
+        self.assertNotEquals(videos[0].content.name, videos[1].content.name)
+
+    def test_upload_is_resumed_from_its_offset(self):
+        upload = self.start_upload()
+        self.send_chunk(upload['id'], 0, self.content[:1000])
+        # The connection dropped before the response of the next chunk arrived: the client asks where to resume from.
+        self.assertEquals(self.client.get(f'/api/v1/video/uploads/{upload["id"]}').json()['offset'], 1000)
+        response = self.send_chunk(upload['id'], 1000, self.content[1000:])
+        self.assertEquals(response.json()['offset'], len(self.content))
+
+    def test_chunks_are_read_before_locking_the_upload(self):
+        upload = VideoUpload.objects.get(id=self.start_upload()['id'])
+        stream = BytesIO(self.content[:1000])
+        select_for_update = VideoUpload.objects.select_for_update
+
+        def lock_after_reading_the_chunk():
+            self.assertEquals(stream.tell(), 1000)
+            return select_for_update()
+        with mock.patch.object(VideoUpload.objects, 'select_for_update', side_effect=lock_after_reading_the_chunk):
+            upload.write_chunk(0, stream, 1000)
+        self.assertEquals(VideoUpload.objects.get(id=upload.id).offset, 1000)
+
+    def test_chunks_out_of_order_are_rejected(self):
+        upload = self.start_upload()
+        self.send_chunk(upload['id'], 0, self.content[:1000])
+        for offset in (0, 2000):
+            response = self.send_chunk(upload['id'], offset, self.content[offset:offset + 1000])
+            self.assertEquals(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertEquals(response.json()['offset'], 1000)
+
+    def test_chunks_past_the_size_are_rejected(self):
+        upload = self.start_upload(size=1000)
+        response = self.send_chunk(upload['id'], 0, self.content[:1001])
+        self.assertEquals(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEquals(response.json()['offset'], 0)
+
+    @override_settings(VIDEO_UPLOAD_CHUNK_MAX_SIZE=100)
+    def test_large_chunks_are_rejected(self):
+        upload = self.start_upload()
+        self.assertEquals(self.send_chunk(upload['id'], 0, self.content[:101]).status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_chunks_without_offset_are_rejected(self):
+        upload = self.start_upload()
+        response = self.client.put(f'/api/v1/video/uploads/{upload["id"]}', self.content[:100], content_type='application/octet-stream')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunks_with_an_invalid_length_are_rejected(self):
+        upload = self.start_upload()
+        for content_length in ('abc', '-100', '\u00b2'):
+            response = self.client.put(f'/api/v1/video/uploads/{upload["id"]}?offset=0', self.content[:100],
+                                       content_type='application/octet-stream', CONTENT_LENGTH=content_length)
+            self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(VideoUpload.objects.get(id=upload['id']).offset, 0)
+
+    @override_settings(VIDEO_UPLOAD_MAX_SIZE=1000)
+    def test_large_videos_are_rejected(self):
+        response = self.client.post('/api/v1/video/uploads/', {'name': 'leg exercise', 'file_name': 'test_video.mp4', 'size': 1001}, format='json')
+        self.assertEquals(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_videos_up_to_the_maximum_size_can_be_uploaded(self):
+        upload = self.start_upload(size=settings.VIDEO_UPLOAD_MAX_SIZE)
+        self.assertEquals(VideoUpload.objects.get(id=upload['id']).size, 2 * 1024 * 1024 * 1024)
+
+    def test_negative_sizes_are_rejected(self):
+        response = self.client.post('/api/v1/video/uploads/', {'name': 'leg exercise', 'file_name': 'test_video.mp4', 'size': -1}, format='json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_incomplete_uploads_are_not_finalized(self):
+        upload = self.start_upload()
+        self.send_chunk(upload['id'], 0, self.content[:1000])
+        response = self.client.post(f'/api/v1/video/uploads/{upload["id"]}/finalize')
+        self.assertEquals(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEquals(response.json()['offset'], 1000)
+        self.assertFalse(Video.objects.exists())
+
+    def test_uploads_finalized_twice_create_a_single_video(self):
+        upload = self.start_upload()
+        self.send_all_chunks(upload['id'])
+        first_request_upload, second_request_upload = VideoUpload.objects.get(id=upload['id']), VideoUpload.objects.get(id=upload['id'])
+        first_request_upload.finalize()
+        with self.assertRaises(VideoUpload.DoesNotExist):
+            second_request_upload.finalize()
+        self.assertEquals(Video.objects.count(), 1)
+        self.assertTrue(os.path.exists(Video.objects.get().content.path))
+
+    def test_file_is_moved_back_if_the_video_cannot_be_created(self):
+        upload = self.start_upload()
+        self.send_all_chunks(upload['id'])
+        video_upload = VideoUpload.objects.get(id=upload['id'])
+        with mock.patch.object(Video.objects, 'create', side_effect=RuntimeError('database is gone')):
+            with self.assertRaises(RuntimeError):
+                video_upload.finalize()
+        with open(video_upload.path, 'rb') as file:
+            self.assertEquals(file.read(), self.content)
+        video = video_upload.finalize()
+        with open(video.content.path, 'rb') as file:
+            self.assertEquals(file.read(), self.content)
+
+    def test_patients_cannot_upload_videos(self):
+        self._log_in(self.patient, '12345')
+        response = self.client.post('/api/v1/video/uploads/', {'name': 'leg exercise', 'file_name': 'test_video.mp4', 'size': 10}, format='json')
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_only_the_uploading_medic_can_send_chunks(self):
+        upload = self.start_upload()
+        another_medic = User.objects.create_user(username='raul22', password='12345', first_name='raul',
+                                                 last_name='sanchez', license='matricula #5555',
+                                                 dni=9203040, birth_date=timezone.now())
+        self._log_in(another_medic, '12345')
+        self.assertEquals(self.send_chunk(upload['id'], 0, self.content[:1000]).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEquals(self.client.post(f'/api/v1/video/uploads/{upload["id"]}/finalize').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cancelled_uploads_are_deleted_with_their_file(self):
+        upload = self.start_upload()
+        self.send_chunk(upload['id'], 0, self.content[:1000])
+        path = VideoUpload.objects.get(id=upload['id']).path
+        self.assertEquals(self.client.delete(f'/api/v1/video/uploads/{upload["id"]}').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(os.path.exists(path))
+
+    def test_abandoned_uploads_are_deleted_by_the_cron_job(self):
+        abandoned, active = self.start_upload(), self.start_upload()
+        self.send_chunk(abandoned['id'], 0, self.content[:1000])
+        VideoUpload.objects.filter(id=abandoned['id']).update(last_updated=timezone.now() - timedelta(days=2))
+        path = VideoUpload.objects.get(id=abandoned['id']).path
+        DeleteAbandonedVideoUploads().do()
+        self.assertEquals(list(VideoUpload.objects.values_list('id', flat=True)), [active['id']])
+        self.assertFalse(os.path.exists(path))
@@ -3,8 +3,13 @@ from rest_framework import status
 from django.urls import reverse
 from django.utils import timezone
 from datetime import datetime
+from unittest import mock
+import base64
 
-from ..models import ClinicalSession
+from ..models import ClinicalSession, Image
+from ..utils.blob_store import BlobStore
+from ..utils.crypto import ImageCipher
+from .. import choices
 from users.models import User, SecretQuestion
 
 
@@ -53,3 +58,17 @@ class TestWebView(TestCase):
         response = self.client.get(url + '?clinical_session_id=' + str(self.session.id))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'kinesioapp/users/clinical_session.html')
+
+    def test_clinical_session_page_references_images_by_url(self):
+        with open('/kinesio/kinesio/kinesioapp/tests/resources/kinesio.jpg', 'rb') as file:
+            image = Image.objects.create(content_as_base64=base64.b64encode(file.read()), clinical_session=self.session, tag=choices.images.FRONT)
+        self.client.force_login(self.medic)
+        url = reverse('clinical_session_view')
+        with mock.patch.object(BlobStore, 'get') as get_blob, mock.patch.object(ImageCipher, 'decrypt') as decrypt:
+            response = self.client.get(url + '?clinical_session_id=' + str(self.session.id))
+        self.assertEqual(response.status_code, 200)
+        get_blob.assert_not_called()
+        decrypt.assert_not_called()
+        self.assertContains(response, f'href="/api/v1/image/{image.id}/raw"')
+        self.assertContains(response, f'data-lazy="/api/v1/image/{image.id}/thumbnail"')
+        self.assertNotContains(response, 'data:image/jpeg;base64')
@@ -15,18 +15,31 @@ web_url_patterns = [
 api_url_patterns = [
     # Clinical Sessions
     re_path(r'^api/v1/clinical_sessions/?$', api.ClinicalSessionAPIView.as_view(), name='clinical_session'),
+    re_path(r'^api/v1/clinical_sessions/with_images/?$', api.ClinicalSessionWithImagesAPIView.as_view(), name='clinical_session_with_images'),
     re_path(r'^api/v1/clinical_sessions_for_patient/(?P<patient_id>[0-9]+)/?$', api.ClinicalSessionsForPatientView.as_view(), name='clinical_sessions_for_patient'),
     re_path(r'^api/v1/clinical_sessions/(?P<id>[0-9]+)/?$', api.ClinicalSessionUpdateAndDeleteAPIView.as_view(), name='clinical_session_update_and_delete'),
 
     # Images
     re_path(r'^api/v1/image/?$', api.ImageCreateAPIView.as_view(), name='image_create'),
     re_path(r'^api/v1/image/(?P<id>[0-9]+)/?$', api.ImageDetailsAndDeleteAPIView.as_view(), name='image'),
+    # These should be placed before 'images_with_tag' because 'raw', 'thumbnail' and 'status' also match a tag.
+    re_path(r'^api/v1/image/(?P<id>[0-9]+)/raw/?$', api.ImageRawContentAPIView.as_view(), name='image_raw_content'),
+    re_path(r'^api/v1/image/(?P<id>[0-9]+)/thumbnail/?$', api.ImageThumbnailAPIView.as_view(), name='image_thumbnail'),
+    re_path(r'^api/v1/image/(?P<id>[0-9]+)/status/?$', api.ImageStatusAPIView.as_view(), name='image_status'),
     re_path(r'^api/v1/image/of_session/(?P<session_id>[0-9]+)/?$', api.ImagesOfClinicalSessionAPIView.as_view(), name='images_of_session'),
+    re_path(r'^api/v1/image/of_session/(?P<session_id>[0-9]+)/hash/(?P<source_hash>[0-9a-f]{64})/?$', api.ImageHashCheckAPIView.as_view(), name='image_hash_check'),
     re_path(r'^api/v1/image/(?P<patient_id>[0-9]+)/(?P<tag>[a-zA-Z]+)/?$', api.ImagesWithTagAPIView.as_view(), name='images_with_tag'),
 
+    # Timelapses
+    re_path(r'^api/v1/timelapse/(?P<patient_id>[0-9]+)/(?P<tag>[a-zA-Z])/?$', api.TimelapseAPIView.as_view(), name='timelapse'),
+    re_path(r'^api/v1/timelapse/(?P<patient_id>[0-9]+)/(?P<tag>[a-zA-Z])/video/?$', api.TimelapseVideoAPIView.as_view(), name='timelapse_video'),
+
     # Videos
     re_path(r'^api/v1/video/?$', api.VideoUploadView.as_view(), name='video_create'),
-    re_path(r'^api/v1/video/(?P<id>[0-9]+)/?$', api.VideoDeleteAPIView.as_view(), name='video_delete'),
+    re_path(r'^api/v1/video/(?P<id>[0-9]+)/?$', api.VideoDetailsAndDeleteAPIView.as_view(), name='video'),
+    re_path(r'^api/v1/video/uploads/?$', api.VideoUploadCreateAPIView.as_view(), name='video_upload_create'),
+    re_path(r'^api/v1/video/uploads/(?P<id>[0-9]+)/?$', api.VideoUploadAPIView.as_view(), name='video_upload'),
+    re_path(r'^api/v1/video/uploads/(?P<id>[0-9]+)/finalize/?$', api.VideoUploadFinalizeAPIView.as_view(), name='video_upload_finalize'),
 
     # Exercises
     re_path(r'^api/v1/exercises_for_patient/(?P<patient_id>[0-9]+)/?$', api.ExercisesForPatientView.as_view(), name='exercises_for_patient'),
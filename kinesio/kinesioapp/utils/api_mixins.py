@@ -6,6 +6,8 @@ from django.shortcuts import get_object_or_404
 from django.db import models
 from typing import Optional
 
+from .http_caching import cache_as_immutable, conditional_response
+
 
 class GenericPatchViewWithoutPut(APIView):
     def patch(self, request: HttpRequest, id: int) -> Response:
@@ -43,10 +45,21 @@ class GenericListView(APIView):
 
 
 class GenericDetailsView(APIView):
+    # Set a queryset to choose which columns are loaded. Otherwise, the default manager of the model class is used.
+    queryset: Optional[models.QuerySet] = None
+
     def get(self, request: HttpRequest, id: int) -> Response:
-        instance = get_object_or_404(self.model_class, id=id)
+        instance = get_object_or_404(self.model_class if self.queryset is None else self.queryset, id=id)
         if not instance.can_view(request.user):
             return Response(status=status.HTTP_401_UNAUTHORIZED,
                             data={'message': 'No tiene permisos para ver este objeto.'})
+        etag = self.etag_of(instance)
+        not_modified = conditional_response(request, etag)
+        if not_modified is not None:
+            return not_modified
         serializer = self.serializer_class(instance)
-        return Response(status=status.HTTP_200_OK, data=serializer.data)
+        return cache_as_immutable(Response(status=status.HTTP_200_OK, data=serializer.data), etag)
+
+    def etag_of(self, instance: models.Model) -> Optional[str]:
+        """ Override it to return the ETag of instances that will not change anymore, so clients can cache them. """
+        return None
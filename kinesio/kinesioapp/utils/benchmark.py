@@ -0,0 +1,127 @@
+from PIL import Image as PILImage
+from django.conf import settings
+from django.test import override_settings
+from io import BytesIO
+from typing import Callable, Dict, Iterable, List
+import PIL
+import base64
+import cryptography
+import django
+import math
+import platform
+import tempfile
+import time
+import tracemalloc
+
+from .. import choices
+from .blob_store import BlobStore
+from .crypto import ImageCipher
+from .image_ingest import ImageIngest
+from .thumbnail import ThumbnailGenerator
+from .thumbnail_cache import ThumbnailCache
+
+
+PERCENTILES = [50, 90, 99]
+
+
+def generate_photo(megapixels: float, quality: int = 90) -> bytes:
+    """ JPEG photo of the given size, 4:3 like phone cameras. Gradients with noise compress about as well as real photos,
+        while plain colors would make every stage unrealistically cheap. """
+    width = round(math.sqrt(megapixels * 1000000 * 4 / 3))
+    height = round(width * 3 / 4)
+    size = width, height
+    gradient = PILImage.linear_gradient('L').resize(size)
+    noise = PILImage.effect_noise(size, 48)
+    im = PILImage.merge('RGB', (gradient, noise, gradient.transpose(PILImage.ROTATE_180)))
+    output = BytesIO()
+    im.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+def percentile(sorted_values: List[float], percent: int) -> float:
+    # Nearest rank: always one of the measured values.
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+
+def measure(operation: Callable[[], object], iterations: int, processed_bytes: int) -> dict:
+    """ Runs the operation once to warm it up, then measures its latency on every iteration.
+        The peak memory is measured on a separate run, since tracing allocations slows everything down.
+        It only counts memory allocated through Python: Pillow's pixel buffers are not included. """
+    operation()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'iterations': iterations,
+        'operations_per_second': iterations / total,
+        'megabytes_per_second': processed_bytes * iterations / total / 1024 / 1024,
+        'latency_ms': dict({f'p{percent}': percentile(latencies, percent) * 1000 for percent in PERCENTILES},
+                           min=latencies[0] * 1000, max=latencies[-1] * 1000, mean=total / iterations * 1000),
+        'peak_traced_memory_bytes': peak_memory,
+    }
+
+
+def benchmark_photo(content: bytes, iterations: int) -> Dict[str, dict]:
+    """ Measures each stage of the image path on the photo. Blobs are written to the blob store in settings. """
+    # We need to use dynamic imports to avoid circular imports.
+    from ..models import Image
+    from ..serializers import ImageSerializer, ThumbnailSerializer
+    # The mobile front end sends base64 with escaped line breaks.
+    content_as_base64 = base64.encodebytes(content).replace(b'\n', b'\\n')
+    cipher, blob_store = ImageCipher(), BlobStore()
+    encrypted_content = cipher.encrypt(content)
+    thumbnail = ThumbnailGenerator.from_raw(content).thumbnail_raw
+    encrypted_thumbnail = cipher.encrypt(thumbnail)
+    # Never saved: rows are not part of the image path being measured.
+    image = Image(id=0, content_hash=blob_store.put(encrypted_content), thumbnail_hash=blob_store.put(encrypted_thumbnail),
+                  tag=choices.images.FRONT[0], status=choices.processing.READY[0])
+
+    def serialize_thumbnail() -> dict:
+        # Measure the decryption, not the thumbnail cache.
+        ThumbnailCache().invalidate(image.id)
+        return ThumbnailSerializer(image).data
+
+    operations = {
+        'base64_cleanup': (lambda: base64.b64decode(content_as_base64.replace(b'\\n', b'').replace(b'\n', b'')), len(content_as_base64)),
+        'encryption': (lambda: cipher.encrypt(content), len(content)),
+        'decryption': (lambda: cipher.decrypt(encrypted_content), len(encrypted_content)),
+        'ingest': (lambda: ImageIngest(content).store(blob_store), len(content)),
+        'thumbnail_generation': (lambda: ThumbnailGenerator.from_raw(content).thumbnail_raw, len(content)),
+        'content_as_base64': (lambda: image.content_as_base64, len(encrypted_content)),
+        'image_serialization': (lambda: ImageSerializer(image).data, len(encrypted_content)),
+        'thumbnail_serialization': (serialize_thumbnail, len(encrypted_thumbnail)),
+    }
+    return {name: measure(operation, iterations, processed_bytes) for name, (operation, processed_bytes) in operations.items()}
+
+
+def benchmark_image_pipeline(megapixels: Iterable[float], iterations: int) -> dict:
+    """ Benchmarks the image path on photos of each size. The result can be saved as JSON and compared between versions. """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, override_settings(IMAGE_STORAGE_ROOT=directory):
+        for size in megapixels:
+            content = generate_photo(size)
+            results[f'{size:g}MP'] = {'fixture_bytes': len(content), 'operations': benchmark_photo(content, iterations)}
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'pillow': PIL.__version__,
+            'cryptography': cryptography.__version__,
+            'machine': platform.machine(),
+            'image_ingest_enabled': settings.IMAGE_INGEST_ENABLED,
+            'image_ingest_max_size': settings.IMAGE_INGEST_MAX_SIZE,
+            'image_ingest_format': settings.IMAGE_INGEST_FORMAT,
+            'thumbnail_size': settings.THUMBNAIL_SIZE,
+        },
+        'results': results,
+    }
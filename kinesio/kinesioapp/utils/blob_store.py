@@ -0,0 +1,100 @@
+from __future__ import annotations
+from django.conf import settings
+from typing import BinaryIO, Optional
+import hashlib
+import os
+import tempfile
+
+
+class BlobNotFoundException(Exception):
+    pass
+
+
+class BlobWriter:
+    """ Writes a blob chunk by chunk to a temporary file. Its hash is only known, and the blob only stored, when it is closed. """
+    def __init__(self, blob_store: BlobStore) -> None:
+        self.blob_store = blob_store
+        self.hash: Optional[str] = None
+        self.size = 0
+        self._hash = hashlib.sha256()
+        os.makedirs(blob_store.root, exist_ok=True)
+        file_descriptor, self._temporary_path = tempfile.mkstemp(dir=blob_store.root, suffix='.tmp')
+        self._file = os.fdopen(file_descriptor, 'wb')
+
+    def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def __enter__(self) -> BlobWriter:
+        return self
+
+    def __exit__(self, exception_type: Optional[type], *args) -> None:
+        self._file.close()
+        if exception_type is not None:
+            os.remove(self._temporary_path)
+            return
+        self.hash = self._hash.hexdigest()
+        path = self.blob_store.path(self.hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self._temporary_path, path)
+
+
+class BlobStore:
+    """ Content-addressed storage of binary blobs on disk.
+        Every blob is saved under its sha256, sharded in two levels of directories to keep them small:
+        <root>/ab/cd/abcd... """
+    def __init__(self, root: Optional[str] = None) -> None:
+        self.root = root or settings.IMAGE_STORAGE_ROOT
+
+    @staticmethod
+    def hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def path(self, blob_hash: str) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def exists(self, blob_hash: str) -> bool:
+        return os.path.isfile(self.path(blob_hash))
+
+    def put(self, content: bytes) -> str:
+        blob_hash = self.hash(content)
+        if not self.exists(blob_hash):
+            self._write_atomically(self.path(blob_hash), content)
+        return blob_hash
+
+    def writer(self) -> BlobWriter:
+        return BlobWriter(self)
+
+    def get(self, blob_hash: str) -> bytes:
+        try:
+            with open(self.path(blob_hash), 'rb') as blob_file:
+                return blob_file.read()
+        except FileNotFoundError:
+            raise BlobNotFoundException(f'There is no blob with hash {blob_hash}.')
+
+    def open(self, blob_hash: str) -> BinaryIO:
+        try:
+            return open(self.path(blob_hash), 'rb')
+        except FileNotFoundError:
+            raise BlobNotFoundException(f'There is no blob with hash {blob_hash}.')
+
+    def delete(self, blob_hash: str) -> None:
+        try:
+            os.remove(self.path(blob_hash))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _write_atomically(path: str, content: bytes) -> None:
+        # Write to a temporary file on the same directory and rename it, so readers never see half written blobs.
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temporary_file:
+                temporary_file.write(content)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
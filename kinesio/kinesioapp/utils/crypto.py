@@ -0,0 +1,167 @@
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+import base64
+import hashlib
+import os
+
+from users.utils.singleton import Singleton
+
+
+# Binary envelope, version 1: MAGIC | VERSION | KEY ID | NONCE | AES-256-GCM CIPHERTEXT | TAG
+MAGIC = b'KIE'
+VERSION = b'\x01'
+KEY_ID_SIZE = 4
+NONCE_SIZE = 12
+TAG_SIZE = 16
+HEADER_SIZE = len(MAGIC) + len(VERSION) + KEY_ID_SIZE + NONCE_SIZE
+
+
+class EnvelopeKey:
+    """ AES-256 key derived from a Fernet key of the settings, so the same keys work for both formats. """
+    def __init__(self, fernet_key: bytes) -> None:
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'kinesio image envelope', backend=default_backend())
+        self.key = hkdf.derive(base64.urlsafe_b64decode(fernet_key))
+        self.id = hashlib.sha256(self.key).digest()[:KEY_ID_SIZE]
+        self.aes_gcm = AESGCM(self.key)
+
+
+class StreamEncryptor:
+    """ Encrypts an envelope chunk by chunk. Concatenate every output of update() and finalize(). """
+    def __init__(self, key: EnvelopeKey) -> None:
+        nonce = os.urandom(NONCE_SIZE)
+        self._header = MAGIC + VERSION + key.id + nonce
+        self._encryptor = Cipher(algorithms.AES(key.key), modes.GCM(nonce), backend=default_backend()).encryptor()
+
+    def update(self, chunk: bytes) -> bytes:
+        header, self._header = self._header, b''
+        return header + self._encryptor.update(chunk)
+
+    def finalize(self) -> bytes:
+        return self._header + self._encryptor.finalize() + self._encryptor.tag
+
+
+class StreamDecryptor:
+    """ Decrypts an envelope read from a file chunk by chunk, so only a chunk of it is in memory at a time.
+        The tag is only checked after the last chunk: InvalidToken is raised then if the envelope was tampered with,
+        so nothing yielded before can be trusted until the iteration finishes. The file is closed once done. """
+    def __init__(self, key: EnvelopeKey, nonce: bytes, file: BinaryIO) -> None:
+        self._key, self._nonce, self._file = key, nonce, file
+        self.size = file.seek(0, os.SEEK_END) - HEADER_SIZE - TAG_SIZE
+
+    def chunks(self, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+        chunk_size = chunk_size or settings.STREAMING_CHUNK_SIZE
+        with self._file as file:
+            file.seek(HEADER_SIZE + self.size)
+            tag = file.read(TAG_SIZE)
+            decryptor = Cipher(algorithms.AES(self._key.key), modes.GCM(self._nonce, tag), backend=default_backend()).decryptor()
+            file.seek(HEADER_SIZE)
+            remaining = self.size
+            while remaining > 0:
+                chunk = file.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield decryptor.update(chunk)
+            try:
+                decryptor.finalize()
+            except InvalidTag:
+                raise InvalidToken('The encrypted image is corrupted or it was encrypted with another key.')
+
+
+class ImageCipher(metaclass=Singleton):
+    """ Encrypts and decrypts images with a keyring.
+        IMAGE_ENCRYPTION_KEY encrypts new data. Keys on IMAGE_ENCRYPTION_OLD_KEYS can only decrypt, so they can be
+        retired after rotating every image with the 'reencrypt_images' command.
+        Images are encrypted as raw bytes on a binary envelope (AES-GCM with a small header). Images encrypted before
+        it existed are Fernet tokens of the image encoded as base64: they can still be decrypted, and rotating them
+        moves them to the envelope.
+        Ciphers are built once and reused, until the keys on the settings change. """
+    def __init__(self) -> None:
+        self._keys: Optional[Tuple[bytes, ...]] = None
+        self._fernet: Optional[MultiFernet] = None
+        self._envelope_keys: Dict[bytes, EnvelopeKey] = {}
+        self._primary_envelope_key: Optional[EnvelopeKey] = None
+
+    @property
+    def keys(self) -> List[bytes]:
+        return [settings.IMAGE_ENCRYPTION_KEY] + list(settings.IMAGE_ENCRYPTION_OLD_KEYS)
+
+    @property
+    def fernet(self) -> MultiFernet:
+        self._build_ciphers_if_keys_changed()
+        return self._fernet
+
+    @property
+    def primary_envelope_key(self) -> EnvelopeKey:
+        self._build_ciphers_if_keys_changed()
+        return self._primary_envelope_key
+
+    @property
+    def primary_key_fingerprint(self) -> str:
+        return hashlib.sha256(settings.IMAGE_ENCRYPTION_KEY).hexdigest()[:16]
+
+    @staticmethod
+    def is_envelope(token: bytes) -> bool:
+        return token[:len(MAGIC) + len(VERSION)] == MAGIC + VERSION
+
+    def encrypt(self, data: bytes) -> bytes:
+        key = self.primary_envelope_key
+        nonce = os.urandom(NONCE_SIZE)
+        return MAGIC + VERSION + key.id + nonce + key.aes_gcm.encrypt(nonce, bytes(data), None)
+
+    def encryptor(self) -> StreamEncryptor:
+        return StreamEncryptor(self.primary_envelope_key)
+
+    def decrypt(self, token: bytes) -> bytes:
+        """ Returns the image as raw bytes, whatever the format of the token is. """
+        token = bytes(token)
+        if not self.is_envelope(token):
+            return base64.b64decode(self.fernet.decrypt(token))
+        self._build_ciphers_if_keys_changed()
+        key_id, nonce = self._split_header(token)
+        if key_id not in self._envelope_keys:
+            raise InvalidToken('The image was encrypted with an unknown key.')
+        try:
+            return self._envelope_keys[key_id].aes_gcm.decrypt(nonce, token[HEADER_SIZE:], None)
+        except InvalidTag:
+            raise InvalidToken('The encrypted image is corrupted or it was encrypted with another key.')
+
+    def decryptor(self, file: BinaryIO) -> Optional[StreamDecryptor]:
+        """ Decryptor of the envelope on the file, or None if it holds a Fernet token, which can only be decrypted at once. """
+        header = file.read(HEADER_SIZE)
+        if not self.is_envelope(header):
+            return None
+        self._build_ciphers_if_keys_changed()
+        key_id, nonce = self._split_header(header)
+        if key_id not in self._envelope_keys:
+            raise InvalidToken('The image was encrypted with an unknown key.')
+        return StreamDecryptor(self._envelope_keys[key_id], nonce, file)
+
+    def rotate(self, token: bytes) -> bytes:
+        """ Re-encrypts the token on the envelope format with the primary key. """
+        return self.encrypt(self.decrypt(token))
+
+    def is_encrypted_with_primary_key(self, token: bytes) -> bool:
+        token = bytes(token)
+        return self.is_envelope(token) and self._split_header(token)[0] == self.primary_envelope_key.id
+
+    @staticmethod
+    def _split_header(token: bytes) -> Tuple[bytes, bytes]:
+        key_id_start = len(MAGIC) + len(VERSION)
+        return token[key_id_start:key_id_start + KEY_ID_SIZE], token[key_id_start + KEY_ID_SIZE:HEADER_SIZE]
+
+    def _build_ciphers_if_keys_changed(self) -> None:
+        keys = tuple(self.keys)
+        if keys != self._keys:
+            self._fernet = MultiFernet([Fernet(key) for key in keys])
+            envelope_keys = [EnvelopeKey(key) for key in keys]
+            self._envelope_keys = {envelope_key.id: envelope_key for envelope_key in envelope_keys}
+            self._primary_envelope_key = envelope_keys[0]
+            self._keys = keys
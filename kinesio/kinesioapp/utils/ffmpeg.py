@@ -0,0 +1,21 @@
+from ffmpy import FFmpeg, FFprobe
+from typing import Optional
+import json
+import subprocess
+
+
+def run_ffmpeg(command: FFmpeg, timeout: int, input_data: Optional[bytes] = None) -> None:
+    """ Runs an ffmpy command, killing ffmpeg if it takes longer than the timeout, in seconds.
+        Raises subprocess.TimeoutExpired or subprocess.CalledProcessError when it does not finish successfully.
+        ffmpeg never reads from the terminal: it would wait forever if it asked to overwrite a file, for instance. """
+    stdin = {'input': input_data} if input_data is not None else {'stdin': subprocess.DEVNULL}
+    # The arguments are passed as they are: splitting the command line again would break quoted filter expressions.
+    subprocess.run(command._cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout, check=True, **stdin)
+
+
+def run_ffprobe(path: str, timeout: int) -> dict:
+    """ Probes the media file, killing ffprobe if it takes longer than the timeout, in seconds.
+        Returns its format and its streams, as ffprobe describes them in JSON. Raises like run_ffmpeg. """
+    command = FFprobe(global_options=['-v', 'error', '-print_format', 'json', '-show_format', '-show_streams'], inputs={path: None})
+    result = subprocess.run(command._cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, check=True)
+    return json.loads(result.stdout)
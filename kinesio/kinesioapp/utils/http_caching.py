@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework.request import HttpRequest
+from typing import Optional
+
+
+def etag(*parts: str) -> str:
+    """ Strong ETag made of the given parts, usually the hash of a blob and the variant of it being served. """
+    return '"{}"'.format('-'.join(str(part) for part in parts))
+
+
+def cache_as_immutable(response: HttpResponse, etag: Optional[str]) -> HttpResponse:
+    """ Responses without an ETag are left as they are: they may still change. """
+    if etag is not None:
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=settings.IMMUTABLE_CACHE_MAX_AGE, immutable=True)
+    return response
+
+
+def conditional_response(request: HttpRequest, etag: Optional[str]) -> Optional[HttpResponse]:
+    """ Returns a 304 response if the client already has the version with the ETag, or None if the response has to be sent.
+        Call it before loading or decrypting anything, that is the whole point of it. """
+    if etag is None:
+        return None
+    response = get_conditional_response(request, etag=etag)
+    return cache_as_immutable(response, etag) if response is not None else None
@@ -0,0 +1,83 @@
+from PIL import Image, ImageOps
+from django.conf import settings
+from io import BytesIO
+from typing import BinaryIO, Optional, Tuple, Union
+import logging
+
+from .. import choices
+from .blob_store import BlobStore
+from .crypto import ImageCipher
+
+
+class ImageNormalizer:
+    """ Normalizes images in memory: applies their EXIF orientation, strips their metadata, caps their longest side and
+        re-encodes them. The color profile is kept, since colors would shift without it.
+        JPEG images are decoded with Pillow's draft mode, so big photos are decoded directly at a reduced scale.
+        Images can be given as bytes or as a file, which is decoded as it is read instead of being loaded in memory first. """
+    def __init__(self, max_size: Optional[int] = None, format_: Optional[str] = None, quality: Optional[int] = None) -> None:
+        self.max_size = max_size or settings.IMAGE_INGEST_MAX_SIZE
+        self.format = format_ or settings.IMAGE_INGEST_FORMAT
+        self.quality = quality or settings.IMAGE_INGEST_QUALITY
+
+    def normalize(self, content: Union[bytes, BinaryIO]) -> bytes:
+        if isinstance(content, bytes):
+            content = BytesIO(content)
+        else:
+            content.seek(0)
+        im = Image.open(content)
+        size = self.max_size, self.max_size
+        # The orientation only swaps width and height, so the draft size is the same either way.
+        im.draft('RGB', size)
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ('RGB', 'L'):
+            im = im.convert('RGB')
+        im.thumbnail(size, Image.LANCZOS)
+        output = BytesIO()
+        # Metadata is only written when passed explicitly, so EXIF (GPS position, device, dates) is left out.
+        options = {'progressive': True, 'optimize': True} if self.format == choices.renditions.JPEG else {'method': 4}
+        if 'icc_profile' in im.info:
+            options['icc_profile'] = im.info['icc_profile']
+        im.save(output, format=self.format, quality=self.quality, **options)
+        return output.getvalue()
+
+
+class ImageIngest:
+    """ Prepares an uploaded image to be stored, normalizing it when IMAGE_INGEST_ENABLED is set.
+        Images that cannot be decoded are stored as they were uploaded: their processing fails afterwards, as before.
+        Uploaded files can be given instead of their bytes: they are decoded and stored reading them in chunks. """
+    def __init__(self, content: Union[bytes, BinaryIO]) -> None:
+        self.original = content
+        self.content, self.format = content, choices.renditions.JPEG
+        if settings.IMAGE_INGEST_ENABLED:
+            normalizer = ImageNormalizer()
+            try:
+                self.content, self.format = normalizer.normalize(content), normalizer.format
+            except (OSError, Image.DecompressionBombError):
+                logging.warning('An image could not be normalized. It is stored as uploaded.', exc_info=True)
+
+    @property
+    def is_normalized(self) -> bool:
+        return self.content is not self.original
+
+    def store(self, blob_store: Optional[BlobStore] = None) -> dict:
+        """ Encrypts and stores the image, and its original if IMAGE_INGEST_KEEP_ORIGINALS is set. Returns the fields of its row. """
+        cipher, blob_store = ImageCipher(), blob_store or BlobStore()
+        content_hash, content_size = self._put(self.content, cipher, blob_store)
+        fields = {'content_hash': content_hash, 'content_size': content_size, 'format': self.format, 'normalized': self.is_normalized}
+        if self.is_normalized and settings.IMAGE_INGEST_KEEP_ORIGINALS:
+            fields['original_hash'], fields['original_size'] = self._put(self.original, cipher, blob_store)
+        return fields
+
+    @staticmethod
+    def _put(content: Union[bytes, BinaryIO], cipher: ImageCipher, blob_store: BlobStore) -> Tuple[str, int]:
+        """ Encrypts and stores the content. Returns the hash and size of its blob. """
+        if isinstance(content, bytes):
+            encrypted_content = cipher.encrypt(content)
+            return blob_store.put(encrypted_content), len(encrypted_content)
+        content.seek(0)
+        encryptor = cipher.encryptor()
+        with blob_store.writer() as blob_writer:
+            for chunk in iter(lambda: content.read(settings.STREAMING_CHUNK_SIZE), b''):
+                blob_writer.write(encryptor.update(chunk))
+            blob_writer.write(encryptor.finalize())
+        return blob_writer.hash, blob_writer.size
@@ -0,0 +1,132 @@
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from django.conf import settings
+from PIL import Image as PILImage
+from django.db import connections, transaction
+from typing import Any, BinaryIO, Callable, Iterable, List, Optional, Union
+import logging
+
+from users.utils.singleton import Singleton
+from .blob_store import BlobStore
+from .crypto import ImageCipher
+from .image_ingest import ImageIngest
+from .thumbnail import ThumbnailGenerator
+
+
+class InvalidImageException(Exception):
+    pass
+
+
+def discard_inherited_connections() -> None:
+    # Forked workers inherit the database sockets of the parent process.
+    # Forget them without closing them, so the parent can keep using them and the worker opens its own.
+    for connection in connections.all():
+        connection.connection = None
+
+
+def process_image(image_id: int) -> None:
+    # We need to use dynamic imports to avoid circular imports.
+    from ..models import Image
+    image = Image.objects.with_content().filter(id=image_id).first()
+    if image is None:
+        logging.info(f'Image {image_id} was deleted before being processed.')
+    else:
+        image.process()
+
+
+def process_timelapse(timelapse_id: int) -> None:
+    # We need to use dynamic imports to avoid circular imports.
+    from ..models import Timelapse
+    timelapse = Timelapse.objects.filter(id=timelapse_id).first()
+    if timelapse is None:
+        logging.info(f'Timelapse {timelapse_id} was deleted before being rendered.')
+    else:
+        timelapse.process()
+
+
+def process_video(video_id: int) -> None:
+    # We need to use dynamic imports to avoid circular imports.
+    from ..models import Video
+    video = Video.objects.filter(id=video_id).first()
+    if video is None:
+        logging.info(f'Video {video_id} was deleted before being processed.')
+    else:
+        video.process()
+
+
+def store_image(content: Union[bytes, str]) -> dict:
+    """ Runs on a worker process. Normalizes, encrypts and stores an image and its thumbnail, and returns the fields of its row.
+        Open files cannot be sent to workers, so big uploads are given as the path of the file Django spooled them to. """
+    if isinstance(content, str):
+        with open(content, 'rb') as image_file:
+            return _store_image(image_file)
+    return _store_image(content)
+
+
+def _store_image(content: Union[bytes, BinaryIO]) -> dict:
+    cipher, blob_store = ImageCipher(), BlobStore()
+    ingest = ImageIngest(content)
+    # The thumbnail is generated before storing anything, so invalid images leave no blobs behind.
+    try:
+        thumbnail = ThumbnailGenerator.from_raw(ingest.content).thumbnail_raw
+    except (OSError, PILImage.DecompressionBombError, ValueError) as error:
+        # What Pillow raises for files it cannot decode, and for images with too many pixels.
+        raise InvalidImageException('The image cannot be decoded.') from error
+    encrypted_thumbnail = cipher.encrypt(thumbnail)
+    return dict(ingest.store(blob_store), thumbnail_hash=blob_store.put(encrypted_thumbnail), thumbnail_size=len(encrypted_thumbnail))
+
+
+class ImageProcessingPool(metaclass=Singleton):
+    """ Generates thumbnails, renditions, timelapses and video assets on pools of processes, outside the request that needed them.
+        When IMAGE_PROCESSING_SYNCHRONOUS is set (while testing, for instance) they are processed immediately instead. """
+    def __init__(self) -> None:
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._video_executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                                                 initializer=discard_inherited_connections)
+        return self._executor
+
+    @property
+    def video_executor(self) -> ProcessPoolExecutor:
+        # Videos take minutes to transcode, so they get their own workers and never hold up images and timelapses.
+        if self._video_executor is None:
+            self._video_executor = ProcessPoolExecutor(max_workers=settings.VIDEO_PROCESSING_WORKERS,
+                                                       initializer=discard_inherited_connections)
+        return self._video_executor
+
+    def submit(self, image) -> None:
+        self._submit(image, process_image, lambda: self.executor)
+
+    def submit_timelapse(self, timelapse) -> None:
+        self._submit(timelapse, process_timelapse, lambda: self.executor)
+
+    def submit_video(self, video) -> None:
+        self._submit(video, process_video, lambda: self.video_executor)
+
+    @staticmethod
+    def _submit(instance, process: Callable[[int], None], executor: Callable[[], ProcessPoolExecutor]) -> None:
+        if settings.IMAGE_PROCESSING_SYNCHRONOUS:
+            instance.process()
+        else:
+            # The worker reads the instance from the database, so wait until it is committed.
+            transaction.on_commit(lambda: executor().submit(process, instance.id))
+
+    def map(self, function: Callable, items: Iterable[Any]) -> List[Future]:
+        """ Runs the function on every item in parallel, and waits until all of them finish or fail. """
+        if settings.IMAGE_PROCESSING_SYNCHRONOUS:
+            return [self._run(function, item) for item in items]
+        futures = [self.executor.submit(function, item) for item in items]
+        wait(futures)
+        return futures
+
+    @staticmethod
+    def _run(function: Callable, item: Any) -> Future:
+        future = Future()
+        try:
+            future.set_result(function(item))
+        except Exception as exception:
+            future.set_exception(exception)
+        return future
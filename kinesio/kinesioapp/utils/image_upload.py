@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from typing import Iterator, Optional
+import hashlib
+
+
+class ImageTooLargeException(Exception):
+    pass
+
+
+class ImageUpload:
+    """ Reads an uploaded image file in chunks, hashing it on the way.
+        Django spools big uploads to a temporary file, so the image is never fully loaded in memory. """
+    def __init__(self, uploaded_file: UploadedFile, max_size: Optional[int] = None) -> None:
+        self.uploaded_file = uploaded_file
+        self.max_size = max_size or settings.IMAGE_UPLOAD_MAX_SIZE
+        self._hash = hashlib.sha256()
+
+    @property
+    def hash(self) -> str:
+        return self._hash.hexdigest()
+
+    def chunks(self) -> Iterator[bytes]:
+        self._check_size(self.uploaded_file.size)
+        size = 0
+        for chunk in self.uploaded_file.chunks(settings.STREAMING_CHUNK_SIZE):
+            # The declared size may be wrong, so check the real one while reading.
+            size += len(chunk)
+            self._check_size(size)
+            self._hash.update(chunk)
+            yield chunk
+
+    def _check_size(self, size: Optional[int]) -> None:
+        if size is not None and size > self.max_size:
+            raise ImageTooLargeException(f'The image exceeds the maximum size of {self.max_size} bytes.')
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from rest_framework.request import HttpRequest
+from typing import Optional, Tuple
+from urllib.parse import quote
+import mimetypes
+import os
+import re
+
+from .streaming import iterate_file
+
+
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+PYTHON = 'python'
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Types of the files of HLS and video previews, which the mimetypes module does not know on most systems
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.vtt': 'text/vtt',
+}
+
+
+class RangeNotSatisfiableException(Exception):
+    pass
+
+
+def content_type_of(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """ First and last byte of the range requested by the Range header, or None to send the whole file.
+        Only single byte ranges are handled: the whole file is sent for anything else, as the RFC allows. """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last bytes of the file
+        if int(last) == 0:
+            raise RangeNotSatisfiableException(f'Empty suffix range for a file of {size} bytes.')
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), size - 1 if last == '' else min(int(last), size - 1)
+        if last != '' and int(last) < start:
+            return None
+    if start >= size:
+        raise RangeNotSatisfiableException(f'Range starting at byte {start} for a file of {size} bytes.')
+    return start, end
+
+
+def send_file(request: HttpRequest, path: str) -> HttpResponse:
+    """ Streams the file from Django, honoring single byte ranges so players can seek. Meant for development only. """
+    size = os.path.getsize(path)
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiableException:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(iterate_file(open(path, 'rb'), start, end - start + 1),
+                                     status=206 if byte_range else 200, content_type=content_type_of(path))
+    response['Content-Length'] = end - start + 1
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def serve_media(request: HttpRequest, path: str) -> HttpResponse:
+    """ Sends the media file at the path, on disk, as configured by MEDIA_GATEWAY_BACKEND.
+        It does not check anything: check the permissions of the user, and that the file exists, before calling it. """
+    backend = settings.MEDIA_GATEWAY_BACKEND
+    if backend == X_ACCEL_REDIRECT:
+        # nginx sends the file from its internal location, ranges included, and the worker is free right away.
+        response = HttpResponse(content_type=content_type_of(path))
+        response['X-Accel-Redirect'] = settings.MEDIA_GATEWAY_INTERNAL_URL + quote(os.path.relpath(path, settings.MEDIA_ROOT))
+    elif backend == X_SENDFILE:
+        response = HttpResponse(content_type=content_type_of(path))
+        response['X-Sendfile'] = path
+    elif backend == PYTHON:
+        response = send_file(request, path)
+    else:
+        raise ValueError(f'Invalid media gateway backend {backend}.')
+    response['Accept-Ranges'] = 'bytes'
+    # Only the user allowed to see it may keep it: shared caches must not.
+    patch_cache_control(response, private=True)
+    return response
@@ -0,0 +1,83 @@
+from __future__ import annotations
+from django.conf import settings
+from django.db import models
+from django.utils.dateparse import parse_datetime
+from drf_yasg import openapi
+from rest_framework.request import HttpRequest
+from typing import List, Optional, Tuple
+import base64
+import binascii
+import datetime
+
+
+cursor_parameter = openapi.Parameter(
+    name='cursor', in_=openapi.IN_QUERY,
+    type=openapi.TYPE_STRING,
+    description="Cursor of the page. Use the 'next' cursor of the previous page, or omit it to get the first one.",
+)
+page_size_parameter = openapi.Parameter(
+    name='page_size', in_=openapi.IN_QUERY,
+    type=openapi.TYPE_INTEGER,
+    description=f"Amount of items of the page (Default: {settings.IMAGE_PAGE_SIZE}, maximum: {settings.IMAGE_MAX_PAGE_SIZE}).",
+)
+
+
+class InvalidPageException(Exception):
+    pass
+
+
+class KeysetPaginator:
+    """ Paginates a queryset ordered by a date field and the id, without offsets: each page starts right after
+        the last item of the previous one, so getting the last pages is as fast as getting the first ones and
+        items created meanwhile never repeat an item already listed. Items created meanwhile before the cursor,
+        such as an image added to a session dated earlier, are skipped until the listing starts over.
+        The cursor is the date and id of the last item of the page, encoded in urlsafe base64. """
+    def __init__(self, date_field: str, cursor: Optional[str] = None, page_size: Optional[str] = None) -> None:
+        self.date_field = date_field
+        self.after = self.decode(cursor) if cursor else None
+        self.page_size = self._parse_page_size(page_size)
+        self.next_cursor: Optional[str] = None
+
+    @classmethod
+    def from_request(cls, request: HttpRequest, date_field: str) -> KeysetPaginator:
+        return cls(date_field, request.query_params.get('cursor'), request.query_params.get('page_size'))
+
+    @staticmethod
+    def encode(date: datetime.datetime, id: int) -> str:
+        return base64.urlsafe_b64encode(f'{date.isoformat()}|{id}'.encode('utf-8')).decode('utf-8')
+
+    @staticmethod
+    def decode(cursor: str) -> Tuple[datetime.datetime, int]:
+        try:
+            date, id = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8').split('|')
+            date = parse_datetime(date)
+            if date is None:
+                raise ValueError(f'Invalid date on cursor {cursor}.')
+            return date, int(id)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise InvalidPageException(f'Invalid cursor {cursor}.')
+
+    @staticmethod
+    def _parse_page_size(page_size: Optional[str]) -> int:
+        if page_size is None:
+            return settings.IMAGE_PAGE_SIZE
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise InvalidPageException(f'Invalid page size {page_size}.')
+        if not 0 < page_size <= settings.IMAGE_MAX_PAGE_SIZE:
+            raise InvalidPageException(f'Invalid page size {page_size}.')
+        return page_size
+
+    def paginate(self, queryset: models.QuerySet) -> List[models.Model]:
+        queryset = queryset.annotate(keyset_date=models.F(self.date_field)).order_by(self.date_field, 'id')
+        if self.after is not None:
+            date, id = self.after
+            queryset = queryset.filter(models.Q(**{f'{self.date_field}__gt': date}) |
+                                       models.Q(**{self.date_field: date, 'id__gt': id}))
+        # One more item is fetched only to know whether there is a next page.
+        items = list(queryset[:self.page_size + 1])
+        if len(items) > self.page_size:
+            items = items[:self.page_size]
+            self.next_cursor = self.encode(items[-1].keyset_date, items[-1].id)
+        return items
@@ -0,0 +1,23 @@
+from django.conf import settings
+from typing import BinaryIO, Iterator, Optional
+
+
+def iterate_in_chunks(content: bytes, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """ Yields the content in chunks without copying it more than once per chunk. """
+    chunk_size = chunk_size or settings.STREAMING_CHUNK_SIZE
+    content = memoryview(content)
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size].tobytes()
+
+
+def iterate_file(file: BinaryIO, start: int, length: int, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """ Yields length bytes of the file from start, in chunks, and closes it once done. """
+    chunk_size = chunk_size or settings.STREAMING_CHUNK_SIZE
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
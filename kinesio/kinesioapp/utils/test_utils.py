@@ -1,4 +1,9 @@
 from rest_framework.test import APITestCase as DRFAPITestCase
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Set, Type
+import re
 
 from users.models import User
 
@@ -7,3 +12,24 @@ class APITestCase(DRFAPITestCase):
     def _log_in(self, user: User, password: str) -> None:
         logged_in = self.client.login(username=user.username, password=password)
         self.assertTrue(logged_in)
+
+    @contextmanager
+    def assertSelectsColumns(self, model: Type[models.Model], selected: Iterable[str] = (), not_selected: Iterable[str] = ()) -> Iterator[None]:
+        """ Asserts which columns of the table of the model are read by the queries run inside the block. """
+        with CaptureQueriesContext(connection) as context:
+            yield
+        selected_columns = self._selected_columns(model._meta.db_table, [query['sql'] for query in context.captured_queries])
+        for column in selected:
+            self.assertIn(column, selected_columns, f'Column {column} was not selected.')
+        for column in not_selected:
+            self.assertNotIn(column, selected_columns, f'Column {column} should not have been selected.')
+
+    @staticmethod
+    def _selected_columns(table: str, queries: Iterable[str]) -> Set[str]:
+        column_pattern = re.compile(rf'"{table}"\."(\w+)"')
+        columns = set()
+        for query in queries:
+            if query.startswith('SELECT'):
+                # Only the select clause matters: columns used on WHERE or ORDER BY are not loaded.
+                columns.update(column_pattern.findall(query.split(' FROM ')[0]))
+        return columns
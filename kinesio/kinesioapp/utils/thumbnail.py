@@ -1,43 +1,44 @@
+from __future__ import annotations
 from PIL import Image
-from datetime import datetime
-import random
-import hashlib
+from django.conf import settings
 from io import BytesIO
-import os
+from typing import BinaryIO, Optional, Union
 import base64
 
 
 class ThumbnailGenerator:
-    def __init__(self, image_content_as_base64: bytes):
-        self._path_base = f'/tmpfs/{self._datetime}_{self._random_int}'
-        self._image_content = base64.b64decode(image_content_as_base64)
+    """ Generates thumbnails in memory. JPEG is used unless another format is given.
+        JPEG images are decoded with Pillow's draft mode, so they are decoded directly at a reduced scale.
+        Images can be given as a file too, which is decoded as it is read. """
+    def __init__(self, image_content_as_base64: Optional[bytes] = None, size: Optional[int] = None,
+                 quality: Optional[int] = None, image_content: Optional[Union[bytes, BinaryIO]] = None, format_: str = 'JPEG') -> None:
+        self._image_content = image_content if image_content is not None else base64.b64decode(image_content_as_base64)
+        self.size = size or settings.THUMBNAIL_SIZE
+        self.quality = quality or settings.THUMBNAIL_QUALITY
+        self.format = format_
 
-    @property
-    def _datetime(self) -> str:
-        return str(datetime.now()).replace(' ', '_').replace(':', '_')
-
-    @property
-    def _random_int(self) -> int:
-        return random.randint(0, 9999999)
-
-    @property
-    def _image_hash(self) -> str:
-        return hashlib.md5(self._image_content).hexdigest()
+    @classmethod
+    def from_raw(cls, image_content: Union[bytes, BinaryIO], **kwargs) -> ThumbnailGenerator:
+        return cls(image_content=image_content, **kwargs)
 
     @property
-    def _thumbail_path(self) -> str:
-        return f'{self._path_base}_{self._image_hash}_thumbnail.jpg'
+    def thumbnail_raw(self) -> bytes:
+        content = self._image_content
+        if isinstance(content, bytes):
+            content = BytesIO(content)
+        else:
+            content.seek(0)
+        im = Image.open(content)
+        size = self.size, self.size
+        # Only JPEG images support draft mode. It lets the decoder skip most of the work for big images.
+        im.draft('RGB', size)
+        if im.mode not in ('RGB', 'L'):
+            im = im.convert('RGB')
+        im.thumbnail(size)
+        output = BytesIO()
+        im.save(output, format=self.format, quality=self.quality)
+        return output.getvalue()
 
     @property
     def thumbnail(self) -> bytes:
-        try:
-            im = Image.open(BytesIO(self._image_content))
-            size = 320, 320
-            im.thumbnail(size)
-            im.save(self._thumbail_path)
-            with open(self._thumbail_path, 'rb') as thumbnail_file:
-                thumbnail_content = thumbnail_file.read()
-            return base64.b64encode(thumbnail_content)
-        finally:
-            # To assure that the file will be deleted regardless any exception
-            os.remove(self._thumbail_path)
+        return base64.b64encode(self.thumbnail_raw)
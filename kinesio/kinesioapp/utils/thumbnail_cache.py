@@ -0,0 +1,57 @@
+from django.conf import settings
+from cachetools import LRUCache
+from typing import Callable, Hashable, Optional
+import threading
+
+from users.utils.singleton import Singleton
+from users.utils.singleton.synchronized_decorator import synchronized
+
+
+lock = threading.Lock()
+
+
+class ThumbnailCache(metaclass=Singleton):
+    """ Decrypted thumbnails, least recently used first out when they exceed THUMBNAIL_CACHE_SIZE bytes.
+        Every process keeps its own cache, so hits and misses are counted per process. """
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._cache = LRUCache(maxsize=settings.THUMBNAIL_CACHE_SIZE, getsizeof=len)
+
+    @property
+    def size(self) -> int:
+        return self._cache.currsize
+
+    def get(self, key: Hashable, load: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """ Returns the cached thumbnail, or loads and caches it. Missing thumbnails (None) are not cached. """
+        thumbnail = self._get(key)
+        if thumbnail is None:
+            # Load outside the lock, so other threads are not blocked while decrypting.
+            thumbnail = load()
+            if thumbnail is not None:
+                self._set(key, thumbnail)
+        return thumbnail
+
+    @synchronized(lock)
+    def _get(self, key: Hashable) -> Optional[bytes]:
+        thumbnail = self._cache.get(key)
+        if thumbnail is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return thumbnail
+
+    @synchronized(lock)
+    def _set(self, key: Hashable, thumbnail: bytes) -> None:
+        if len(thumbnail) <= self._cache.maxsize:
+            self._cache[key] = thumbnail
+
+    @synchronized(lock)
+    def invalidate(self, key: Hashable) -> None:
+        self._cache.pop(key, None)
+
+    @synchronized(lock)
+    def clear(self) -> None:
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
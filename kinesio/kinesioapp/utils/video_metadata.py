@@ -0,0 +1,57 @@
+from django.conf import settings
+from typing import Callable, Optional
+import hashlib
+import logging
+import subprocess
+
+from .ffmpeg import run_ffprobe
+
+
+# Fields of Video filled with the metadata of its file
+METADATA_FIELDS = ('duration', 'width', 'height', 'codec', 'bitrate', 'content_hash')
+
+
+def file_hash(path: str) -> str:
+    """ sha256 of the file, read in chunks: videos are too large to be loaded in memory. """
+    content_hash = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(settings.STREAMING_CHUNK_SIZE), b''):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def _number(value: Optional[str], type_: Callable[[str], float]) -> Optional[float]:
+    # ffprobe prints numbers as strings, and 'N/A' for the values it does not know.
+    try:
+        return type_(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _rotation(stream: dict) -> int:
+    rotation = stream.get('tags', {}).get('rotate')
+    for side_data in stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)
+    return int(_number(rotation, float) or 0)
+
+
+def read_metadata(path: str, timeout: Optional[int] = None) -> dict:
+    """ Metadata of the video file, by METADATA_FIELDS: its duration, in seconds, the size and codec of its first video stream,
+        its bitrate, in bits per second, and its sha256. The hash is always there, but the values coming from ffprobe
+        are None when it cannot probe the file: they are informative, so that does not make the file invalid. """
+    metadata = dict.fromkeys(METADATA_FIELDS)
+    metadata['content_hash'] = file_hash(path)
+    try:
+        probe = run_ffprobe(path, timeout or settings.VIDEO_PROCESSING_TIMEOUT)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        logging.exception(f'Failed to probe {path}.')
+        return metadata
+    video_stream = next((stream for stream in probe.get('streams', []) if stream.get('codec_type') == 'video'), {})
+    format_ = probe.get('format', {})
+    width, height = video_stream.get('width'), video_stream.get('height')
+    if _rotation(video_stream) % 180 != 0:
+        # Phones save portrait videos as landscape ones to be rotated when played, and ffmpeg rotates them too.
+        width, height = height, width
+    metadata.update(duration=_number(format_.get('duration'), float), width=width, height=height,
+                    codec=video_stream.get('codec_name'), bitrate=_number(format_.get('bit_rate'), int))
+    return metadata
@@ -1,5 +1,6 @@
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
+from django.core.exceptions import PermissionDenied
 from django.utils.decorators import method_decorator
 from django.views import generic
 from django.http.request import HttpRequest
@@ -7,7 +8,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import HttpResponse
 
 from users.models import Patient
-from .models import ClinicalSession, Image, Video, Exercise
+from .models import ClinicalSession, Timelapse, Video, Exercise
 
 
 class IndexView(generic.View):
@@ -37,16 +38,23 @@ class ClinicalSessionView(LoginRequiredMixin, generic.View):
     def get(self, request: HttpRequest) -> HttpResponse:
         clinical_session_id = request.GET.get("clinical_session_id", None)
         clinical_session = ClinicalSession.objects.get(pk=clinical_session_id)
-        return render(request, 'kinesioapp/users/clinical_session.html', {'clinical_session': clinical_session})
+        # Only the rows are loaded: the page references the thumbnails and images by their URLs, and the browser fetches them.
+        images = list(clinical_session.images.all())
+        return render(request, 'kinesioapp/users/clinical_session.html', {'clinical_session': clinical_session, 'images': images})
 
 
 class TimelapseView(LoginRequiredMixin, generic.View):
     def get(self, request: HttpRequest) -> HttpResponse:
         tag = request.GET.get("tag", None)
         patient_id = request.GET.get("patient_id", None)
-        images = Image.objects.filter(clinical_session__patient_id=patient_id, tag=tag)
+        patient = get_object_or_404(Patient, pk=patient_id)
+        # Checked before rendering anything, as rendering the timelapse reads every image of the patient with the tag.
+        if not patient.can_view(request.user):
+            raise PermissionDenied
+        # The timelapse is rendered in the background, instead of sending every image to the browser.
+        timelapse = Timelapse.objects.get_or_render(patient, tag) if tag and Timelapse.images_of(patient, tag).exists() else None
 
-        return render(request, 'kinesioapp/users/timelapse.html', {'images': images})
+        return render(request, 'kinesioapp/users/timelapse.html', {'timelapse': timelapse})
 
 
 class PublicVideosView(LoginRequiredMixin, generic.View):
@@ -6,7 +6,9 @@ $(document).ready(function(){
         rows: 2,
         prevArrow: $(".prev"),
         nextArrow: $(".next"),
-        margin: '5 px'
+        margin: '5 px',
+        // Thumbnails are fetched when their slide is shown. Full images, only when they are opened.
+        lazyLoad: 'ondemand'
     });
 });
 
@@ -183,7 +183,6 @@ function open_timelapse(tag, patient_id){
 
             let fancyGallery = $("#timelapse").find("a");
             fancyGallery.attr("rel","gallery").fancybox({
-                type: "image",
                 loop: true,
                 buttons: [
                     "zoom",
@@ -25,3 +25,6 @@ class Patient(models.Model):
 
     def allowed_user_to_see_its_information(self, user: User) -> bool:
         return user in self.shared_history_with.all()
+
+    def can_view(self, user: User) -> bool:
+        return self.user in user.related_patients or self.allowed_user_to_see_its_information(user)